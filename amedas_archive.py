@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import os.path
+import struct
+import zlib
+import json
+import math
+import datetime as dt
+from array import array
+import amedas_config as a_cfg
+
+## Snapshot file layout:
+##   magic (8 bytes) | header length (uint32, little endian) | header (JSON) | compressed columns
+## The header has the time of the snapshot, the number of areas and, for each column, [offset, length, crc32 of the data]
+## (offsets relative to the end of the header). Columns:
+##   'codes'          area codes of the snapshot, '\n' separated (the area index, same order for all the other columns)
+##   '<var>'          float32 value of each area (NaN if the area has no value)
+##   '<var>:flag'     uint8 quality flag of each area (255 if the area does not have the variable)
+## Each column is compressed on its own, so reading a variable only decompresses that variable (and the index)
+snapshot_magic = b'AMSNAP1\n'
+snapshot_flag_missing = 255
+snapshot_compress_level = 6
+## area index of the last snapshots read {crc32: {area_code: position}}, it rarely changes between snapshots
+snapshot_index_cache = {}
+
+
+# Form the path of the snapshot of a given datetime
+def buildSnapshotPath( snapshot_datetime ):
+    snapshot_dir = a_cfg.archive_path.replace(a_cfg.replace_target_year, snapshot_datetime.strftime('%Y')).replace(a_cfg.replace_target_month, snapshot_datetime.strftime('%m'))
+    return os.path.join(snapshot_dir, a_cfg.archive_fname.replace('YYYYMMDDHHMM', snapshot_datetime.strftime('%Y%m%d%H%M')))
+
+
+# Write a full map response as a columnar snapshot (temp file + rename), returns the path of the snapshot
+def writeSnapshot( weather_data, snapshot_datetime ):
+    area_codes = sorted(area_code for area_code in weather_data if type(weather_data[area_code]) is dict)
+    val_names = sorted(set(val_name for area_code in area_codes for val_name in weather_data[area_code]))
+    columns = {'codes':'\n'.join(area_codes).encode("utf-8")}
+    for val_name in val_names:
+        values = array('f', [math.nan]) * len(area_codes)
+        flags = array('B', [snapshot_flag_missing]) * len(area_codes)
+        for pos, area_code in enumerate(area_codes):
+            val_pair = weather_data[area_code].get(val_name)
+            if( val_pair is None ): continue
+            try:
+                value, flag = val_pair[0], val_pair[1]
+                values[pos] = math.nan if value is None else float(value)
+                flags[pos] = 0 if flag is None else min(int(flag), snapshot_flag_missing - 1)
+            except (TypeError, IndexError, ValueError):
+                continue
+        columns[val_name] = values.tobytes()
+        columns[val_name + ':flag'] = flags.tobytes()
+    header = {'time':snapshot_datetime.strftime('%Y-%m-%d %H:%M'), 'areas':len(area_codes), 'columns':{}}
+    blobs = []
+    offset = 0
+    for col_name, col_data in columns.items():
+        blob = zlib.compress(col_data, snapshot_compress_level)
+        header['columns'][col_name] = [offset, len(blob), zlib.crc32(col_data)]
+        blobs.append(blob)
+        offset += len(blob)
+    header_bytes = json.dumps(header, separators=(',', ':')).encode("utf-8")
+    snapshot_path = buildSnapshotPath( snapshot_datetime )
+    os.makedirs( os.path.dirname(snapshot_path), exist_ok = True )
+    with open(snapshot_path + '.tmp', 'wb') as snapshot_file:
+        snapshot_file.write(snapshot_magic + struct.pack('<I', len(header_bytes)) + header_bytes)
+        for blob in blobs: snapshot_file.write(blob)
+    os.replace(snapshot_path + '.tmp', snapshot_path)
+    return snapshot_path
+
+
+# Read the header of a snapshot, returns (header, offset of the first column)
+def readSnapshotHeader( snapshot_file ):
+    if( snapshot_file.read(len(snapshot_magic)) != snapshot_magic ): raise ValueError(f"{snapshot_file.name} is not a snapshot file")
+    header_len = struct.unpack('<I', snapshot_file.read(4))[0]
+    header = json.loads(snapshot_file.read(header_len).decode("utf-8"))
+    return header, len(snapshot_magic) + 4 + header_len
+
+
+# Read and decompress one column of a snapshot (None if the snapshot does not have it)
+# raises ValueError if the column is damaged (it does not decompress or its crc32 is not the one of the header)
+def readSnapshotColumn( snapshot_file, header, data_start, col_name ):
+    if( col_name not in header['columns'] ): return None
+    offset, length, crc = header['columns'][col_name]
+    snapshot_file.seek(data_start + offset)
+    try:
+        col_data = zlib.decompress(snapshot_file.read(length))
+    except zlib.error as e:
+        raise ValueError(f"column {col_name} of {snapshot_file.name} cannot be decompressed: {e}")
+    if( zlib.crc32(col_data) != crc ): raise ValueError(f"column {col_name} of {snapshot_file.name} does not match its crc32")
+    return col_data
+
+
+# Get the area index {area_code: position} of a snapshot (cached, so it is decompressed only when it changes)
+def readSnapshotIndex( snapshot_file, header, data_start ):
+    index_crc = header['columns']['codes'][2]
+    if( index_crc not in snapshot_index_cache ):
+        if( len(snapshot_index_cache) > 16 ): snapshot_index_cache.clear()
+        area_codes = readSnapshotColumn( snapshot_file, header, data_start, 'codes' ).decode("utf-8").split('\n')
+        snapshot_index_cache[index_crc] = {area_code:pos for pos, area_code in enumerate(area_codes)}
+    return snapshot_index_cache[index_crc]
+
+
+# Read some variables of a snapshot for all the areas, returns (area index, {val_name: (values, flags)})
+def readSnapshot( snapshot_path, val_names ):
+    with open(snapshot_path, 'rb') as snapshot_file:
+        header, data_start = readSnapshotHeader( snapshot_file )
+        area_index = readSnapshotIndex( snapshot_file, header, data_start )
+        snapshot_cols = {}
+        for val_name in val_names:
+            values = readSnapshotColumn( snapshot_file, header, data_start, val_name )
+            if( values is None ): continue
+            snapshot_cols[val_name] = (array('f', values), array('B', readSnapshotColumn(snapshot_file, header, data_start, val_name + ':flag')))
+    return area_index, snapshot_cols
+
+
+# Get the history of some variables of any area from the snapshots between 2 datetimes
+# returns (time keys, {val_name: (values, flags)}) with one entry per snapshot (NaN/255 if the area or variable is not there)
+def extractAreaHistory( area_code, val_names, start_datetime, end_datetime ):
+    time_keys = []
+    history = {val_name:(array('f'), array('B')) for val_name in val_names}
+    slot = start_datetime.replace(minute = start_datetime.minute - start_datetime.minute % 10, second = 0, microsecond = 0)
+    while( slot <= end_datetime ):
+        snapshot_path = buildSnapshotPath( slot )
+        if( os.path.exists(snapshot_path) ):
+            area_index, snapshot_cols = readSnapshot( snapshot_path, val_names )
+            pos = area_index.get(str(area_code))
+            time_keys.append(slot.strftime('%Y-%m-%d %H:%M'))
+            for val_name in val_names:
+                if( pos is not None and val_name in snapshot_cols ):
+                    history[val_name][0].append(snapshot_cols[val_name][0][pos])
+                    history[val_name][1].append(snapshot_cols[val_name][1][pos])
+                else:
+                    history[val_name][0].append(math.nan)
+                    history[val_name][1].append(snapshot_flag_missing)
+        slot += dt.timedelta(minutes = 10)
+    return time_keys, history
+
+#----EOF--------------------------------------------------------
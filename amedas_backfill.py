@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import os.path
+import datetime as dt
+import json
+import amedas_config as a_cfg
+import amedas_funcs as a_fnc
+import amedas_fetch as a_fetch
+import amedas_metrics as a_met
+import amedas_gaps as a_gap
+
+
+# List every 10min slot between 2 datetimes (both included), limited to the period that AMEDAS still keeps
+def listBackfillSlots( start_datetime, end_datetime ):
+    oldest_slot = dt.datetime.now() - dt.timedelta(days = a_cfg.amedas_retention_days)
+    if( start_datetime < oldest_slot ):
+        print(f"Warning: data before {oldest_slot.strftime('%Y-%m-%d %H:%M')} is not available anymore, backfill will start there")
+        start_datetime = oldest_slot
+    # round down to the 10min interval
+    slot = start_datetime.replace(minute = start_datetime.minute - start_datetime.minute % 10, second = 0, microsecond = 0)
+    slots = []
+    while( slot <= end_datetime ):
+        slots.append(slot)
+        slot += dt.timedelta(minutes = 10)
+    return slots
+
+
+# Get the time keys already stored for an area in the month of the given datetime
+def getStoredTimeKeys( area_code, month_datetime ):
+    logfile = a_fnc.buildPathFromDate( target_datetime = month_datetime, target = "l", area_code = area_code )
+    stored_keys = set()
+    for date_vals in a_fnc.loadWeatherLog(logfile).values():
+        stored_keys.update(date_vals.keys())
+    return stored_keys
+
+
+# Keep only the slots that are missing for at least one of the areas (from the gap index if enabled, or the logs)
+def filterMissingSlots( slots, area_codes ):
+    if( a_cfg.gap_index_enabled ): return a_gap.getMissingSlots( slots, area_codes )
+    stored_keys = {}
+    missing_slots = []
+    for slot in slots:
+        slot_key = slot.strftime('%Y-%m-%d %H:%M')
+        for area_code in area_codes:
+            month_key = (area_code, slot.strftime('%Y%m'))
+            if( month_key not in stored_keys ): stored_keys[month_key] = getStoredTimeKeys(area_code, slot)
+            if( slot_key not in stored_keys[month_key] ):
+                missing_slots.append(slot)
+                break
+    return missing_slots
+
+
+# Read the checkpoint of a previous run over the same range (or an empty one)
+def loadBackfillCheckpoint( range_key, checkpoint_path = None ):
+    if( checkpoint_path is None ): checkpoint_path = a_cfg.backfill_checkpoint
+    if( os.path.exists(checkpoint_path) ):
+        try:
+            with open(checkpoint_path, 'r') as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+            if( checkpoint.get('range') == range_key ): return set(checkpoint.get('done', []))
+            print(f"Checkpoint at {checkpoint_path} is for another range ({checkpoint.get('range')}), starting from scratch")
+        except ValueError as e:
+            print(f"Error: {e} -> checkpoint {checkpoint_path} is not valid, starting from scratch")
+    return set()
+
+
+# Write the checkpoint (temp file + rename so an interrupted write does not lose the progress)
+def saveBackfillCheckpoint( range_key, done_keys, checkpoint_path = None ):
+    if( checkpoint_path is None ): checkpoint_path = a_cfg.backfill_checkpoint
+    os.makedirs( os.path.dirname(checkpoint_path), exist_ok = True )
+    temp_path = checkpoint_path + '.tmp'
+    with open(temp_path, 'w') as checkpoint_file:
+        json.dump({'range':range_key, 'done':sorted(done_keys)}, checkpoint_file)
+    os.replace(temp_path, checkpoint_path)
+
+
+# Fetch some slots (concurrently, from the point files or the map) and store them, returns (slots stored, slots that could not be fetched or stored)
+def fetchAndStoreSlots( slots, area_codes, pool, rate_limiter = None, max_inflight = None, debugprint = False ):
+    if( max_inflight is None ): max_inflight = a_cfg.fetch_max_inflight
+    stored_slots, failed_slots = [], []
+    weather_batch = a_fetch.fetchSlotsBatch( slots, area_codes, max_inflight, pool, rate_limiter )
+    for slot, weather_data in weather_batch.items():
+        if( weather_data ):
+            commit_info = a_fnc.addWeatherValueEntries( weather_data, area_codes, slot, debugprint )
+            if( not commit_info['failed'] and not commit_info['unknown'] ):
+                stored_slots.append(slot)
+                continue
+        failed_slots.append(slot)
+    return stored_slots, failed_slots
+
+
+# Fetch and store every 10min slot of a range that is not in the logs yet, with bounded concurrency and rate limiting
+# An interrupted run can be resumed by running it again with the same range
+def backfillWeatherInfo( start_datetime, end_datetime, area_code = 0, debugprint = False, max_inflight = None, max_rate = None, checkpoint_path = None ):
+    # the defaults come from the config when called, so a config changed at run time (see amedas_bench) is used
+    if( max_inflight is None ): max_inflight = a_cfg.fetch_max_inflight
+    if( max_rate is None ): max_rate = a_cfg.backfill_rate_limit
+    if( checkpoint_path is None ): checkpoint_path = a_cfg.backfill_checkpoint
+    area_codes = [area_code] if area_code else [areacd for areacd in a_cfg.area_info if areacd != 'common']
+    range_key = [start_datetime.strftime('%Y-%m-%d %H:%M'), end_datetime.strftime('%Y-%m-%d %H:%M'), sorted(area_codes)]
+    done_keys = loadBackfillCheckpoint( range_key, checkpoint_path )
+    slots = [slot for slot in listBackfillSlots(start_datetime, end_datetime) if slot.strftime('%Y-%m-%d %H:%M') not in done_keys]
+    missing_slots = filterMissingSlots( slots, area_codes )
+    summary = {'slots':len(slots) + len(done_keys), 'resumed':len(done_keys), 'present':len(slots) - len(missing_slots), 'fetched':0, 'failed':0}
+    print(f"Backfill from {range_key[0]} to {range_key[1]}: {len(missing_slots)} slots to fetch ({summary['present']} already stored, {summary['resumed']} done in a previous run)")
+    rate_limiter = a_fetch.RateLimiter( max_rate )
+    with a_fetch.AmedasConnectionPool( max_inflight = max_inflight ) as pool:
+        # go chunk by chunk, so the checkpoint is updated while the run goes on
+        done_cnt = 0
+        for chunk in a_fetch.splitSlotChunks( missing_slots, area_codes, max_inflight ):
+            stored_slots, failed_slots = fetchAndStoreSlots( chunk, area_codes, pool, rate_limiter, max_inflight, debugprint )
+            done_cnt += len(chunk)
+            done_keys.update(slot.strftime('%Y-%m-%d %H:%M') for slot in stored_slots)
+            summary['fetched'] += len(stored_slots)
+            summary['failed'] += len(failed_slots)
+            saveBackfillCheckpoint( range_key, done_keys, checkpoint_path )
+            a_met.flushMetrics()
+            print(f"Backfill progress: {done_cnt}/{len(missing_slots)} slots")
+    # all done? then the checkpoint is not needed anymore
+    if( not summary['failed'] and os.path.exists(checkpoint_path) ): os.remove(checkpoint_path)
+    return summary
+
+
+# Fetch only the slots that the gap index shows as missing for some area, of the period that AMEDAS still keeps, newest first
+# (the newest ones are the first to be lost if the run is stopped). Nothing else is fetched, so it can be run as often as needed:
+# the gap index itself keeps the progress. rebuild builds the gap index of the period again from the logs first
+def repairWeatherGaps( area_code = 0, debugprint = False, rebuild = False, max_inflight = None, max_rate = None ):
+    if( max_inflight is None ): max_inflight = a_cfg.fetch_max_inflight
+    if( max_rate is None ): max_rate = a_cfg.backfill_rate_limit
+    import amedas_daemon as a_dmn
+    area_codes = [area_code] if area_code else [areacd for areacd in a_cfg.area_info if areacd != 'common']
+    oldest_slot = dt.datetime.now() - dt.timedelta(days = a_cfg.amedas_retention_days)
+    # first slot after the oldest one still kept (rounded up, so the list does not start before it)
+    first_slot = oldest_slot.replace(second = 0, microsecond = 0) + dt.timedelta(minutes = 10 - oldest_slot.minute % 10)
+    slots = listBackfillSlots( first_slot, a_dmn.getCurrentSlot() )
+    if( rebuild ): print(f"Gap index of {a_gap.rebuildGapIndexes( slots, area_codes )} months built again from the logs")
+    missing_slots = a_gap.getMissingSlots( slots[::-1], area_codes )
+    summary = {'slots':len(slots), 'missing':len(missing_slots), 'fetched':0, 'failed':0}
+    print(f"Repair from {slots[0].strftime('%Y-%m-%d %H:%M')} to {slots[-1].strftime('%Y-%m-%d %H:%M')}: {len(missing_slots)} of {len(slots)} slots missing for {area_codes}")
+    rate_limiter = a_fetch.RateLimiter( max_rate )
+    with a_fetch.AmedasConnectionPool( max_inflight = max_inflight ) as pool:
+        done_cnt = 0
+        for chunk in a_fetch.splitSlotChunks( missing_slots, area_codes, max_inflight ):
+            stored_slots, failed_slots = fetchAndStoreSlots( chunk, area_codes, pool, rate_limiter, max_inflight, debugprint )
+            done_cnt += len(chunk)
+            summary['fetched'] += len(stored_slots)
+            summary['failed'] += len(failed_slots)
+            a_met.flushMetrics()
+            if( debugprint == True or failed_slots ): print(f"Repair progress: {done_cnt}/{len(missing_slots)} slots, failed: {[slot.strftime('%Y-%m-%d %H:%M') for slot in failed_slots]}")
+    return summary
+
+#----EOF--------------------------------------------------------
@@ -0,0 +1,564 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import argparse
+import sys
+import json
+import random
+import math
+import subprocess
+import time
+import tracemalloc
+import os.path
+import tempfile
+import threading
+import gzip
+import hashlib
+import platform
+import datetime as dt
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from email.utils import formatdate
+from contextlib import contextmanager
+import amedas_config as a_cfg
+import amedas_funcs as a_fnc
+import amedas_manifest as a_mnf
+
+
+# Create a map response like the ones from AMEDAS (~1300 areas, configured areas included)
+def createSyntheticMapPayload( n_areas = 1300, seed = 0 ):
+    rnd = random.Random(seed)
+    area_codes = set(areacd for areacd in a_cfg.area_info if areacd != 'common')
+    while( len(area_codes) < n_areas ): area_codes.add(str(rnd.randint(11001, 94999)))
+    payload = {area_code:createSyntheticAreaValues(rnd) for area_code in sorted(area_codes)}
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+# Create a point file like the ones from AMEDAS (3 hours of one area), up to the slot last_slot if given
+def createSyntheticPointPayload( area_code, block_start, last_slot = None, seed = 0 ):
+    rnd = random.Random(f"{seed}{area_code}{block_start}")
+    slots = [block_start + dt.timedelta(minutes = 10 * slot_idx) for slot_idx in range(18)]
+    payload = {slot.strftime('%Y%m%d%H%M%S'):createSyntheticAreaValues(rnd) for slot in slots if last_slot is None or slot <= last_slot}
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+# Create the values of an area for a slot, as in the map responses and the point files
+def createSyntheticAreaValues( rnd ):
+    area_vals = {"temp":[round(rnd.uniform(-10, 35), 1), 0], "humidity":[rnd.randint(10, 100), 0], "sun10m":[rnd.randint(0, 10), 0], "sun1h":[round(rnd.uniform(0, 1), 1), 0],
+                 "precipitation10m":[round(rnd.uniform(0, 5), 1), 0], "precipitation1h":[round(rnd.uniform(0, 10), 1), 0], "precipitation3h":[round(rnd.uniform(0, 20), 1), 0],
+                 "precipitation24h":[round(rnd.uniform(0, 50), 1), 0], "windDirection":[rnd.randint(0, 16), 0], "wind":[round(rnd.uniform(0, 15), 1), 0]}
+    # not every area measures everything
+    if( rnd.random() < 0.1 ): area_vals["snow"] = [rnd.randint(0, 100), rnd.choice([0, 0, 0, 5])]
+    if( rnd.random() < 0.1 ): area_vals["pressure"] = [round(rnd.uniform(990, 1030), 1), 0]
+    # and some values are not good (quality flag) or not there at all
+    for val_name in area_vals:
+        if( rnd.random() < 0.01 ): area_vals[val_name][1] = rnd.choice([1, 4, 5])
+        if( rnd.random() < 0.005 ): area_vals[val_name] = [None, 6]
+    return area_vals
+
+
+# Point the logs and graphs of this process to a (temp) directory, so benchmarks never touch the real data
+def useBenchPaths( base_dir ):
+    a_cfg.amedas_log = os.path.join(base_dir, "datafiles/ACODE/YYYY/MM", a_cfg.amedas_fname)
+    a_cfg.graphs_path = os.path.join(base_dir, "graphs/ACODE/YYYY/MM")
+    a_cfg.archive_path = os.path.join(base_dir, "archive/YYYY/MM")
+    a_cfg.backfill_checkpoint = os.path.join(base_dir, "datafiles", "backfill_checkpoint.json")
+    a_cfg.migrate_state = os.path.join(base_dir, "datafiles", "migrate_state.json")
+    a_cfg.latest_time_state = os.path.join(base_dir, "datafiles", "latest_time.json")
+    # derived from graphs_path when the config is imported, so it has to be moved too (and the manifest loaded again from there)
+    a_cfg.render_manifest = os.path.join(base_dir, "graphs", "render_manifest.json")
+    # the metrics are still recorded (their cost is part of the timings) but never written
+    a_cfg.metrics_events_path = ''
+    a_cfg.metrics_prom_path = ''
+    resetBenchCaches()
+
+
+# Forget what was loaded from the logs and the render manifest, so nothing is kept between the real and the bench paths
+def resetBenchCaches():
+    a_fnc.clearLogCache()
+    a_mnf.render_manifest = None
+    a_mnf.render_manifest_updates.clear()
+
+
+# Copy of the config entries, to put them back with restoreConfig
+def snapshotConfig():
+    return {name:getattr(a_cfg, name) for name in dir(a_cfg) if not name.startswith('_')}
+
+
+# Put back the config entries of a snapshot (and forget what was loaded with the bench paths)
+def restoreConfig( config_snapshot ):
+    for name, value in config_snapshot.items(): setattr(a_cfg, name, value)
+    resetBenchCaches()
+
+
+# Temp directory with the bench paths for the with block, the config is restored when leaving it
+@contextmanager
+def benchDirectory():
+    config_snapshot = snapshotConfig()
+    try:
+        with tempfile.TemporaryDirectory() as base_dir:
+            useBenchPaths( base_dir )
+            yield base_dir
+    finally:
+        restoreConfig( config_snapshot )
+
+
+# Write monthly logs (compacted JSON format) for some areas with one point every 10min
+# a share of the slots is left out (missing_ratio) and some values have a quality flag other than 0
+def writeSyntheticMonthLogs( area_codes, month_datetime, n_days = 31, missing_ratio = 0.02, seed = 0 ):
+    rnd = random.Random(seed)
+    month_start = month_datetime.replace(day = 1, hour = 0, minute = 0, second = 0, microsecond = 0)
+    log_paths = []
+    for area_code in area_codes:
+        logdata = {}
+        for slot in range(n_days * 144):
+            if( rnd.random() < missing_ratio ): continue
+            slot_datetime = month_start + dt.timedelta(minutes = 10 * slot)
+            if( slot_datetime.month != month_start.month ): break
+            hour = slot_datetime.hour + slot_datetime.minute / 60
+            quality = 0 if rnd.random() > 0.01 else rnd.choice([1, 4, 5])
+            datapoint = {"temp":[round(10 + 8 * math.sin((hour - 9) / 24 * 2 * math.pi) + rnd.uniform(-1, 1), 1), quality], "humidity":[rnd.randint(30, 100), 0],
+                         "sun10m":[rnd.randint(0, 10), 0], "sun1h":[round(rnd.uniform(0, 1), 1), 0], "precipitation10m":[round(max(0, rnd.gauss(0, 1)), 1), 0],
+                         "precipitation1h":[round(max(0, rnd.gauss(0, 2)), 1), 0], "precipitation3h":[round(max(0, rnd.gauss(0, 3)), 1), 0],
+                         "precipitation24h":[round(max(0, rnd.gauss(0, 5)), 1), 0], "windDirection":[rnd.randint(0, 16), 0], "wind":[round(rnd.uniform(0, 10), 1), 0]}
+            time_key = slot_datetime.strftime('%Y-%m-%d %H:%M')
+            logdata.setdefault(time_key[:10], {})[time_key] = {area_code:datapoint}
+        log_path = a_fnc.buildPathFromDate( target_datetime = month_start, target = "l", area_code = area_code )
+        os.makedirs( os.path.dirname(log_path), exist_ok = True )
+        with open(log_path, 'w') as log_file:
+            json.dump(logdata, log_file, sort_keys=True)
+        log_paths.append(log_path)
+    return log_paths
+
+
+# Get the current resident memory of this process in bytes
+def getCurrentRss():
+    try:
+        with open('/proc/self/statm', 'r') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # not linux... use the peak instead (kB on linux, bytes on macOS)
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# Run a function several times and return the best time and the peak of memory allocated during one run
+def measureCall( func, repeat ):
+    best_time = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best_time = min(best_time, time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    peak_mem = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best_time, peak_mem
+
+
+# Compare the full dict parse with the selective parse of the configured areas
+def benchParse( payload_fname = '', repeat = 20 ):
+    if( payload_fname ):
+        with open(payload_fname, 'rb') as payload_file: raw_response = payload_file.read()
+    else:
+        raw_response = createSyntheticMapPayload()
+    area_codes = [areacd for areacd in a_cfg.area_info if areacd != 'common']
+    # the result of the dict path, restricted to the configured areas
+    def parseFull():
+        raw_data = a_fnc.parseWeatherResponse( raw_response, request_mode = 'f' )
+        return {areacd:raw_data[areacd] for areacd in area_codes if areacd in raw_data}
+    def parseSelective():
+        return a_fnc.parseWeatherResponse( raw_response, request_mode = 's', area_codes = area_codes )
+    identical = parseFull() == parseSelective()
+    full_time, full_mem = measureCall( parseFull, repeat )
+    sel_time, sel_mem = measureCall( parseSelective, repeat )
+    results = {'payload_bytes':len(raw_response), 'areas':len(area_codes), 'identical':identical,
+               'full_ms':full_time * 1000, 'full_peak_kb':full_mem / 1024, 'selective_ms':sel_time * 1000, 'selective_peak_kb':sel_mem / 1024}
+    print(f"Payload: {results['payload_bytes']} bytes, {results['areas']} areas requested, identical results: {identical}")
+    print(f"  full dict parse : {results['full_ms']:8.3f} ms  peak {results['full_peak_kb']:9.1f} KiB")
+    print(f"  selective parse : {results['selective_ms']:8.3f} ms  peak {results['selective_peak_kb']:9.1f} KiB")
+    return results
+
+
+# Render a few hundred plots and check that the memory of the process stays bounded (fails if it grows more than max_growth_mb)
+def benchRenderMemory( n_plots = 300, warmup = 20, max_growth_mb = 30 ):
+    import amedas_plot_funcs as a_plt_fnc
+    with benchDirectory() as base_dir:
+        area_code = a_cfg.area_code_def
+        month_start = dt.datetime(2024, 1, 1)
+        writeSyntheticMonthLogs( [area_code], month_start, n_days = 3 )
+        graph_path = os.path.join(base_dir, "graphs")
+        val_names = [val_name for val_name in a_cfg.graph_amedas_defcats]
+        def renderOne( idx ):
+            date_key = (month_start + dt.timedelta(days = idx % 3)).strftime('%Y-%m-%d')
+            a_plt_fnc.plotAmedasSingleScatter( val_name = val_names[idx % len(val_names)], date_key = date_key, plot_save_path = graph_path, area_code = area_code )
+        for idx in range(warmup): renderOne(idx)
+        start_rss = getCurrentRss()
+        start = time.perf_counter()
+        for idx in range(n_plots): renderOne(idx)
+        elapsed = time.perf_counter() - start
+        growth_mb = (getCurrentRss() - start_rss) / (1024 * 1024)
+    results = {'plots':n_plots, 'ms_per_plot':elapsed / n_plots * 1000, 'rss_growth_mb':growth_mb, 'max_growth_mb':max_growth_mb, 'bounded':growth_mb <= max_growth_mb}
+    print(f"Rendered {n_plots} plots in {elapsed:.2f} s ({results['ms_per_plot']:.1f} ms/plot), RSS growth {growth_mb:.1f} MiB (limit {max_growth_mb} MiB)")
+    return results
+
+
+# Store points of a month on day 1 (empty month) and on day 31 (30 days already stored) and compare the cost of each write
+def benchWrite( n_writes = 36 ):
+    with benchDirectory() as base_dir:
+        area_codes = [areacd for areacd in a_cfg.area_info if areacd != 'common']
+        month_start = dt.datetime(2024, 1, 1)
+        # the previous month is there too, so the first write of the month does its compaction as in real life
+        writeSyntheticMonthLogs( area_codes, dt.datetime(2023, 12, 1) )
+        weather_data = json.loads(createSyntheticMapPayload())
+        def writeSlots( first_slot ):
+            write_times = []
+            for slot in range(n_writes):
+                commit_info = a_fnc.addWeatherValueEntries( weather_data, area_codes, first_slot + dt.timedelta(minutes = 10 * slot) )
+                write_times.append( commit_info['total_time'] / len(area_codes) )
+            return write_times
+        day1_times = writeSlots( month_start )
+        # fill days 1-30 (as a compacted log) and write on day 31
+        writeSyntheticMonthLogs( area_codes, month_start, n_days = 30 )
+        a_fnc.clearLogCache()
+        day31_times = writeSlots( month_start + dt.timedelta(days = 30) )
+    day1_ms, day31_ms = sorted(day1_times)[n_writes // 2] * 1000, sorted(day31_times)[n_writes // 2] * 1000
+    results = {'writes':n_writes * len(area_codes), 'day1_ms':day1_ms, 'day31_ms':day31_ms, 'day1_first_ms':day1_times[0] * 1000, 'day31_ratio':day31_ms / day1_ms if day1_ms else 0.0}
+    print(f"Write of one point (median per area): day 1 {day1_ms:.3f} ms, day 31 {day31_ms:.3f} ms (x{results['day31_ratio']:.2f}), first write of the month {results['day1_first_ms']:.3f} ms")
+    return results
+
+
+# Render each kind of plot from a month of synthetic data (graphs always rendered, the manifest is not used)
+# and the jobs of a nightly run on a pool of max_workers processes, counting the monthly logs parsed by all the processes
+def benchRender( repeat = 3, max_workers = None ):
+    import amedas_render as a_rnd
+    with benchDirectory() as base_dir:
+        a_cfg.render_skip_unchanged = False
+        area_codes = [areacd for areacd in a_cfg.area_info if areacd != 'common']
+        writeSyntheticMonthLogs( area_codes, dt.datetime(2024, 1, 1) )
+        jobs = {'single':('single', [area_codes[0]], 'temp', ['2024-01-15']), 'composite':('composite', [area_codes[0]], ('temp', 'humidity'), ['2024-01-15']),
+                'comp_dates':('comp_dates', [area_codes[0]], 'temp', ['2024-01-08', '2024-01-15']), 'comp_areas':('comp_areas', area_codes[:2], 'temp', ['2024-01-15']),
+                'all_areas':('all_areas', [], 'temp', ['2024-01-15']), 'range_single':('range_single', [area_codes[0]], 'temp', ['2024-01-01', '2024-01-31']),
+                'range_areas':('range_areas', [], 'temp', ['2024-01-01', '2024-01-31'])}
+        results = {}
+        for plot_kind, job in jobs.items():
+            job_times = []
+            # the first run loads the month (cold), the best of the next ones is the render itself
+            for _ in range(repeat + 1):
+                result = a_rnd.runTimedRenderJob( job )
+                if( not result['ok'] ): raise RuntimeError(f"{plot_kind} plot failed: {result['error']}")
+                job_times.append( result['time'] )
+            results[plot_kind + '_ms'] = min(job_times[1:]) * 1000
+            results[plot_kind + '_cold_ms'] = job_times[0] * 1000
+            print(f"  {plot_kind:14s}: {results[plot_kind + '_ms']:8.1f} ms (cold {results[plot_kind + '_cold_ms']:8.1f} ms)")
+        # the jobs of a nightly run on the process pool, from a cold log cache: each monthly log has to be parsed once, not once per worker
+        pool_jobs = [('single', [area_code], val_name, ['2024-01-15']) for area_code in area_codes for val_name in a_cfg.graph_amedas_defcats]
+        pool_jobs += [('all_areas', [], val_name, ['2024-01-15']) for val_name in a_cfg.graph_amedas_defcats]
+        a_fnc.clearLogCache()
+        misses_before = a_fnc.getLogCacheStats()['misses']
+        start = time.perf_counter()
+        pool_results = a_rnd.runRenderJobs( pool_jobs, max_workers )
+        results['pool_ms'] = (time.perf_counter() - start) * 1000
+        if( not all(result['ok'] for result in pool_results) ): raise RuntimeError(f"pool render failed: {[result['error'] for result in pool_results if not result['ok']]}")
+        results['pool_log_parses'] = a_fnc.getLogCacheStats()['misses'] - misses_before + sum(result['log_parses'] for result in pool_results)
+        results['pool_log_months'] = len(set(area_month for job in pool_jobs for area_month in a_rnd.listJobMonths(job)))
+        print(f"  {'pool':14s}: {results['pool_ms']:8.1f} ms for {len(pool_jobs)} jobs, {results['pool_log_parses']} log parses for {results['pool_log_months']} monthly logs")
+    return results
+
+
+# Stand-in for the AMEDAS server: answers any map request with a synthetic payload (gzipped if asked), after delay seconds
+# and the latest time file with server.latest_time (set it to the published slot, e.g. 2024-01-01T10:20:00+09:00),
+# with its ETag/Last-Modified and 304 for conditional requests that match them, and the point files with synthetic values
+# (up to the slot server.point_until if it is set, as the last 3 hours are published as they go, and 404 for the areas
+# in server.point_missing_areas, e.g. a station that was closed)
+# returns the server (running on a thread), its base url is http://127.0.0.1:<server.server_port>
+# server.request_count counts all the requests, server.map_requests and server.point_requests the map and point ones
+# and server.bytes_sent the size of the bodies
+def startStandInServer( payload, delay = 0.0 ):
+    gz_payload = gzip.compress(payload)
+    class StandInHandler( BaseHTTPRequestHandler ):
+        protocol_version = 'HTTP/1.1'
+        def do_GET( self ):
+            if( delay ): time.sleep(delay)
+            self.server.request_count += 1
+            if( self.path.endswith('latest_time.txt') ): return self.sendLatestTime()
+            if( '/point/' in self.path ): return self.sendPoint()
+            self.server.map_requests += 1
+            body, encoding = (gz_payload, 'gzip') if 'gzip' in self.headers.get('Accept-Encoding', '') else (payload, '')
+            self.sendBody( body, 'application/json', encoding )
+        def sendLatestTime( self ):
+            latest_time = self.server.latest_time
+            etag = '"' + hashlib.md5(latest_time.encode("utf-8")).hexdigest() + '"'
+            last_modified = formatdate( dt.datetime.fromisoformat(latest_time).timestamp(), usegmt = True )
+            if( self.headers.get('If-None-Match') == etag or (not self.headers.get('If-None-Match') and self.headers.get('If-Modified-Since') == last_modified) ):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.sendBody( latest_time.encode("utf-8"), 'text/plain', '', {'ETag':etag, 'Last-Modified':last_modified} )
+        def sendPoint( self ):
+            self.server.point_requests += 1
+            area_code, block_key = self.path.split('/')[-2:]
+            if( area_code in self.server.point_missing_areas ):
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = createSyntheticPointPayload( area_code, dt.datetime.strptime(block_key, '%Y%m%d_%H.json'), self.server.point_until )
+            use_gzip = 'gzip' in self.headers.get('Accept-Encoding', '')
+            self.sendBody( gzip.compress(body) if use_gzip else body, 'application/json', 'gzip' if use_gzip else '' )
+        def sendBody( self, body, content_type, encoding, extra_headers = None ):
+            self.server.bytes_sent += len(body)
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            for header, value in (extra_headers or {}).items(): self.send_header(header, value)
+            if( encoding ): self.send_header('Content-Encoding', encoding)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message( self, *args ):
+            pass
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    server.request_count = 0
+    server.map_requests = 0
+    server.point_requests = 0
+    server.point_until = None
+    server.point_missing_areas = set()
+    server.bytes_sent = 0
+    server.latest_time = '2024-01-01T00:00:00+09:00'
+    server.daemon_threads = True
+    threading.Thread( target = server.serve_forever, daemon = True ).start()
+    return server
+
+
+# End-to-end --batch (fetch the 6 slots of an hour concurrently and store them) against the stand-in server
+def benchBatch( delay = 0.05, repeat = 3 ):
+    import amedas_fetch as a_fetch
+    url_format = a_cfg.url_format
+    server = startStandInServer( createSyntheticMapPayload(), delay )
+    a_cfg.url_format = f"http://127.0.0.1:{server.server_port}/bosai/amedas/data/map/{a_cfg.replace_target}00.json"
+    try:
+        with benchDirectory() as base_dir:
+            batch_times = []
+            for run in range(repeat):
+                hour_start = dt.datetime(2024, 1, 1, run)
+                start = time.perf_counter()
+                stored = a_fetch.requestAndStoreWeatherInfoBatch( [hour_start + dt.timedelta(minutes = 10 * slot) for slot in range(6)], debugprint = False )
+                batch_times.append( time.perf_counter() - start )
+                if( min(stored.values()) == 0 ): raise RuntimeError(f"batch did not store every slot: {stored}")
+    finally:
+        a_cfg.url_format = url_format
+        server.shutdown()
+        server.server_close()
+    results = {'slots':6, 'server_delay':delay, 'batch_ms':min(batch_times) * 1000, 'requests':server.request_count}
+    print(f"Batch of 6 slots against the stand-in server ({delay*1000:.0f} ms per response): {results['batch_ms']:.1f} ms (best of {repeat})")
+    return results
+
+
+# Default (cron) runs with the latest time check against the stand-in server, which publishes a new slot every slot_runs runs
+# the map has to be downloaded once per new slot and never for the runs that find the same latest time (answered with a 304)
+def benchLatestTime( n_runs = 12, slot_runs = 2 ):
+    import amedas_fetch as a_fetch
+    url_format, latest_time_url = a_cfg.url_format, a_cfg.latest_time_url
+    server = startStandInServer( createSyntheticMapPayload() )
+    a_cfg.url_format = f"http://127.0.0.1:{server.server_port}/bosai/amedas/data/map/{a_cfg.replace_target}00.json"
+    a_cfg.latest_time_url = f"http://127.0.0.1:{server.server_port}/bosai/amedas/data/latest_time.txt"
+    try:
+        with benchDirectory() as base_dir:
+            run_times = []
+            for run in range(n_runs):
+                server.latest_time = (dt.datetime(2024, 1, 1) + dt.timedelta(minutes = 10 * (run // slot_runs))).strftime('%Y-%m-%dT%H:%M:%S+09:00')
+                start = time.perf_counter()
+                a_fetch.requestAndStoreLatestWeatherInfo( debugprint = False )
+                run_times.append( time.perf_counter() - start )
+    finally:
+        a_cfg.url_format, a_cfg.latest_time_url = url_format, latest_time_url
+        server.shutdown()
+        server.server_close()
+    new_slots = (n_runs + slot_runs - 1) // slot_runs
+    map_bytes = len(gzip.compress(createSyntheticMapPayload()))
+    results = {'runs':n_runs, 'new_slots':new_slots, 'map_requests':server.map_requests, 'requests':server.request_count,
+               'bytes_sent':server.bytes_sent, 'bytes_without_check':n_runs * map_bytes, 'run_ms':sum(run_times) / n_runs * 1000}
+    print(f"{n_runs} runs, {new_slots} new slots: {server.map_requests} map downloads, {server.request_count - server.map_requests} latest time requests, "
+          f"{server.bytes_sent/1024:.0f} KB sent ({results['bytes_without_check']/1024:.0f} KB with a map download per run), {results['run_ms']:.1f} ms per run")
+    return results
+
+
+# Backfill of some days of one area against the stand-in server from the map (one request per slot) and from the point files
+# (one request per 3 hours), both have to store every slot
+def benchPointFetch( n_days = 1, delay = 0.02 ):
+    import amedas_backfill as a_bkf
+    url_format, point_url_format, point_fetch_enabled = a_cfg.url_format, a_cfg.point_url_format, a_cfg.point_fetch_enabled
+    server = startStandInServer( createSyntheticMapPayload(), delay )
+    a_cfg.url_format = f"http://127.0.0.1:{server.server_port}/bosai/amedas/data/map/{a_cfg.replace_target}00.json"
+    a_cfg.point_url_format = f"http://127.0.0.1:{server.server_port}/bosai/amedas/data/point/{a_cfg.replace_target_areacode}/{a_cfg.point_replace_target}.json"
+    area_code = a_cfg.area_code_def
+    first_day = (dt.datetime.now() - dt.timedelta(days = n_days + 1)).replace(hour = 0, minute = 0, second = 0, microsecond = 0)
+    last_slot = first_day + dt.timedelta(days = n_days, minutes = -10)
+    results = {'area':area_code, 'slots':n_days * 144, 'server_delay':delay}
+    try:
+        for source in ['map', 'point']:
+            a_cfg.point_fetch_enabled = source == 'point'
+            requests_before, bytes_before = server.request_count, server.bytes_sent
+            with benchDirectory() as base_dir:
+                start = time.perf_counter()
+                summary = a_bkf.backfillWeatherInfo( first_day, last_slot, area_code )
+                results[f'{source}_s'] = time.perf_counter() - start
+                # checked against the logs, not the gap index
+                gap_index_enabled, a_cfg.gap_index_enabled = a_cfg.gap_index_enabled, False
+                try:
+                    missing_slots = a_bkf.filterMissingSlots( a_bkf.listBackfillSlots(first_day, last_slot), [area_code] )
+                finally:
+                    a_cfg.gap_index_enabled = gap_index_enabled
+            if( summary['failed'] or missing_slots ): raise RuntimeError(f"{source} backfill did not store every slot: {summary}, {len(missing_slots)} missing")
+            results[f'{source}_requests'] = server.request_count - requests_before
+            results[f'{source}_kb'] = (server.bytes_sent - bytes_before) / 1024
+    finally:
+        a_cfg.url_format, a_cfg.point_url_format, a_cfg.point_fetch_enabled = url_format, point_url_format, point_fetch_enabled
+        server.shutdown()
+        server.server_close()
+    for source in ['map', 'point']:
+        print(f"Backfill of {n_days} days of {area_code} from the {source + ' files' if source == 'point' else source}: {results[source + '_requests']} requests, "
+              f"{results[source + '_kb']:.0f} KB, {results[source + '_s']:.2f} s")
+    return results
+
+
+# Save the results of a run as JSON (with the environment), so they can be compared with a later run
+def saveBenchResults( results, output_fname ):
+    bench_run = {'time':dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'python':platform.python_version(), 'machine':platform.machine(), 'results':results}
+    with open(output_fname, 'w') as output_file:
+        json.dump(bench_run, output_file, indent = 1)
+    print(f"Results saved to {output_fname}")
+
+
+# Compare the results with a previous run, timings (*_ms, *_s) that got slower than threshold are regressions
+def compareBenchResults( results, previous_fname, threshold = 1.2 ):
+    with open(previous_fname, 'r') as previous_file:
+        previous = json.load(previous_file)['results']
+    regressions = []
+    for bench_name, bench_results in results.items():
+        for metric, value in bench_results.items():
+            prev_value = previous.get(bench_name, {}).get(metric)
+            if( not metric.endswith(('_ms', '_s')) or not isinstance(prev_value, (int, float)) or not prev_value ): continue
+            ratio = value / prev_value
+            print(f"  {bench_name}.{metric}: {prev_value:.3f} -> {value:.3f} (x{ratio:.2f}){'  <-- REGRESSION' if ratio > threshold else ''}")
+            if( ratio > threshold ): regressions.append(f"{bench_name}.{metric}")
+    return regressions
+
+
+# Import some modules in a new interpreter with -X importtime, returns (wall time in s, {module: cumulative import time in us})
+def measureImportTime( import_stmt ):
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    proc = subprocess.run( [sys.executable, '-X', 'importtime', '-c', import_stmt], cwd = script_dir, capture_output = True, text = True )
+    wall_time = time.perf_counter() - start
+    if( proc.returncode != 0 ): raise RuntimeError(f"'{import_stmt}' failed: {proc.stderr.strip().splitlines()[-1:]}")
+    import_times = {}
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if( not line.startswith('import time:') or 'cumulative' in line ): continue
+        fields = line[len('import time:'):].split('|')
+        import_times[fields[2].strip()] = int(fields[1])
+    return wall_time, import_times
+
+
+# Check that the fetch path of the command line does not load the plot modules, and compare its cold start with the plot path
+def benchImportTime( repeat = 5 ):
+    plot_modules = ['matplotlib', 'amedas_plot_funcs', 'amedas_render', 'amedas_series']
+    # what the default fetch-and-store run imports (the columnar store is imported when the first point is stored)
+    fetch_stmt = 'import amedas_data_request' + (', amedas_colstore' if a_cfg.colstore_enabled else '')
+    plot_stmt = 'import amedas_data_request, amedas_plot_funcs, amedas_render'
+    fetch_runs = [measureImportTime(fetch_stmt) for _ in range(repeat)]
+    plot_runs = [measureImportTime(plot_stmt) for _ in range(repeat)]
+    fetch_modules = fetch_runs[0][1]
+    leaked = sorted(set(module for module in fetch_modules if module.split('.')[0] in plot_modules))
+    results = {'fetch_s':min(run[0] for run in fetch_runs), 'plot_s':min(run[0] for run in plot_runs),
+               'fetch_modules':len(fetch_modules), 'plot_modules':len(plot_runs[0][1]), 'leaked_plot_modules':leaked}
+    print(f"Cold start (interpreter + imports, best of {repeat}): fetch {results['fetch_s']*1000:.0f} ms ({results['fetch_modules']} modules), plot {results['plot_s']*1000:.0f} ms ({results['plot_modules']} modules)")
+    slowest = sorted(fetch_modules.items(), key = lambda item: item[1], reverse = True)[:5]
+    print("  slowest imports on the fetch path: " + ", ".join(f"{module} {cumul/1000:.1f} ms" for module, cumul in slowest))
+    if( leaked ): print(f"  plot modules loaded by the fetch path: {leaked}")
+    return results
+
+
+# Add the options to save and compare the results (shared by all the benchmarks)
+def addResultsArguments( parser ):
+    parser.add_argument("--output", default='', help="Save the results as JSON to this file")
+    parser.add_argument("--compare", default='', help="Compare the results with a previous JSON file (fails if a timing is slower than --threshold)")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Slowdown ratio considered a regression by --compare")
+
+
+def main():
+    parser = argparse.ArgumentParser( description="Benchmarks for the AMEDAS data collector and plots", )
+    subparsers = parser.add_subparsers( dest="bench", required=True )
+    parser_parse = subparsers.add_parser("parse", help="Compare the full and the selective parse of a map response")
+    parser_parse.add_argument("--payload", default='', help="Recorded map response (JSON file), a synthetic one is used if not given")
+    parser_parse.add_argument("--repeat", type=int, default=20, help="Number of runs (the best one is reported)")
+    parser_render_mem = subparsers.add_parser("render-memory", help="Render a few hundred plots and check that memory stays bounded")
+    parser_render_mem.add_argument("--plots", type=int, default=300, help="Number of plots to render")
+    parser_render_mem.add_argument("--max_growth_mb", type=float, default=30, help="Max RSS growth allowed after the warmup")
+    parser_import = subparsers.add_parser("importtime", help="Check that the fetch path does not import the plot modules (fails if it does)")
+    parser_import.add_argument("--repeat", type=int, default=5, help="Number of runs (the best one is reported)")
+    subparsers.add_parser("write", help="Compare the cost of storing a point on day 1 and on day 31 of a month")
+    parser_render = subparsers.add_parser("render", help="Render time of each kind of plot and log parses of a nightly run on the process pool")
+    parser_render.add_argument("--workers", type=int, default=None, help="Processes of the pool (one per CPU by default)")
+    parser_batch = subparsers.add_parser("batch", help="End-to-end batch (fetch + store of 6 slots) against a local stand-in server")
+    parser_batch.add_argument("--delay", type=float, default=0.05, help="Seconds the stand-in server takes to answer each request")
+    parser_latest = subparsers.add_parser("latest", help="Default runs with the latest time check against a local stand-in server (fails if a map is downloaded twice)")
+    parser_latest.add_argument("--runs", type=int, default=12, help="Number of runs (a new slot is published every 2 runs)")
+    parser_point = subparsers.add_parser("point", help="Backfill of one area from the map and from the point files against a local stand-in server")
+    parser_point.add_argument("--days", type=int, default=1, help="Number of days to backfill")
+    subparsers.add_parser("all", help="Run the parse, write, render, batch, latest and point benchmarks")
+    for subparser in subparsers.choices.values(): addResultsArguments( subparser )
+    args = parser.parse_args()
+    # the config is restored after each benchmark, so the points recorded by them would be written by the flush at exit
+    a_cfg.metrics_events_path = ''
+    a_cfg.metrics_prom_path = ''
+
+    if( args.bench == "parse" ):
+        results = benchParse( args.payload, args.repeat )
+        if( not results['identical'] ):
+            print("ERROR: the selective parse does not give the same results as the full parse")
+            return 1
+    elif( args.bench == "render-memory" ):
+        results = benchRenderMemory( args.plots, max_growth_mb = args.max_growth_mb )
+        if( not results['bounded'] ):
+            print("ERROR: memory keeps growing with the number of plots")
+            return 1
+    elif( args.bench == "importtime" ):
+        results = benchImportTime( args.repeat )
+        if( results['leaked_plot_modules'] ):
+            print("ERROR: the fetch path imports plot modules again")
+            return 1
+    elif( args.bench == "write" ):
+        results = benchWrite()
+    elif( args.bench == "render" ):
+        results = benchRender( max_workers = args.workers )
+        if( results['pool_log_parses'] > results['pool_log_months'] ):
+            print(f"ERROR: {results['pool_log_parses']} log parses for {results['pool_log_months']} monthly logs on the process pool")
+            return 1
+    elif( args.bench == "batch" ):
+        results = benchBatch( args.delay )
+    elif( args.bench == "latest" ):
+        results = benchLatestTime( args.runs )
+        if( results['map_requests'] != results['new_slots'] ):
+            print(f"ERROR: {results['map_requests']} map downloads for {results['new_slots']} new slots")
+            return 1
+    elif( args.bench == "point" ):
+        results = benchPointFetch( args.days )
+    elif( args.bench == "all" ):
+        results = {'parse':benchParse(), 'write':benchWrite(), 'render':benchRender(), 'batch':benchBatch(), 'latest':benchLatestTime(), 'point':benchPointFetch()}
+    # results of a single benchmark are saved under its name, so any run can be compared with an 'all' run
+    if( args.bench != "all" ): results = {args.bench:results}
+    if( args.output ): saveBenchResults( results, args.output )
+    if( args.compare ):
+        regressions = compareBenchResults( results, args.compare, args.threshold )
+        if( regressions ):
+            print(f"ERROR: slower than {args.compare}: {regressions}")
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+#----EOF--------------------------------------------------------
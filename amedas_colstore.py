@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import os.path
+import datetime as dt
+import numpy as np
+import amedas_config as a_cfg
+import amedas_funcs as a_fnc
+
+# Layout of the columnar store
+slots_per_day = 144
+max_days = 31
+colstore_vars = list(a_cfg.graph_amedas_dic.keys())
+colstore_var_idx = {val_name:idx for idx, val_name in enumerate(colstore_vars)}
+flag_missing = 255      # quality flag used for slots with no value (the value itself is NaN)
+
+
+# Form the paths of the values and quality flags files of an area for the month of the given datetime
+def buildColumnPaths( area_code, month_datetime ):
+    log_dir = os.path.dirname( a_fnc.buildPathFromDate( target_datetime = month_datetime, target = "l", area_code = area_code ) )
+    month_key = month_datetime.strftime('%Y%m')
+    vals_path = os.path.join(log_dir, a_cfg.colstore_vals_fname.replace(a_cfg.replace_target_year + a_cfg.replace_target_month, month_key))
+    flags_path = os.path.join(log_dir, a_cfg.colstore_flags_fname.replace(a_cfg.replace_target_year + a_cfg.replace_target_month, month_key))
+    return vals_path, flags_path
+
+
+# Get the index of the 10min slot of a datetime inside its month
+def getSlotIndex( entry_datetime ):
+    return (entry_datetime.day - 1) * slots_per_day + entry_datetime.hour * 6 + entry_datetime.minute // 10
+
+
+# Create the values and quality flags files of an area for a month, with the points already in the monthly log (if any)
+# logdata: the monthly log if it was already loaded (e.g. by the migration tool)
+def createMonthColumns( area_code, month_datetime, logdata = None ):
+    vals_path, flags_path = buildColumnPaths( area_code, month_datetime )
+    os.makedirs( os.path.dirname(vals_path), exist_ok = True )
+    col_shape = (len(colstore_vars), max_days * slots_per_day)
+    vals = np.lib.format.open_memmap(vals_path + '.tmp', mode = 'w+', dtype = np.float32, shape = col_shape)
+    vals[:] = np.nan
+    flags = np.lib.format.open_memmap(flags_path + '.tmp', mode = 'w+', dtype = np.uint8, shape = col_shape)
+    flags[:] = flag_missing
+    # so the columns are complete even if the month was started before the columnar store was enabled
+    if( logdata is None ): logdata = a_fnc.loadWeatherLog( a_fnc.buildPathFromDate( target_datetime = month_datetime, target = "l", area_code = area_code ) )
+    for date_vals in logdata.values():
+        for entry_time_key, entry_vals in date_vals.items():
+            if( area_code not in entry_vals ): continue
+            setColumnPoint( vals, flags, getSlotIndex(dt.datetime.strptime(entry_time_key, '%Y-%m-%d %H:%M')), entry_vals[area_code] )
+    vals.flush()
+    flags.flush()
+    del vals, flags
+    # flags first, so a values file is never there without its flags
+    os.replace(flags_path + '.tmp', flags_path)
+    os.replace(vals_path + '.tmp', vals_path)
+
+
+# Open (memory mapped) the values and quality flags of an area for the month of the given datetime
+# mode 'r' returns (None, None) if the month does not exist, mode 'r+' creates it if required
+def openMonthColumns( area_code, month_datetime, mode = 'r' ):
+    vals_path, flags_path = buildColumnPaths( area_code, month_datetime )
+    if( not os.path.exists(vals_path) or not os.path.exists(flags_path) ):
+        if( mode == 'r' ): return None, None
+        createMonthColumns( area_code, month_datetime )
+    vals = np.load(vals_path, mmap_mode = mode)
+    flags = np.load(flags_path, mmap_mode = mode)
+    # a month created before new variables were added to graph_amedas_dic has less rows
+    if( vals.shape[0] < len(colstore_vars) and mode == 'r+' ):
+        print(f"Warning: columnar store {vals_path} has {vals.shape[0]} variables, the new ones will not be stored")
+    return vals, flags
+
+
+# Write the values of one data point (JMA format, e.g. {"temp":[12.3, 0], ...}) in their slot
+def setColumnPoint( vals, flags, slot_idx, datapoint ):
+    for val_name, val_pair in datapoint.items():
+        var_idx = colstore_var_idx.get(val_name)
+        if( var_idx is None or var_idx >= vals.shape[0] ): continue
+        try:
+            value, flag = val_pair[0], val_pair[1]
+        except (TypeError, IndexError):
+            continue
+        vals[var_idx, slot_idx] = np.nan if value is None else value
+        flags[var_idx, slot_idx] = flag_missing if flag is None else flag
+
+
+# Store a data point of an area, the cost is the same for any slot of the month
+def storeColumnPoint( area_code, entry_datetime, datapoint ):
+    vals, flags = openMonthColumns( area_code, entry_datetime, 'r+' )
+    setColumnPoint( vals, flags, getSlotIndex(entry_datetime), datapoint )
+    vals.flush()
+    flags.flush()
+    return True
+
+
+# Store the data points of several areas from a map response
+def storeColumnPoints( weather_data, area_codes, entry_datetime ):
+    stored_cnt = 0
+    for area_code in area_codes:
+        if( area_code in weather_data and type(weather_data[area_code]) is dict ):
+            stored_cnt += storeColumnPoint( area_code, entry_datetime, weather_data[area_code] )
+    return stored_cnt
+
+
+# Get the values and quality flags of some variables for a day, as views of the memory mapped month (no copy)
+# returns {val_name: (values[144], flags[144])}, slots with no data have NaN values, or None if the month does not exist
+def readDayColumns( area_code, date_key, val_names = None ):
+    if( not isinstance(date_key, dt.datetime) ): date_key = dt.datetime.strptime( date_key, '%Y-%m-%d' )
+    vals, flags = openMonthColumns( area_code, date_key, 'r' )
+    if( vals is None ): return None
+    day_start = (date_key.day - 1) * slots_per_day
+    return getColumnSlices( vals, flags, day_start, day_start + slots_per_day, val_names )
+
+
+# Get the values and quality flags of some variables for the month of the given datetime (views, no copy)
+# the arrays have 144 slots per day of the month
+def readMonthColumns( area_code, month_datetime, val_names = None ):
+    vals, flags = openMonthColumns( area_code, month_datetime, 'r' )
+    if( vals is None ): return None
+    next_month = (month_datetime.replace(day = 1) + dt.timedelta(days = 32)).replace(day = 1)
+    month_days = (next_month - dt.timedelta(days = 1)).day
+    return getColumnSlices( vals, flags, 0, month_days * slots_per_day, val_names )
+
+
+# Check that the columns of a month have every slot stored in the monthly log, using the gap index (see amedas_gaps):
+# the journal is the reference and a failed write here (or a time with colstore_enabled = False) leaves slots that
+# are only in the journal, so the readers use the log for such a month. True if the gap index is not enabled
+def hasAllStoredSlots( area_code, month_datetime ):
+    if( not a_cfg.gap_index_enabled ): return True
+    import amedas_gaps as a_gap
+    vals, flags = openMonthColumns( area_code, month_datetime, 'r' )
+    if( flags is None ): return False
+    # the 'present' layer has the slots of the month in the same order as the columns (bit i % 8 of byte i // 8)
+    index = a_gap.loadGapIndex( area_code, month_datetime )
+    stored_slots = np.unpackbits(np.frombuffer(index, dtype = np.uint8, count = a_gap.gap_month_days * a_gap.gap_day_bytes), bitorder = 'little').astype(bool)
+    col_slots = (flags != flag_missing).any(axis = 0)
+    return not np.any(stored_slots[:len(col_slots)] & ~col_slots)
+
+
+# Get the slices [slot_start, slot_end) of the rows of some variables
+def getColumnSlices( vals, flags, slot_start, slot_end, val_names = None ):
+    if( val_names is None ): val_names = colstore_vars
+    col_slices = {}
+    for val_name in val_names:
+        var_idx = colstore_var_idx.get(val_name)
+        if( var_idx is None or var_idx >= vals.shape[0] ): continue
+        col_slices[val_name] = (vals[var_idx, slot_start:slot_end], flags[var_idx, slot_start:slot_end])
+    return col_slices
+
+#----EOF--------------------------------------------------------
@@ -4,6 +4,28 @@ import os.path
 ## URL and request format related definitions
 url_format = "https://www.jma.go.jp/bosai/amedas/data/map/YYYYMMDDHHMM00.json"  # Format of the URL time  -> YYYYMMDDHHMMSS
 replace_target = "YYYYMMDDHHMM"
+## Settings for the concurrent fetcher (batch mode and friends)
+fetch_max_inflight = 6      # max number of requests (and pooled keep-alive connections) in flight at the same time
+fetch_timeout = 20          # seconds before giving up on a request
+## Settings for the collector daemon (wakes up every 10min, a bit after the slot so AMEDAS had time to publish it)
+daemon_publish_delay = 90         # seconds after the 10min boundary
+daemon_max_sleep = 60             # max seconds per sleep, so a jump of the clock (suspend, NTP) is noticed quickly
+daemon_startup_catchup_hours = 3  # missing slots of the last hours that are fetched when the daemon starts
+## Per-station point files: 3 hours (18 slots of 10min) of one area in a small response, used instead of the map
+## when only a few areas are collected (the map has all the areas but only one slot)
+point_url_format = "https://www.jma.go.jp/bosai/amedas/data/point/ACODE/YYYYMMDD_HH.json"   # HH = first hour of the 3 hours (00, 03, ... 21)
+point_replace_target = "YYYYMMDD_HH"
+point_fetch_enabled = True
+point_max_areas = 3         # use the point files when collecting this number of areas or less
+## Latest published slot: a tiny file asked first (conditional request, If-None-Match/If-Modified-Since), so the map is only
+## downloaded when there is a published slot that is not stored yet, instead of guessing the slot from the clock
+latest_time_url = "https://www.jma.go.jp/bosai/amedas/data/latest_time.txt"   # its content is like 2024-01-01T10:20:00+09:00
+latest_time_check = True
+latest_time_poll_interval = 15    # daemon: seconds between polls while the slot of the clock is not published yet
+latest_time_max_wait = 300        # daemon: max seconds waiting for it (then the slots published so far are fetched)
+## Settings for the backfill mode (past map data is only kept by AMEDAS for about 10 days)
+amedas_retention_days = 10
+backfill_rate_limit = 5     # max number of requests started per second
 ## Area related information ('common' is used for graphs like those related to value comparison between different areas)
 ##            CODE      Area name          Area short name         Area name in japanese
 area_info = {'40201': {'name':'Mito'   , 'short_name':'mito'   , 'japanese_name':'水戸（ミト）'      , 'color':'limegreen'  , 'marker':'v'},
@@ -20,6 +42,15 @@ area_code_def = '40201'    #I use "Mito" as default but you can change it to wha
 ##                        example url for Mito -> https://www.jma.go.jp/bosai/amedas/#area_type=offices&area_code=080000&amdno=40201&format=table1h&elems=53614
 ##                        info also available here https://www.jma.go.jp/jma/kishou/know/amedas/ame_master.pdf    and here  https://www.jma.go.jp/jma/kishou/know/amedas/kaisetsu.html
 
+## Station table of AMEDAS (code, names, lat/lon, altitude, observed elements), local copy of station_table_url
+## use it to find the areas near a point or inside a box instead of looking for the codes on the map (see amedas_stations)
+station_table_url = "https://www.jma.go.jp/bosai/amedas/const/amedastable.json"
+#station_table_path = os.path.join(aux_path, "amedastable.json")
+station_table_path = os.path.join(os.path.os.getcwd(), "amedastable.json")
+station_grid_deg = 0.5      # size of the cells of the spatial index (degrees)
+station_colors = ['limegreen', 'deepskyblue', 'brown', 'pink', 'yellow', 'red', 'orange', 'violet', 'cyan', 'white']
+station_markers = ['v', '^', 'o', 'x', '*', 'p', 's', 'D', 'h', '+']
+
 ## Path and filenames for amedas weather data
 replace_target_year="YYYY"
 replace_target_month="MM"
@@ -33,6 +64,49 @@ iofiles_path = os.path.join(os.path.os.getcwd(), "datafiles/ACODE/YYYY/MM")
 ### ----------
 amedas_fname  = 'YYYYMM_amedas_vals.json'
 amedas_log  = os.path.join(iofiles_path, amedas_fname)
+## Append-only journal kept next to each monthly log (one JSON line per 10min point, merged into the log on compaction)
+amedas_journal_ext = '.jsonl'
+amedas_compacting_ext = '.jsonl.compacting'
+## Columnar store: per area and month, one row of 31 days x 144 slots (10min) per variable of graph_amedas_dic (needs numpy)
+## Note: the rows follow the order of graph_amedas_dic, add new variables at the end only
+colstore_enabled = True
+colstore_vals_fname = 'YYYYMM_amedas_cols.npy'
+colstore_flags_fname = 'YYYYMM_amedas_flags.npy'
+## Gap index: per area and month, a bitmap of the 144 slots (10min) of each day that are stored (31 days x 18 bytes)
+## kept up to date as each point is stored (see amedas_gaps), so finding the missing slots does not need to read the logs
+gap_index_enabled = True
+gap_index_fname = 'YYYYMM_amedas_slots.bin'
+## Rollups: hourly (one file per day) and daily/monthly (one file per month) aggregates of each variable of graph_amedas_dic
+## updated as each point is stored (see amedas_rollup), so long range queries do not need to read the 10min points
+## (rollup_enabled = False builds them from the monthly log on each query, never saved; the rollup command repairs a month)
+rollup_enabled = True
+rollup_hourly_fname = 'YYYYMMDD_amedas_hourly.json'
+rollup_daily_fname = 'YYYYMM_amedas_daily.json'
+rollup_sum_prefixes = ('precipitation', 'sun')     # variables that also get the total of the period
+rollup_circular_vars = ('windDirection',)          # 16 points compass (1-16, 0 = calm), they get a circular mean
+## Archive of the full map responses (all the ~1300 areas), one compressed columnar snapshot per 10min slot
+## (off by default, it needs the full response to be parsed on each request)
+archive_enabled = False
+#archive_path = os.path.join(aux_path, "archive/YYYY/MM")
+archive_path = os.path.join(os.path.os.getcwd(), "archive/YYYY/MM")
+archive_fname = 'YYYYMMDDHHMM_amedas_map.snap'
+## Parsed monthly logs are kept in memory (per process) up to this budget, based on the size of the files x log_cache_size_factor
+log_cache_budget_mb = 256
+log_cache_size_factor = 10
+## Checkpoint of the backfill mode, so an interrupted run resumes where it stopped
+backfill_checkpoint = os.path.join(iofiles_path.split(replace_target_areacode)[0], 'backfill_checkpoint.json')
+## Last answer of the latest time request (value, ETag and Last-Modified), so the next run can send a conditional request
+latest_time_state = os.path.join(iofiles_path.split(replace_target_areacode)[0], 'latest_time.json')
+## State of the migration of the monthly logs to the columnar store (see amedas_migrate), so it can be stopped and run again
+migrate_state = os.path.join(iofiles_path.split(replace_target_areacode)[0], 'migrate_state.json')
+
+## Per-stage timers and counters (see amedas_metrics): every point as a JSON line, and the totals as a Prometheus text file
+## (e.g. for the textfile collector of node_exporter), written at the end of each run and of each daemon tick
+metrics_enabled = True
+metrics_events_path = os.path.join(iofiles_path.split(replace_target_areacode)[0], 'metrics', 'amedas_metrics.jsonl')
+metrics_events_max_mb = 64   # the JSON lines file is renamed to .1 (replacing the previous one) when it gets bigger than this
+metrics_prom_path = os.path.join(iofiles_path.split(replace_target_areacode)[0], 'metrics', 'amedas.prom')
+metrics_prom_prefix = 'amedas'
 
 ## Path and filenames for graphs
 ### ----------
@@ -42,7 +116,15 @@ amedas_log  = os.path.join(iofiles_path, amedas_fname)
 graphs_path = os.path.join(os.path.os.getcwd(), "graphs/ACODE/YYYY/MM")
 ### ----------
 graphs_file_ext = '.png'
+## Manifest of the rendered graphs (fingerprint of the data each one was built from), graphs with the same data are not rendered again
+render_manifest = os.path.join(graphs_path.split(replace_target_areacode)[0], 'render_manifest.json')
+render_skip_unchanged = True
 graph_generic_fname = 'graph_scatter_amedas_'
+graph_range_fname = 'range_'
+## range plots (any number of days) are downsampled to about the width of the figure in pixels (or range_max_points if not 0)
+## 'minmax' keeps the min and max of each pixel column (peaks are kept), 'lttb' keeps the visual shape with less points, 'none' plots everything
+range_downsample = 'minmax'
+range_max_points = 0
 graph_comp_fname = 'comp_'
 # date comparison related info (yesterday and 8 days ago setting)
 ndays_timedelta_lst = 1
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import argparse
+import sys
+import signal
+import time
+import datetime as dt
+import amedas_config as a_cfg
+import amedas_funcs as a_fnc
+import amedas_fetch as a_fetch
+import amedas_backfill as a_bkf
+import amedas_gaps as a_gap
+import amedas_metrics as a_met
+
+## Note: this module only needs the fetch and store parts, keep the plot modules out of it so the daemon stays small
+
+
+# Get the last 10min slot that should be available at a given time (same rounding as adjustDateTimeForURL)
+def getCurrentSlot( now = None, publish_delay = a_cfg.daemon_publish_delay ):
+    if( now is None ): now = dt.datetime.now()
+    return dt.datetime.strptime( a_fnc.adjustDateTimeForURL( now - dt.timedelta(seconds = publish_delay) ), '%Y%m%d%H%M' )
+
+
+# Get the time of the next wake up: the next 10min boundary plus the publish delay
+def getNextWakeUp( current_slot, publish_delay = a_cfg.daemon_publish_delay ):
+    return current_slot + dt.timedelta(minutes = 10, seconds = publish_delay)
+
+
+# Create the in-memory state of the collector
+def createCollectorState( area_codes ):
+    return {'area_codes':area_codes, 'day':None, 'stored_slots':set(), 'last_slot':None, 'pending_slots':set(), 'ticks':0, 'stop':False,
+            'latest_state':{'latest_time':'', 'etag':'', 'last_modified':''}}
+
+
+# Keep in memory which slots of the current day are already stored (reloaded from the gap index or the logs only when the day changes)
+def refreshDayState( state, current_slot ):
+    if( state['day'] == current_slot.date() ): return
+    state['day'] = current_slot.date()
+    stored_slots = None
+    for area_code in state['area_codes']:
+        day_key = current_slot.strftime('%Y-%m-%d')
+        if( a_cfg.gap_index_enabled ):
+            area_keys = a_gap.getDoneTimeKeys( area_code, current_slot )
+        else:
+            area_keys = set(key for key in a_bkf.getStoredTimeKeys(area_code, current_slot) if key.startswith(day_key))
+        stored_slots = area_keys if stored_slots is None else stored_slots & area_keys
+    state['stored_slots'] = stored_slots or set()
+
+
+# Get the slots that have to be fetched now: the ones since the last tick (several after a sleep/suspend),
+# plus the ones that failed before, limited to the period that AMEDAS still keeps
+def getDueSlots( state, current_slot ):
+    oldest_slot = current_slot - dt.timedelta(days = a_cfg.amedas_retention_days)
+    if( state['last_slot'] is None ):
+        first_slot = current_slot - dt.timedelta(hours = a_cfg.daemon_startup_catchup_hours)
+    else:
+        first_slot = state['last_slot'] + dt.timedelta(minutes = 10)
+    first_slot = max(first_slot, oldest_slot)
+    due_slots = set(slot for slot in state['pending_slots'] if slot >= oldest_slot)
+    slot = first_slot
+    while( slot <= current_slot ):
+        due_slots.add(slot)
+        slot += dt.timedelta(minutes = 10)
+    # slots of today that are already stored do not need to be fetched again
+    today_key = current_slot.strftime('%Y-%m-%d')
+    return sorted(slot for slot in due_slots if not (slot.strftime('%Y-%m-%d') == today_key and slot.strftime('%Y-%m-%d %H:%M') in state['stored_slots']))
+
+
+# Fetch and store the due slots using the warm connection pool, returns the number of slots stored
+def runCollectorTick( state, pool, current_slot, debugprint = False ):
+    refreshDayState( state, current_slot )
+    due_slots = getDueSlots( state, current_slot )
+    stored_cnt = 0
+    if( due_slots ):
+        weather_batch = a_fetch.fetchSlotsBatch( due_slots, state['area_codes'], pool = pool )
+        for slot, weather_data in weather_batch.items():
+            commit_info = a_fnc.addWeatherValueEntries( weather_data, state['area_codes'], slot, debugprint ) if weather_data else None
+            if( commit_info and not commit_info['failed'] and not commit_info['unknown'] ):
+                state['pending_slots'].discard(slot)
+                if( slot.date() == state['day'] ): state['stored_slots'].add(slot.strftime('%Y-%m-%d %H:%M'))
+                stored_cnt += 1
+            else:
+                state['pending_slots'].add(slot)
+    state['last_slot'] = current_slot
+    state['ticks'] += 1
+    return stored_cnt
+
+
+# Wait (polling the latest time file) until the slot of the clock is published, or for latest_time_max_wait at most
+# returns the latest published slot, that is the one used as current slot, or the slot of the clock if the latest time is not known
+def waitForPublishedSlot( state, pool, current_slot ):
+    give_up = dt.datetime.now() + dt.timedelta(seconds = a_cfg.latest_time_max_wait)
+    while( True ):
+        latest_time = a_fetch.requestLatestTime( pool, state['latest_state'] )
+        if( latest_time is None ): return current_slot
+        if( latest_time >= current_slot or state['stop'] or dt.datetime.now() >= give_up ): return latest_time
+        sleepUntil( state, min(give_up, dt.datetime.now() + dt.timedelta(seconds = a_cfg.latest_time_poll_interval)) )
+
+
+# Sleep until the given time, in short steps so a stop request or a jump of the clock is handled quickly
+def sleepUntil( state, wake_up ):
+    while( not state['stop'] ):
+        remaining = (wake_up - dt.datetime.now()).total_seconds()
+        if( remaining <= 0 ): return
+        time.sleep( min(remaining, a_cfg.daemon_max_sleep) )
+
+
+# Stay resident and collect each 10min slot right after it is published, until SIGINT/SIGTERM
+def runCollectorDaemon( area_code = 0, debugprint = False ):
+    area_codes = [area_code] if area_code else [areacd for areacd in a_cfg.area_info if areacd != 'common']
+    state = createCollectorState( area_codes )
+    def requestStop( signum, frame ):
+        print(f"Got signal {signum}, stopping after the current tick")
+        state['stop'] = True
+    signal.signal( signal.SIGTERM, requestStop )
+    signal.signal( signal.SIGINT, requestStop )
+    print(f"Collector daemon started for areas {area_codes}")
+    with a_fetch.AmedasConnectionPool() as pool:
+        while( not state['stop'] ):
+            current_slot = getCurrentSlot()
+            if( a_cfg.latest_time_check ): current_slot = waitForPublishedSlot( state, pool, current_slot )
+            tick_start = time.perf_counter()
+            a_met.setMetricsContext( current_slot.strftime('%Y-%m-%d %H:%M') )
+            stored_cnt = runCollectorTick( state, pool, current_slot, debugprint )
+            tick_time = time.perf_counter() - tick_start
+            a_met.observe( 'tick', tick_time )
+            a_met.flushMetrics()
+            print(f"Tick @ {current_slot.strftime('%Y-%m-%d %H:%M')}: stored {stored_cnt} slots, {len(state['pending_slots'])} pending, {tick_time*1000:.0f} ms ({pool.conn_count} connections opened so far)")
+            sleepUntil( state, getNextWakeUp(current_slot) )
+    return state['ticks']
+
+
+def main():
+    parser = argparse.ArgumentParser( description="Collect AMEDAS weather data every 10 min (stays resident)", )
+    parser.add_argument("-v", "--verbose", action="store_true", dest="debuginfo", default=False, help="Print out debug messages")
+    parser.add_argument("-a", "--area", type = int, default = 0, help="Specific area to collect weather data (all the configured areas by default)")
+    args = parser.parse_args()
+    runCollectorDaemon( str(args.area) if args.area != 0 else 0, args.debuginfo )
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+#----EOF--------------------------------------------------------
@@ -3,33 +3,141 @@
 
 import argparse
 import sys
-import os.path
-from urllib.request import urlopen
-from urllib.error import URLError, HTTPError
+import contextlib
 import datetime as dt
-import json
 import amedas_config as a_cfg
 import amedas_funcs as a_fnc
-import amedas_plot_funcs as a_plt_fnc
+import amedas_metrics as a_met
+## Note: the rest of the modules (specially the plot ones, that load matplotlib) are imported only by the options that need them,
+##       so the default fetch-and-store run stays fast. Check it with: python amedas_bench.py importtime
+
+## Subcommands and the plot kinds of the 'plot' subcommand (with the number of values each one takes)
+subcommands = ['fetch', 'batch', 'backfill', 'repair', 'daemon', 'compact', 'rollup', 'migrate', 'query', 'plot', 'stations']
+plot_kinds = {'single':1, 'composite':2, 'comp_week':0, 'comp_dates':2, 'comp_areas':2, 'all_areas':0, 'everything':0, 'range':2, 'range_composite':4, 'range_areas':2}
+
+
+# Add the options shared by the subcommands and the old style command line
+# (suppress_defaults for the subcommands, so they do not overwrite the values given before the subcommand)
+def addCommonArguments( parser, suppress_defaults = False ):
+    default = (lambda value: argparse.SUPPRESS) if suppress_defaults else (lambda value: value)
+    parser.add_argument("-v", "--verbose", action="store_true", dest="debuginfo", default=default(False), help="Print out debug messages")
+    parser.add_argument("-a", "--area", type = int, default = default(0), help="Specific area to request weather data")
+    parser.add_argument("-c", "--category", nargs=1, metavar=('cat_name'), default=default(None), help="Specific value/category of weather data to plot")
+    parser.add_argument("--date", default=default(None), help="Specific date to request weather data [YYYY-MM-DD format date]")
+    parser.add_argument("--time", default=default(None), help="Specific time to request weather data [HH time format]")
+    parser.add_argument("--archive", action='store_true', default=default(False), help="Keep a snapshot of the full map response too (same as archive_enabled in the config)")
+    parser.add_argument("--near", nargs=2, type=float, metavar=('lat','lon'), default=default(None), help="Use the stations nearest to a point as areas too (see --near_n and the station table)")
+    parser.add_argument("--near_n", type=int, default=default(5), help="Number of stations used by --near")
+    parser.add_argument("--box", nargs=4, type=float, metavar=('lat_min','lon_min','lat_max','lon_max'), default=default(None), help="Use the stations inside a box as areas too")
+
+
+# Add the options of the query (also shared by the subcommand and the old style command line)
+def addQueryArguments( parser, suppress_defaults = False ):
+    default = (lambda value: argparse.SUPPRESS) if suppress_defaults else (lambda value: value)
+    parser.add_argument("--areas", nargs="+", default=default(None), help="Areas of the query, by code or short name (default: all the configured areas)")
+    parser.add_argument("--vars", nargs="+", default=default(None), help="Variables of the query (default: all the variables of graph_amedas_dic)")
+    parser.add_argument("--from", dest="from_datetime", default=default(None), help="First datetime of the query [YYYY-MM-DD or YYYY-MM-DD-HH:MM format]")
+    parser.add_argument("--to", dest="to_datetime", default=default(None), help="Last datetime of the query [YYYY-MM-DD or YYYY-MM-DD-HH:MM format] (default: from the first one to now)")
+    parser.add_argument("--where", action="append", default=default([]), help="Keep only the points that pass a filter, e.g. --where temp>30 (can be repeated)")
+    parser.add_argument("--format", dest="query_format", choices=['csv', 'jsonl'], default=default('csv'), help="Output format of the query")
+
+
+# Add the subcommands (fetch, batch, backfill, repair, daemon, compact, rollup, migrate, query, plot, stations), they are a shorter way of using the old style options
+def addSubcommands( parser ):
+    subparsers = parser.add_subparsers( dest="command", metavar="{" + ",".join(subcommands) + "}" )
+    parser_fetch = subparsers.add_parser("fetch", help="Get the weather values of the last 10 min slot and store them (default)")
+    addCommonArguments( parser_fetch, True )
+    parser_fetch.add_argument("-p", action='store_true', default=argparse.SUPPRESS, help="Print out values on terminal (does not store values)")
+    parser_batch = subparsers.add_parser("batch", help="Get each 10 min weather values for last hour")
+    addCommonArguments( parser_batch, True )
+    parser_batch.add_argument("--batch_datetime", default=argparse.SUPPRESS, help="Specific date to request weather data in batch [YYYY-MM-DD-HH format datetime]")
+    parser_backfill = subparsers.add_parser("backfill", help="Get every missing 10 min slot between 2 datetimes [YYYY-MM-DD-HH:MM format datetime]")
+    addCommonArguments( parser_backfill, True )
+    parser_backfill.add_argument("backfill", nargs=2, metavar=('from_datetime','to_datetime'))
+    parser_repair = subparsers.add_parser("repair", help="Get only the 10 min slots that are missing (see the gap index) of the last days that AMEDAS still keeps, newest first")
+    addCommonArguments( parser_repair, True )
+    parser_repair.add_argument("--rebuild", action='store_true', default=argparse.SUPPRESS, help="Build the gap index of those days again from the logs first")
+    parser_daemon = subparsers.add_parser("daemon", help="Stay resident and get the weather values every 10 min")
+    addCommonArguments( parser_daemon, True )
+    parser_compact = subparsers.add_parser("compact", help="Merge the journal of the monthly log into the log file")
+    addCommonArguments( parser_compact, True )
+    parser_rollup = subparsers.add_parser("rollup", help="Build again the hourly/daily/monthly rollups of the month from the monthly log if they do not match it")
+    addCommonArguments( parser_rollup, True )
+    parser_rollup.add_argument("--rebuild", action='store_true', default=argparse.SUPPRESS, help="Build them again even if they match the monthly log")
+    parser_migrate = subparsers.add_parser("migrate", help="Convert every monthly log to the columnar store and check it point by point (can be run again, skips the months already done)")
+    addCommonArguments( parser_migrate, True )
+    parser_migrate.add_argument("--workers", type=int, default=argparse.SUPPRESS, help="Number of processes (default: one per CPU)")
+    parser_migrate.add_argument("--rebuild", action='store_true', default=argparse.SUPPRESS, help="Create the columns of every month again, even if they were checked before")
+    parser_query = subparsers.add_parser("query", help="Print the stored points of some areas and variables between 2 datetimes (CSV or JSON lines)")
+    addCommonArguments( parser_query, True )
+    addQueryArguments( parser_query, True )
+    parser_plot = subparsers.add_parser("plot", help="Plot graphs: " + ", ".join(f"{kind} ({nvals} values)" for kind, nvals in plot_kinds.items()))
+    addCommonArguments( parser_plot, True )
+    parser_plot.add_argument("plot_kind", choices=list(plot_kinds.keys()))
+    parser_plot.add_argument("plot_values", nargs="*", help="Category, categories, dates or area short names, depending on the kind of plot")
+    parser_plot.add_argument("--force_render", action='store_true', default=argparse.SUPPRESS, help="Plot graphs again even if their data did not change")
+    parser_stations = subparsers.add_parser("stations", help="Print the area_info entries of the stations selected with --near/--box")
+    addCommonArguments( parser_stations, True )
+    parser_stations.add_argument("--download", action='store_true', default=argparse.SUPPRESS, help="Get a new copy of the station table first")
+
+
+# Translate a subcommand to the old style options
+def applySubcommand( parser, args ):
+    if( args.command == 'batch' ): args.batch = True
+    elif( args.command == 'repair' ): args.repair = True
+    elif( args.command == 'daemon' ): args.daemon = True
+    elif( args.command == 'compact' ): args.compact = True
+    elif( args.command == 'rollup' ): args.rollup = True
+    elif( args.command == 'migrate' ): args.migrate = True
+    elif( args.command == 'query' ): args.query = True
+    elif( args.command == 'stations' ): args.stations = True
+    elif( args.command == 'plot' ):
+        if( len(args.plot_values) != plot_kinds[args.plot_kind] ):
+            parser.error(f"plot {args.plot_kind} takes {plot_kinds[args.plot_kind]} values, got {args.plot_values}")
+        if( args.plot_kind == 'single' ): args.plot = args.plot_values[0]
+        elif( args.plot_kind == 'composite' ): args.plot_composite = args.plot_values
+        elif( args.plot_kind == 'comp_week' ): args.plot_comp_week = True
+        elif( args.plot_kind == 'comp_dates' ): args.plot_comp_dates = args.plot_values
+        elif( args.plot_kind == 'comp_areas' ): args.plot_comp_areas = args.plot_values
+        elif( args.plot_kind == 'all_areas' ): args.plot_all_areas = True
+        elif( args.plot_kind == 'everything' ): args.plot_everything = True
+        elif( args.plot_kind == 'range' ): args.plot_range = args.plot_values
+        elif( args.plot_kind == 'range_composite' ): args.plot_range_composite = args.plot_values
+        elif( args.plot_kind == 'range_areas' ): args.plot_range_areas = args.plot_values
+    return args
 
 
 def main():
     parser = argparse.ArgumentParser( description="Get weather data from AMEADAS api...",  )
-    parser.add_argument("-v", "--verbose", action="store_true", dest="debuginfo", default=False, help="Print out debug messages")
+    addCommonArguments( parser )
     parser.add_argument("-p", action='store_true', help="Print out values on terminal (does not store values)")
-    parser.add_argument("-a", "--area", type = int, default = 0, help="Specific area to request weather data")
-    parser.add_argument("-c", "--category", nargs=1, metavar=('cat_name'), help="Specific value/category of weather data to plot")
-    parser.add_argument("--date", help="Specific date to request weather data [YYYY-MM-DD format date]")
-    parser.add_argument("--time", help="Specific time to request weather data [HH time format]")
     parser.add_argument("-b", "--batch", action='store_true', help="Get each 10 min weather values for last hour")
     parser.add_argument("--batch_datetime", help="Specific date to request weather data in batch [YYYY-MM-DD-HH format datetime]")
+    parser.add_argument("--daemon", action='store_true', help="Stay resident and get the weather values every 10 min (catches up on missed slots)")
+    parser.add_argument("--backfill", nargs=2, metavar=('from_datetime','to_datetime'), help="Get every missing 10 min slot between 2 datetimes [YYYY-MM-DD-HH:MM format datetime] (resumes an interrupted run)")
+    parser.add_argument("--repair", action='store_true', help="Get only the 10 min slots that are missing (see the gap index) of the last days that AMEDAS still keeps, newest first")
     parser.add_argument("--plot_comp_week", action='store_true', help="Plot graphs that compare the weather of [1 day ago] vs [1 week ago].")
     parser.add_argument("--plot_comp_dates", nargs=2, metavar=('date_A','date_B'), help="Plot graphs that compare the weather of 2 different dates")
     parser.add_argument("--plot_comp_areas", nargs=2, metavar=('area_sn_A','area_sn_B'), help="Plot graphs that compare the weather of 2 different areas (ref. by short name)")
     parser.add_argument("--plot", default = '', help="Plot a category from Amedas Log file, use the name of the value for plotting (e.g. 'wind' , 'precipitation1h')")
     parser.add_argument("--plot_composite", nargs=2, metavar=('value_A','value_B'), help="Plot graph comparing 2 categories.")
     parser.add_argument("--plot_all_areas", action='store_true', help="Plot graph comparing all areas given category.")
-    args = parser.parse_args()
+    parser.add_argument("--plot_range", nargs=2, metavar=('date_first','date_last'), help="Plot a category (or the default ones) over a range of dates [YYYY-MM-DD format dates]")
+    parser.add_argument("--plot_range_composite", nargs=4, metavar=('value_A','value_B','date_first','date_last'), help="Plot graph comparing 2 categories over a range of dates")
+    parser.add_argument("--plot_range_areas", nargs=2, metavar=('date_first','date_last'), help="Plot graph comparing all areas for a category (or the default ones) over a range of dates")
+    parser.add_argument("--plot_everything", action='store_true', help="Plot every graph of the nightly run (default categories of each area, week comparison and all areas) in parallel")
+    parser.add_argument("--force_render", action='store_true', help="Plot graphs again even if their data did not change")
+    parser.add_argument("--compact", action='store_true', help="Merge the journal of the monthly log (of --date, or this month) into the log file")
+    parser.add_argument("--rollup", action='store_true', help="Build again the hourly/daily/monthly rollups of the month (of --date, or this month) from the monthly log if they do not match it (see --rebuild)")
+    parser.add_argument("--migrate", action='store_true', help="Convert every monthly log to the columnar store and check it point by point (see --workers, --rebuild)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of processes used by --migrate (default: one per CPU)")
+    parser.add_argument("--rebuild", action='store_true', help="With --migrate, create the columns of every month again. With --repair, build the gap index again from the logs first. With --rollup, build the rollups again even if they match the log")
+    parser.add_argument("--query", action='store_true', help="Print the stored points of some areas and variables between 2 datetimes (see --areas, --vars, --from, --to, --where, --format)")
+    addQueryArguments( parser )
+    parser.add_argument("--stations", action='store_true', help="Print the area_info entries of the stations selected with --near/--box")
+    parser.add_argument("--download", action='store_true', help="Get a new copy of the station table first (with --stations)")
+    addSubcommands( parser )
+    args = applySubcommand( parser, parser.parse_args() )
 
     # set now() - 10 minutes as default datetime 
     datetime_now_adjusted = dt.datetime.now() - dt.timedelta(minutes = 10)
@@ -61,7 +169,8 @@ def main():
 
     # set the entry datetime based on the arguments or the default values
     entry_datetime = entry_datetime = entry_date.strftime('%Y%m%d') + entry_time.strftime('%H%M')
-    print(f"Entry datetime -> {entry_datetime}")
+    # (the query rows go to stdout, so they can be piped to a file or another tool)
+    print(f"Entry datetime -> {entry_datetime}", file = sys.stderr if args.query else sys.stdout)
 
     # set the region for the weather data query
     if args.area != 0 :
@@ -78,6 +187,12 @@ def main():
     else:
         batch_datetime = ""
 
+    if args.force_render:
+        a_cfg.render_skip_unchanged = False
+
+    if args.archive:
+        a_cfg.archive_enabled = True
+
     # set the category/val for the plot
     if args.category:
         if( args.category[0] not in a_cfg.graph_amedas_dic ):
@@ -86,6 +201,35 @@ def main():
         else:
             cat_name = args.category[0]
 
+    # add the stations near a point / inside a box to the areas of this run
+    if( args.near or args.box or args.stations ):
+        import amedas_stations as a_sta
+        if( args.download ): a_sta.downloadStationTable()
+        stations = a_sta.loadStationTable()
+        station_grid = a_sta.StationGrid( stations )
+        station_codes = []
+        if( args.near ):
+            for distance, station_code in station_grid.nearest( args.near[0], args.near[1], args.near_n, cat_name or None ):
+                print(f"Station {station_code} {stations[station_code]['enName']} at {distance:.1f} km")
+                station_codes.append(station_code)
+        if( args.box ):
+            station_codes += [station_code for station_code in station_grid.inBox( *args.box, cat_name or None ) if station_code not in station_codes]
+        if( args.stations ):
+            a_sta.printAreaInfoEntries( a_sta.createAreaInfoEntries(stations, station_codes) )
+            return None
+        print(f"Added {len(a_sta.addStationAreas(stations, station_codes))} stations to the areas")
+
+    # load the modules of the selected option only
+    plot_mode = bool( args.plot or args.plot_composite or args.plot_comp_week or args.plot_comp_dates or args.plot_comp_areas or args.plot_all_areas or args.plot_everything or args.plot_range or args.plot_range_composite or args.plot_range_areas )
+    if( plot_mode ):
+        import amedas_plot_funcs as a_plt_fnc
+        import amedas_render as a_rnd
+        import amedas_manifest as a_mnf
+    elif( args.batch or args.backfill or args.repair or args.daemon ):
+        import amedas_fetch as a_fetch
+        import amedas_backfill as a_bkf
+        import amedas_daemon as a_dmn
+
     # Now, select ONLY one of the rest of the options
     if args.p:
         # get data from a given area at a given date/time
@@ -103,22 +247,43 @@ def main():
             # set the target date/time for the batch process (1 hour earlier than now() ) *default
             target_datetime = dt.datetime.now() - dt.timedelta(hours = 1)
             
-        for minute in range(6):
-            query_datetime = dt.datetime.strptime(target_datetime.strftime('%Y%m%d%H'+str(minute)+'0'), '%Y%m%d%H%M')
-            if( args.area != 0 ):
-                print(f"Time {query_datetime} and code {area_code}")
-                res = a_fnc.requestAndStoreSingleWeatherInfo( query_datetime, area_code )
-            else:
-                print(f"Time {query_datetime} for multiple area query")
-                res = a_fnc.requestAndStoreWeatherInfo( query_datetime )
-                print(f"Successfully retrieved data for {res} areas")
+        # fetch the 6 slots of the hour concurrently and then store them
+        query_datetimes = [dt.datetime.strptime(target_datetime.strftime('%Y%m%d%H'+str(minute)+'0'), '%Y%m%d%H%M') for minute in range(6)]
+        # slots already stored for every area are not downloaded again
+        missing_datetimes = a_bkf.filterMissingSlots( query_datetimes, [area_code] if args.area != 0 else [areacd for areacd in a_cfg.area_info if areacd != 'common'] )
+        if( len(missing_datetimes) < len(query_datetimes) ): print(f"{len(query_datetimes) - len(missing_datetimes)} of the {len(query_datetimes)} slots are already stored")
+        query_datetimes = missing_datetimes
+        if( not query_datetimes ): return None
+        if( args.area != 0 ):
+            print(f"Time {query_datetimes[0]} to {query_datetimes[-1]} and code {area_code}")
+            res = a_fetch.requestAndStoreWeatherInfoBatch( query_datetimes, area_code )
+        else:
+            print(f"Time {query_datetimes[0]} to {query_datetimes[-1]} for multiple area query")
+            res = a_fetch.requestAndStoreWeatherInfoBatch( query_datetimes )
+        for query_datetime, success_cnt in res.items():
+            print(f"Successfully retrieved data for {success_cnt} areas @ {query_datetime}")
+    elif args.repair:
+        print(f"Repair result: {a_bkf.repairWeatherGaps( area_code if args.area != 0 else 0, args.debuginfo, args.rebuild )}")
+    elif args.daemon:
+        a_dmn.runCollectorDaemon( area_code if args.area != 0 else 0, args.debuginfo )
+    elif args.backfill:
+        try:
+            # try to get the values from the arguments
+            from_datetime, to_datetime = [dt.datetime.strptime(backfill_arg, '%Y-%m-%d-%H:%M') for backfill_arg in args.backfill]
+        except ValueError as e:
+            print(f"Error: {e} -> Try something like --backfill 2023-11-01-00:00 2023-11-02-23:50")
+            return ''
+        if( args.area != 0 ):
+            res = a_bkf.backfillWeatherInfo( from_datetime, to_datetime, area_code, args.debuginfo )
+        else:
+            res = a_bkf.backfillWeatherInfo( from_datetime, to_datetime, debugprint = args.debuginfo )
+        print(f"Backfill result: {res}")
     elif args.plot:
         # Plot a single scatter graph of a certain category values from a Amedas Json file
         # By default, use a 1-hour before now() setting to avoid blank graphs at the beggining of the day
         check_date = (dt.datetime.now() - dt.timedelta(hours = 1)).strftime('%Y-%m-%d')
-        logfile = a_fnc.buildPathFromDate( target_datetime = check_date, target = "l", area_code = area_code )
         graph_path = a_fnc.buildPathFromDate( target_datetime = check_date, target = "g", area_code = area_code )
-        plotres = a_plt_fnc.plotAmedasSingleScatter( data_fname=logfile, val_name=args.plot, date_key=check_date, plot_save_path=graph_path, area_code = area_code )
+        plotres = a_plt_fnc.plotAmedasSingleScatter( val_name=args.plot, date_key=check_date, plot_save_path=graph_path, area_code = area_code )
         print(f"Plot result for {args.plot} from ({check_date}) was: {plotres}   ({dt.datetime.now().strftime('%Y-%m-%d %H:%M')})")
     elif args.plot_composite:
         try:
@@ -130,9 +295,8 @@ def main():
         # Plot a comparison scatter graph of values from 2 categories from a Amedas Json file
         # By default, use a 1-hour before now() setting to avoid blank graphs at the beggining of the day
         check_date = (dt.datetime.now() - dt.timedelta(hours = 1)).strftime('%Y-%m-%d')
-        logfile = a_fnc.buildPathFromDate( target_datetime = check_date, target = "l", area_code = area_code )
         graph_path = a_fnc.buildPathFromDate( target_datetime = check_date, target = "g", area_code = area_code )
-        plotres = a_plt_fnc.plotAmedasCompositeScatter( data_fname=logfile, val_name_A=value_A, val_name_B=value_B, date_key=check_date, plot_save_path=graph_path, area_code = area_code )
+        plotres = a_plt_fnc.plotAmedasCompositeScatter( val_name_A=value_A, val_name_B=value_B, date_key=check_date, plot_save_path=graph_path, area_code = area_code )
         print(f"Plot result for {args.plot_composite} from ({check_date}) was: {plotres}   ({dt.datetime.now().strftime('%Y-%m-%d %H:%M')})")
     elif args.plot_comp_week:
         lst_date = (dt.datetime.now() - dt.timedelta(days = a_cfg.ndays_timedelta_lst)).strftime('%Y-%m-%d')  #yesterday
@@ -143,11 +307,8 @@ def main():
             plotres = a_plt_fnc.plotAmedasCompareScatter_2dates( val_name=cat_name, date_key_prv=prv_date, date_key_lst=lst_date, plot_save_path=graph_path, area_code = area_code )
             print(f"Plot result for {cat_name} was: {plotres}   ({dt.datetime.now().strftime('%Y-%m-%d %H:%M')})")
         else:
-            #plot a comparison scatter graph of the default categories from an Amedas Json file
-            for def_cat in a_cfg.graph_amedas_defcats :
-                # Plot all the default categories 1 by 1
-                plotres = a_plt_fnc.plotAmedasCompareScatter_2dates( val_name=def_cat, date_key_prv=prv_date, date_key_lst=lst_date, plot_save_path=graph_path, area_code = area_code )
-                print(f"Plot result for {def_cat} was: {plotres}   ({dt.datetime.now().strftime('%Y-%m-%d %H:%M')})")
+            #plot a comparison scatter graph of the default categories from an Amedas Json file (in parallel)
+            a_rnd.printRenderResults( a_rnd.runRenderJobs( a_rnd.buildDefaultCategoryJobs('comp_dates', [area_code], [prv_date, lst_date]) ) )
 
     elif args.plot_comp_dates:
         try:
@@ -165,11 +326,8 @@ def main():
             plotres = a_plt_fnc.plotAmedasCompareScatter_2dates( val_name=cat_name, date_key_prv=prv_date, date_key_lst=lst_date, plot_save_path=graph_path, area_code = area_code )
             print(f"Plot result for (cat_name) was: {plotres}   ({dt.datetime.now().strftime('%Y-%m-%d %H:%M')})")
         else:
-            #plot a comparison scatter graph of the default categories from an Amedas Json file
-            for def_cat in a_cfg.graph_amedas_defcats :
-                # Plot all the default categories 1 by 1
-                plotres = a_plt_fnc.plotAmedasCompareScatter_2dates( val_name=def_cat, date_key_prv=prv_date, date_key_lst=lst_date, plot_save_path=graph_path, area_code = area_code )
-                print(f"Plot result for {def_cat} was: {plotres}   ({dt.datetime.now().strftime('%Y-%m-%d %H:%M')})")
+            #plot a comparison scatter graph of the default categories from an Amedas Json file (in parallel)
+            a_rnd.printRenderResults( a_rnd.runRenderJobs( a_rnd.buildDefaultCategoryJobs('comp_dates', [area_code], [prv_date, lst_date]) ) )
 
     elif args.plot_comp_areas:
         try:
@@ -195,11 +353,8 @@ def main():
             plotres = a_plt_fnc.plotAmedasCompareScatter_2areas( val_name=cat_name, area_code_A=area_A, area_code_B=area_B, date_key=check_date, plot_save_path=graph_path )
             print(f"Plot result for {cat_name} was: {plotres}   ({dt.datetime.now().strftime('%Y-%m-%d %H:%M')})")
         else:
-            #plot a comparison scatter graph of the default categories from an Amedas Json file
-            for def_cat in a_cfg.graph_amedas_defcats :
-                # Plot all the default categories 1 by 1
-                plotres = a_plt_fnc.plotAmedasCompareScatter_2areas( val_name=def_cat, area_code_A=area_A, area_code_B=area_B, date_key=check_date, plot_save_path=graph_path )
-                print(f"Plot result for {def_cat} was: {plotres}   ({dt.datetime.now().strftime('%Y-%m-%d %H:%M')})")
+            #plot a comparison scatter graph of the default categories from an Amedas Json file (in parallel)
+            a_rnd.printRenderResults( a_rnd.runRenderJobs( a_rnd.buildDefaultCategoryJobs('comp_areas', [area_A, area_B], [check_date]) ) )
 
     elif args.plot_all_areas:
         # By default, use a 1-hour before now() setting to avoid blank graphs at the beggining of the day
@@ -210,15 +365,82 @@ def main():
             plotres = a_plt_fnc.plotAmedasCompareScatter_Allareas( val_name=cat_name, date_key=check_date, plot_save_path=graph_path )
             print(f"Plot result for {cat_name} was: {plotres}   ({dt.datetime.now().strftime('%Y-%m-%d %H:%M')})")
         else:
-            #plot a comparison scatter graph of the default categories from an Amedas Json file
-            for def_cat in a_cfg.graph_amedas_defcats :
-                # Plot all the default categories 1 by 1
-                plotres = a_plt_fnc.plotAmedasCompareScatter_Allareas( val_name=def_cat, date_key=check_date, plot_save_path=graph_path )
-                print(f"Plot result for {def_cat} was: {plotres}   ({dt.datetime.now().strftime('%Y-%m-%d %H:%M')})")
+            #plot a comparison scatter graph of the default categories from an Amedas Json file (in parallel)
+            a_rnd.printRenderResults( a_rnd.runRenderJobs( a_rnd.buildDefaultCategoryJobs('all_areas', [], [check_date]) ) )
 
+    elif( args.plot_range or args.plot_range_composite or args.plot_range_areas ):
+        try:
+            # check the dates of the range (the last 2 values)
+            range_dates = (args.plot_range or args.plot_range_composite or args.plot_range_areas)[-2:]
+            for range_date in range_dates: dt.datetime.strptime( range_date, '%Y-%m-%d')
+        except ValueError as e:
+            print(f"Error: {e} -> Try something like --plot_range 2023-06-01 2023-08-31")
+            return ''
+        if( args.plot_range_composite ):
+            range_jobs = [('range_composite', [area_code], tuple(args.plot_range_composite[:2]), range_dates)]
+        else:
+            range_kind, range_areas = ('range_single', [area_code]) if args.plot_range else ('range_areas', [])
+            range_jobs = [(range_kind, range_areas, cat_name, range_dates)] if cat_name else a_rnd.buildDefaultCategoryJobs( range_kind, range_areas, range_dates )
+        a_rnd.printRenderResults( a_rnd.runRenderJobs( range_jobs ) )
+    elif args.migrate:
+        import amedas_migrate as a_mig
+        summary, results = a_mig.migrateMonthLogs( args.workers, args.rebuild, debugprint = args.debuginfo )
+        print(f"Migration result: {summary}")
+    elif args.query:
+        import amedas_query as a_qry
+        # areas can be given by code or by short name
+        short_names = {a_cfg.area_info[areacd]['short_name']:areacd for areacd in a_cfg.area_info if areacd != 'common'}
+        query_areas = [short_names.get(query_area, query_area) for query_area in args.areas] if args.areas else list(short_names.values())
+        query_vars = args.vars or list(a_cfg.graph_amedas_dic.keys())
+        try:
+            if( not args.from_datetime ): raise ValueError("the first datetime of the query is required")
+            from_datetime = a_qry.parseQueryDatetime( args.from_datetime )
+            to_datetime = a_qry.parseQueryDatetime( args.to_datetime, end_of_day = True ) if args.to_datetime else dt.datetime.now()
+            for query_var in query_vars:
+                if( query_var not in a_cfg.graph_amedas_dic ): raise ValueError(f"variable {query_var} not valid, use one of {list(a_cfg.graph_amedas_dic)}")
+            # any other message goes to stderr
+            query_out = sys.stdout
+            with contextlib.redirect_stdout( sys.stderr ):
+                row_cnt = a_qry.writeQueryRows( query_out, query_areas, query_vars, from_datetime, to_datetime, args.where, args.query_format )
+        except BrokenPipeError:
+            # the reader of the output is gone (e.g. | head), nothing else to do
+            sys.stdout = None
+            return None
+        except ValueError as e:
+            print(f"Error: {e} -> Try something like query --areas mito --vars temp humidity --from 2023-08-01 --to 2023-08-31 --where temp>30")
+            return ''
+        print(f"{row_cnt} rows", file = sys.stderr)
+    elif args.plot_everything:
+        a_rnd.printRenderResults( a_rnd.runRenderJobs( a_rnd.buildNightlyRenderJobs() ) )
+    elif args.compact:
+        compact_codes = [area_code] if args.area != 0 else [areacd for areacd in a_cfg.area_info if areacd != 'common']
+        for compact_code in compact_codes:
+            logfile = a_fnc.buildPathFromDate( target_datetime = entry_date.strftime('%Y-%m-%d'), target = "l", area_code = compact_code )
+            print(f"Compact result for {logfile} was: {a_fnc.compactWeatherLog( logfile, args.debuginfo )}")
+    elif args.rollup:
+        import amedas_rollup as a_rlp
+        rollup_codes = [area_code] if args.area != 0 else [areacd for areacd in a_cfg.area_info if areacd != 'common']
+        for rollup_code in rollup_codes:
+            if( args.rebuild ):
+                points_cnt = a_rlp.rebuildMonthRollups( rollup_code, entry_date, args.debuginfo )
+            else:
+                points_cnt = a_rlp.repairMonthRollups( rollup_code, entry_date, args.debuginfo )
+            if( points_cnt is None ):
+                print(f"Rollups of {rollup_code} for {entry_date.strftime('%Y-%m')} are up to date")
+            else:
+                print(f"Rollups of {rollup_code} for {entry_date.strftime('%Y-%m')} rebuilt from {points_cnt} points")
     else:
-        # Default mode
-        res = a_fnc.requestAndStoreWeatherInfo()
+        # Default mode (download the map only if the latest published slot is not stored yet)
+        if( a_cfg.latest_time_check ):
+            import amedas_fetch as a_fetch
+            res = a_fetch.requestAndStoreLatestWeatherInfo()
+        else:
+            res = a_fnc.requestAndStoreWeatherInfo()
+
+    # keep track of the graphs rendered by the single plot options too
+    if( plot_mode and (a_mnf.saveRenderManifest() or a_mnf.getRenderStats()['skipped']) ): print(f"Render stats: {a_mnf.getRenderStats()}")
+    if( args.debuginfo ): print(f"Log cache stats: {a_fnc.getLogCacheStats()}")
+    if( args.debuginfo ): print(f"Stage timings: " + ", ".join(f"{stage}:{timer['count']}x{timer['sum']/timer['count']*1000:.2f}ms" for stage, timer in a_met.getMetricsSummary()[0].items()))
 
 if __name__ == '__main__':
     sys.exit(main())
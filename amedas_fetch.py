@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import http.client
+import gzip
+import json
+import os.path
+import threading
+import time
+import datetime as dt
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+import amedas_config as a_cfg
+import amedas_funcs as a_fnc
+import amedas_metrics as a_met
+
+
+# Pool of HTTP/1.1 keep-alive connections, so consecutive requests to the same server reuse the TLS session
+# The number of connections (and requests in flight) is bounded by max_inflight
+class AmedasConnectionPool:
+    def __init__( self, max_inflight = a_cfg.fetch_max_inflight, timeout = a_cfg.fetch_timeout ):
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(max_inflight)
+        self.lock = threading.Lock()
+        self.idle_conns = {}
+        self.conn_count = 0
+        self.request_count = 0
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *exc_info ):
+        self.close()
+
+    # take an idle connection to the server or open a new one
+    def acquire( self, scheme, netloc ):
+        with self.lock:
+            idle = self.idle_conns.get((scheme, netloc))
+            if( idle ): return idle.pop()
+        return self.connect(scheme, netloc)
+
+    # open a new connection to the server
+    def connect( self, scheme, netloc ):
+        with self.lock:
+            self.conn_count += 1
+        if( scheme == 'https' ):
+            return http.client.HTTPSConnection(netloc, timeout = self.timeout)
+        return http.client.HTTPConnection(netloc, timeout = self.timeout)
+
+    # give the connection back so the next request can reuse it
+    def release( self, scheme, netloc, conn ):
+        with self.lock:
+            self.idle_conns.setdefault((scheme, netloc), []).append(conn)
+
+    # GET the url and return (status, headers, body), the body is already gunzipped
+    # raises OSError/http.client.HTTPException if the server cannot be reached
+    def get( self, url, headers = None ):
+        url_parts = urlsplit(url)
+        path = url_parts.path + ('?' + url_parts.query if url_parts.query else '')
+        req_headers = {'Accept-Encoding':'gzip', 'Connection':'keep-alive'}
+        if( headers ): req_headers.update(headers)
+        with self.slots:
+            with self.lock:
+                self.request_count += 1
+            # an idle connection could have been closed by the server, so give it one more try with a new one
+            # (not another idle one, that could be as stale as the first)
+            for attempt in range(2):
+                if( attempt == 0 ):
+                    conn = self.acquire(url_parts.scheme, url_parts.netloc)
+                else:
+                    conn = self.connect(url_parts.scheme, url_parts.netloc)
+                try:
+                    conn.request('GET', path, headers = req_headers)
+                    response = conn.getresponse()
+                    body = response.read()
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    if( attempt == 1 ): raise
+                    continue
+                if( response.will_close ):
+                    conn.close()
+                else:
+                    self.release(url_parts.scheme, url_parts.netloc, conn)
+                if( response.getheader('Content-Encoding', '') == 'gzip' ): body = gzip.decompress(body)
+                return response.status, response.headers, body
+
+    # close all the idle connections
+    def close( self ):
+        with self.lock:
+            for conns in self.idle_conns.values():
+                for conn in conns: conn.close()
+            self.idle_conns = {}
+
+
+# Spread the start of the requests so no more than max_rate requests are started per second
+class RateLimiter:
+    def __init__( self, max_rate = a_cfg.backfill_rate_limit ):
+        self.interval = 1.0 / max_rate if max_rate else 0.0
+        self.lock = threading.Lock()
+        self.next_start = 0.0
+
+    def wait( self ):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        if( start > now ): time.sleep(start - now)
+
+
+# Request the map data of a given datetime using the connection pool, same results as amedas_funcs.requestWeatherData
+def requestWeatherDataPooled( pool, target_datetime, area_code = 0, request_mode = 's', area_codes = None ):
+    req_url = a_fnc.createRequestUrlFromDatetime(target_datetime)
+    a_met.addCount('requests')
+    fetch_start = time.perf_counter()
+    try:
+        status, headers, body = pool.get(req_url)
+    except (OSError, http.client.HTTPException) as e:
+        print(f"URL ERROR... reason: {e} \n url: {req_url}")
+        a_met.addCount('request_errors')
+        return {}
+    if( status != 200 ):
+        print(f"HTTP ERROR... (date/time too early or future?) code: {status} \n url: {req_url}")
+        a_met.addCount('request_errors')
+        return {}
+    a_met.observe('fetch', time.perf_counter() - fetch_start)
+    a_met.addCount('response_bytes', len(body))
+    try:
+        with a_met.timed('parse'):
+            return a_fnc.parseWeatherResponse( body, area_code, request_mode, area_codes )
+    except ValueError as e:
+        print(f"Error: {e} -> response is not valid JSON \n url: {req_url}")
+        return {}
+
+
+# Request the map data for several datetimes at the same time (bounded by max_inflight)
+# returns a dict {target_datetime: weather_data} where failed requests have an empty dict
+# by default only the configured areas are parsed, use request_mode = 'f' to get all the areas
+def fetchWeatherDataBatch( target_datetimes, max_inflight = a_cfg.fetch_max_inflight, pool = None, rate_limiter = None, request_mode = 's', area_codes = None ):
+    own_pool = pool is None
+    if( own_pool ): pool = AmedasConnectionPool( max_inflight = max_inflight )
+    def fetchOne( target_datetime ):
+        if( rate_limiter ): rate_limiter.wait()
+        return requestWeatherDataPooled(pool, target_datetime, request_mode = request_mode, area_codes = area_codes)
+    try:
+        with ThreadPoolExecutor( max_workers = max_inflight ) as executor:
+            results = executor.map( fetchOne, target_datetimes )
+            weather_batch = dict(zip(target_datetimes, results))
+    finally:
+        if( own_pool ): pool.close()
+    return weather_batch
+
+
+# Get the first slot of the point file (3 hours) that has a given slot
+def getPointBlockStart( slot ):
+    return slot.replace(hour = slot.hour - slot.hour % 3, minute = 0, second = 0, microsecond = 0)
+
+
+# Create the URL of the point file of an area for the 3 hours starting at block_start
+def createPointUrl( area_code, block_start ):
+    return a_cfg.point_url_format.replace(a_cfg.replace_target_areacode, str(area_code)).replace(a_cfg.point_replace_target, block_start.strftime('%Y%m%d_%H'))
+
+
+# Put the JSON of a point file ({"YYYYMMDDHHMMSS": datapoint, ...}) on a dictionary {slot datetime: datapoint}
+def parsePointResponse( raw_response ):
+    point_data = json.loads(raw_response.decode("utf-8"))
+    return {dt.datetime.strptime(time_key, '%Y%m%d%H%M%S'):datapoint for time_key, datapoint in point_data.items() if type(datapoint) is dict}
+
+
+# Request the point file of an area using the connection pool, returns {slot datetime: datapoint} (empty if it failed)
+def requestPointDataPooled( pool, area_code, block_start ):
+    req_url = createPointUrl( area_code, block_start )
+    a_met.addCount('point_requests')
+    fetch_start = time.perf_counter()
+    try:
+        status, headers, body = pool.get(req_url)
+    except (OSError, http.client.HTTPException) as e:
+        print(f"URL ERROR... reason: {e} \n url: {req_url}")
+        a_met.addCount('request_errors')
+        return {}
+    if( status != 200 ):
+        print(f"HTTP ERROR... (date/time too early or future?) code: {status} \n url: {req_url}")
+        a_met.addCount('request_errors')
+        return {}
+    a_met.observe('point_fetch', time.perf_counter() - fetch_start)
+    a_met.addCount('response_bytes', len(body))
+    try:
+        return parsePointResponse( body )
+    except ValueError as e:
+        print(f"Error: {e} -> response is not a valid point file \n url: {req_url}")
+        return {}
+
+
+# Check if the point files should be used for some areas (None = the configured ones): only for a few areas,
+# as each point file has one area (but 18 slots), and never when the full map responses are archived
+def usePointFiles( area_codes = None ):
+    if( area_codes is None ): area_codes = [areacd for areacd in a_cfg.area_info if areacd != 'common']
+    return a_cfg.point_fetch_enabled and not a_cfg.archive_enabled and 0 < len(area_codes) <= a_cfg.point_max_areas
+
+
+# Request the point files of some areas for several datetimes at the same time (one request per area and 3 hours)
+# returns a dict {target_datetime: weather_data} as fetchWeatherDataBatch, with only the given areas in weather_data
+# each area is decided on its own: an area whose file was received and reaches the slot has its point (or is left out if
+# the file does not have the slot, as the map does for a station that did not report), an area whose file failed (e.g. 404)
+# or does not reach the slot yet is None (unknown: not stored and not taken as missing, so it is fetched again later)
+# Note: the points of a point file have some fields the map does not have (e.g. the time of the max temp of the day),
+# they are stored as they come, only the variables of graph_amedas_dic are in the columnar store and the plots
+def fetchPointDataBatch( target_datetimes, area_codes, max_inflight = a_cfg.fetch_max_inflight, pool = None, rate_limiter = None ):
+    slots = [dt.datetime.strptime(a_fnc.adjustDateTimeForURL(target_datetime), '%Y%m%d%H%M') for target_datetime in target_datetimes]
+    point_requests = sorted(set((area_code, getPointBlockStart(slot)) for slot in slots for area_code in area_codes))
+    own_pool = pool is None
+    if( own_pool ): pool = AmedasConnectionPool( max_inflight = max_inflight )
+    def fetchOne( point_request ):
+        if( rate_limiter ): rate_limiter.wait()
+        return requestPointDataPooled( pool, *point_request )
+    try:
+        with ThreadPoolExecutor( max_workers = max_inflight ) as executor:
+            point_blocks = dict(zip(point_requests, executor.map( fetchOne, point_requests )))
+    finally:
+        if( own_pool ): pool.close()
+    weather_batch = {}
+    for target_datetime, slot in zip(target_datetimes, slots):
+        weather_data = {}
+        for area_code in area_codes:
+            block = point_blocks[(area_code, getPointBlockStart(slot))]
+            if( not block or max(block) < slot ):
+                weather_data[area_code] = None
+            elif( slot in block ):
+                weather_data[area_code] = block[slot]
+        weather_batch[target_datetime] = weather_data if any(weather_data.values()) else {}
+    return weather_batch
+
+
+# Request several datetimes of some areas (None = the configured ones) from the point files or the map (see usePointFiles)
+# returns a dict {target_datetime: weather_data}, ready to be stored with addWeatherValueEntries
+def fetchSlotsBatch( target_datetimes, area_codes = None, max_inflight = a_cfg.fetch_max_inflight, pool = None, rate_limiter = None ):
+    if( usePointFiles(area_codes) ):
+        if( area_codes is None ): area_codes = [areacd for areacd in a_cfg.area_info if areacd != 'common']
+        return fetchPointDataBatch( target_datetimes, area_codes, max_inflight, pool, rate_limiter )
+    return fetchWeatherDataBatch( target_datetimes, max_inflight, pool, rate_limiter, request_mode = a_fnc.getStoreRequestMode(), area_codes = area_codes )
+
+
+# Split a list of slots in chunks to fetch one after the other (e.g. to save a checkpoint after each one)
+# with the point files, the slots of the same 3 hours always go in the same chunk, so no file is requested twice
+def splitSlotChunks( slots, area_codes = None, max_inflight = a_cfg.fetch_max_inflight ):
+    if( not usePointFiles(area_codes) ):
+        chunk_size = max_inflight * 4
+        return [slots[chunk_start:chunk_start + chunk_size] for chunk_start in range(0, len(slots), chunk_size)]
+    chunks, chunk_blocks = [], set()
+    for slot in slots:
+        block_start = getPointBlockStart(slot)
+        if( not chunks or (block_start not in chunk_blocks and len(chunk_blocks) >= max_inflight) ):
+            chunks.append([])
+            chunk_blocks = set()
+        chunks[-1].append(slot)
+        chunk_blocks.add(block_start)
+    return chunks
+
+
+# Concurrent version of the batch request-and-add-entry: fetch all the slots at once and then store them one by one
+# returns a dict {target_datetime: number of areas stored}
+def requestAndStoreWeatherInfoBatch( target_datetimes, area_code = 0, debugprint = True, max_inflight = a_cfg.fetch_max_inflight, pool = None ):
+    area_codes = [area_code] if area_code else None
+    weather_batch = fetchSlotsBatch( target_datetimes, area_codes, max_inflight, pool )
+    success_cnts = {}
+    for target_datetime, weather_data in weather_batch.items():
+        if( weather_data ):
+            commit_info = a_fnc.addWeatherValueEntries( weather_data, area_codes, target_datetime, debugprint )
+            success_cnts[target_datetime] = len(commit_info['stored'])
+        else:
+            if( debugprint == True) : print(f"ERROR: Not able to get data for the registered areas @ ({target_datetime})")
+            success_cnts[target_datetime] = 0
+    return success_cnts
+
+
+# Parse the content of the latest time file (e.g. 2024-01-01T10:20:00+09:00) to a datetime of the JMA time zone (naive, as the rest)
+def parseLatestTime( latest_text ):
+    latest_time = dt.datetime.fromisoformat( latest_text.strip() )
+    if( latest_time.tzinfo is not None ): latest_time = latest_time.astimezone( dt.timezone(dt.timedelta(hours = 9)) ).replace(tzinfo = None)
+    return latest_time
+
+
+# Load the state of the latest time requests {'latest_time', 'etag', 'last_modified'} (empty values if there is none)
+def loadLatestTimeState( state_path = "" ):
+    if( not state_path ): state_path = a_cfg.latest_time_state
+    latest_state = {'latest_time':'', 'etag':'', 'last_modified':''}
+    if( os.path.exists(state_path) ):
+        try:
+            with open(state_path, 'r') as state_file:
+                latest_state.update(json.load(state_file))
+        except ValueError as e:
+            print(f"Error: {e} -> latest time state {state_path} is not valid, starting from scratch")
+    return latest_state
+
+
+# Write the state of the latest time requests (temp file + rename)
+def saveLatestTimeState( latest_state, state_path = "" ):
+    if( not state_path ): state_path = a_cfg.latest_time_state
+    os.makedirs( os.path.dirname(state_path), exist_ok = True )
+    with open(state_path + '.tmp', 'w') as state_file:
+        json.dump(latest_state, state_file)
+    os.replace(state_path + '.tmp', state_path)
+
+
+# Ask for the latest published slot, with a conditional request based on the previous answer kept in latest_state (updated here)
+# returns the datetime of the slot, or None if it could not be known (then the caller can fall back to the clock)
+def requestLatestTime( pool, latest_state ):
+    cond_headers = {}
+    if( latest_state.get('etag') ): cond_headers['If-None-Match'] = latest_state['etag']
+    if( latest_state.get('last_modified') ): cond_headers['If-Modified-Since'] = latest_state['last_modified']
+    a_met.addCount('latest_time_requests')
+    try:
+        with a_met.timed('latest_time'):
+            status, headers, body = pool.get( a_cfg.latest_time_url, cond_headers )
+    except (OSError, http.client.HTTPException) as e:
+        print(f"URL ERROR... reason: {e} \n url: {a_cfg.latest_time_url}")
+        return None
+    if( status == 304 and latest_state.get('latest_time') ):
+        a_met.addCount('latest_time_not_modified')
+        return dt.datetime.strptime(latest_state['latest_time'], '%Y-%m-%d %H:%M')
+    if( status != 200 ):
+        print(f"HTTP ERROR... code: {status} \n url: {a_cfg.latest_time_url}")
+        return None
+    try:
+        latest_time = parseLatestTime( body.decode("utf-8") )
+    except ValueError as e:
+        print(f"Error: {e} -> latest time {body[:40]} is not valid \n url: {a_cfg.latest_time_url}")
+        return None
+    latest_state['latest_time'] = latest_time.strftime('%Y-%m-%d %H:%M')
+    latest_state['etag'] = headers.get('ETag', '')
+    latest_state['last_modified'] = headers.get('Last-Modified', '')
+    return latest_time
+
+
+# Default run with the latest time check: ask which slot is the latest published one and download its map
+# only if it is not stored yet (for all the configured areas). Falls back to the slot of the clock if the latest time is not known
+# returns the number of areas stored (0 if the slot was already there)
+def requestAndStoreLatestWeatherInfo( debugprint = True, state_path = "" ):
+    import amedas_backfill as a_bkf
+    area_codes = [areacd for areacd in a_cfg.area_info if areacd != 'common']
+    latest_state = loadLatestTimeState( state_path )
+    with AmedasConnectionPool( max_inflight = 1 ) as pool:
+        latest_time = requestLatestTime( pool, latest_state )
+        if( latest_time is None ):
+            print("Latest time not known, using the slot of the clock")
+            return a_fnc.requestAndStoreWeatherInfo( debugprint = debugprint )
+        saveLatestTimeState( latest_state, state_path )
+        if( not a_bkf.filterMissingSlots( [latest_time], area_codes ) ):
+            if( debugprint == True) : print(f"Latest slot {latest_time} is already stored, nothing to download")
+            return 0
+        weather_data = fetchSlotsBatch( [latest_time], area_codes, pool = pool )[latest_time]
+    if( debugprint == True) : print(f"Got data for {len(weather_data)} areas @ ({latest_time})...")
+    if( not weather_data ): return 0
+    return len(a_fnc.addWeatherValueEntries( weather_data, area_codes, latest_time, debugprint )['stored'])
+
+#----EOF--------------------------------------------------------
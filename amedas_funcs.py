@@ -2,11 +2,19 @@
 #!/usr/bin/env python3
 
 import os.path
+import sys
+import time
 from urllib.request import urlopen
 from urllib.error import URLError, HTTPError
 import datetime as dt
 import json
+import re
+from collections import OrderedDict
 import amedas_config as a_cfg
+import amedas_record as a_rec
+import amedas_metrics as a_met
+
+json_decoder = json.JSONDecoder()
 
 # Note: seems like past data on AMEDAS is only available for the 10 days previous to current day
 # Note: need to adjust the datetime to the closest 10min interval (round down?) when building the URL as the amedas API only work in 10min intervals
@@ -71,97 +79,429 @@ def buildPathFromDate( target_datetime = "", target = "", area_code = '' ):
         return "ERROR: target not supported!!! use either 'g' for graph or 'l' for log path, and use a valid area code"
 
 
+# Members of the top level object of a map response, for extractAreasFromResponse: the key, and the value
+# if it is an object with no nested objects (every area), with the separator that follows it
+json_ws = r'[ \t\n\r]*'
+json_string = r'"([^"\\]*(?:\\.[^"\\]*)*)"'
+json_flat_object = r'\{[^{}"]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^{}"]*)*\}'
+json_member_re = re.compile(json_ws + json_string + json_ws + ':' + json_ws + '(?:(' + json_flat_object + ')' + json_ws + '([,}]))?')
+json_separator_re = re.compile(json_ws + '([,}])')
+json_object_start_re = re.compile(json_ws + r'\{' + json_ws)
+
+
+# Get the values of only some areas from the raw text of a map response, without building the dict of the other ~1300 areas
+# The top level object is walked member by member, so a key inside the value of an area is never taken for an area,
+# and only the values of the requested areas are decoded (raw_decode from the brace of the value).
+# The values of the other areas are only checked to be flat objects (not decoded), for a valid response the result is
+# the same as json.loads (the last occurrence of a key wins, areas that are not in the response are not in the result either),
+# and a truncated response or one with trailing data raises ValueError like json.loads does
+def extractAreasFromResponse( response_text, area_codes ):
+    wanted_keys = set(str(area_code) for area_code in area_codes)
+    weather_info = {}
+    match = json_object_start_re.match(response_text)
+    if( not match ): raise ValueError("map response is not a JSON object")
+    pos = match.end()
+    if( response_text.startswith('}', pos) ):
+        pos += 1
+    else:
+        while( True ):
+            match = json_member_re.match(response_text, pos)
+            if( not match ): raise ValueError(f"map response is truncated or malformed at char {pos}")
+            key = match.group(1)
+            if( '\\' in key ): key = json.loads('"' + key + '"')
+            if( match.group(2) is not None ):
+                if( key in wanted_keys ): weather_info[key] = json_decoder.raw_decode(response_text, match.start(2))[0]
+                separator, pos = match.group(3), match.end()
+            else:
+                # not a flat object (or the response ends inside it): decode it to check it
+                value, pos = json_decoder.raw_decode(response_text, match.end())
+                if( key in wanted_keys ): weather_info[key] = value
+                match = json_separator_re.match(response_text, pos)
+                if( not match ): raise ValueError(f"map response is truncated or malformed at char {pos}")
+                separator, pos = match.group(1), match.end()
+            if( separator == '}' ): break
+    if( response_text[pos:].strip(' \t\n\r') ): raise ValueError(f"map response has extra data at char {pos}")
+    return weather_info
+
+
+# Put the JSON result of a map request on a dictionary
+# request_mode = 'f' for all areas, 'a' for only one area, or 's' for only the selected areas (configured areas by default)
+def parseWeatherResponse( raw_response, area_code = 0, request_mode = 'f', area_codes = None ):
+    if( request_mode == 'a' ):
+        # use the dafault area code unless specified
+        if( not area_code ): area_code = a_cfg.area_code_def 
+        raw_data = extractAreasFromResponse( raw_response.decode("utf-8"), [area_code] )
+        if( area_code in raw_data ):
+            weather_info = raw_data[area_code]
+            print(f"Data for {a_cfg.area_info[area_code]['name']} ({a_cfg.area_info[area_code]['japanese_name']})")
+        else:
+            weather_info = "NAN"
+    elif( request_mode == 's' ):
+        if( area_codes is None ): area_codes = [areacd for areacd in a_cfg.area_info if areacd != 'common']
+        weather_info = extractAreasFromResponse( raw_response.decode("utf-8"), area_codes )
+    elif( request_mode == 'f' ):
+        weather_info = json.loads(raw_response.decode("utf-8"))
+    else:
+        print(f"Mode not supported ")
+        weather_info = {}
+    return weather_info
+
+
 # Request weather data from created URL and put the JSON result, if valid, on a dictionary.
-# Use request_mode = 'f' for full batch mode, and request_mode = 'a' for an specific area
-def requestWeatherData( target_datetime = "", area_code = 0, request_mode = 'f' ):
+# Use request_mode = 'f' for full batch mode, request_mode = 'a' for an specific area, and request_mode = 's' for the selected areas
+def requestWeatherData( target_datetime = "", area_code = 0, request_mode = 'f', area_codes = None ):
     # check the date & time parameter first
     if( isinstance(target_datetime, dt.datetime) ):
         req_url = createRequestUrlFromDatetime(target_datetime)
     else:
         req_url = createRequestUrlFromString(target_datetime)
     # lets try and see if we can actually get a result from the server
+    a_met.addCount('requests')
+    fetch_start = time.perf_counter()
     try:
         weather_response = urlopen(req_url)
+        raw_response = weather_response.read()
     except HTTPError as e:
         print(f"HTTP ERROR... (date/time too early or future?) code: {e.code} \n url: {req_url}")
+        a_met.addCount('request_errors')
         weather_info = {}
     except URLError as e:
         print(f"URL ERROR... reason: {e.reason} \n url: {req_url}")
+        a_met.addCount('request_errors')
         weather_info = {}
     else:
-        raw_data = json.loads(weather_response.read().decode("utf-8"))
-        if( request_mode == 'a' ):
-            # use the dafault area code unless specified
-            if( not area_code ): area_code = a_cfg.area_code_def 
-            if( area_code in raw_data ):
-                weather_info = raw_data[area_code]
-                print(f"Data for {a_cfg.area_info[area_code]['name']} ({a_cfg.area_info[area_code]['japanese_name']})")
-            else:
-                weather_info = "NAN"
-        elif( request_mode == 'f' ):
-            weather_info = raw_data
-        else:
-            print(f"Mode not supported ")
-            weather_info = {}
+        a_met.observe('fetch', time.perf_counter() - fetch_start)
+        a_met.addCount('response_bytes', len(raw_response))
+        with a_met.timed('parse'):
+            weather_info = parseWeatherResponse( raw_response, area_code, request_mode, area_codes )
             
     return weather_info
 
 
-# add the response to a JSON file having all the data we collect from AMEDAS
-def addWeatherValueEntry( datapoint, debugprint = False, area_code = 0, entry_datetime = "" ):
-    #check if datapoint is a dict type and that we have a not empty area code
-    if( type(datapoint) is not dict or not area_code ): return False
+# Get the path of the append-only journal that goes together with a monthly log file
+def getJournalPath( log_path = "" ):
+    return os.path.splitext(log_path)[0] + a_cfg.amedas_journal_ext
+
+
+# Get the path used to hold the journal while it is being merged into the monthly log
+def getCompactingPath( log_path = "" ):
+    return os.path.splitext(log_path)[0] + a_cfg.amedas_compacting_ext
+
+
+# Replay the entries of a journal file on top of the given log data (last entry for a time key wins)
+def replayJournal( journal_path, logdata, debugprint = False ):
+    if( not os.path.exists(journal_path) ): return 0
+    replayed = 0
+    with open(journal_path, 'r') as journal:
+        for line in journal:
+            try:
+                entry_time_key, area_code, datapoint = json.loads(line)
+            except ValueError:
+                # a crash in the middle of an append can leave a partial line at the end... just skip it
+                if( debugprint == True) : print(f"Skipping malformed journal line in {journal_path}")
+                continue
+            logdata.setdefault(entry_time_key[:10], {})[entry_time_key] = {area_code:datapoint}
+            replayed += 1
+    return replayed
+
+
+# Load a monthly log: the compacted JSON file plus any journal entries that have not been compacted yet
+# the result is cached (see getCachedWeatherLog), so treat it as read only
+def loadWeatherLog( log_path = "", debugprint = False ):
+    log_signature = getWeatherLogSignature( log_path )
+    logdata = getCachedWeatherLog( log_path, log_signature )
+    if( logdata is not None ):
+        if( debugprint == True) : print(f"Using cached data for {log_path}")
+        return logdata
+    logdata = parseWeatherLog( log_path, debugprint )
+    putCachedWeatherLog( log_path, log_signature, logdata )
+    return logdata
+
+
+# Load the points of an area from a monthly log as compact records (amedas_record.AmedasRecordSeries)
+# about an order of magnitude less memory than the dicts of loadWeatherLog, also cached (treat it as read only)
+def loadWeatherRecords( log_path = "", area_code = 0, debugprint = False ):
+    cache_key = (log_path, str(area_code))
+    log_signature = getWeatherLogSignature( log_path )
+    series = getCachedWeatherLog( cache_key, log_signature )
+    if( series is not None ): return series
+    # the parsed dicts are only kept while the records are built
+    series = a_rec.AmedasRecordSeries.fromLogData( parseWeatherLog(log_path, debugprint), str(area_code) )
+    putCachedWeatherLog( cache_key, log_signature, series, series.nbytes() )
+    return series
+
+
+# Parse a monthly log (compacted JSON file plus journal) without using the cache
+def parseWeatherLog( log_path = "", debugprint = False ):
+    logdata = {}
+    if( os.path.exists(log_path) ):
+        try:
+            with open(log_path, 'r') as logfile:
+                logdata = json.load(logfile)
+        except ValueError as e:
+            print(f"Error: {e} -> log file {log_path} is not valid JSON, only the journal entries will be used")
+            logdata = {}
+    replayJournal( getCompactingPath(log_path), logdata, debugprint )
+    replayJournal( getJournalPath(log_path), logdata, debugprint )
+    return logdata
+
+
+## Process wide LRU cache of parsed monthly logs {log_path or (log_path, area_code): (signature, logdata or records, estimated_bytes)}
+log_cache = OrderedDict()
+log_cache_stats = {'hits':0, 'misses':0, 'evictions':0, 'bytes':0}
+
+
+# Get the (mtime, size) of the files that make a monthly log, so any change on them invalidates the cached data
+def getWeatherLogSignature( log_path ):
+    log_signature = []
+    for file_path in [log_path, getCompactingPath(log_path), getJournalPath(log_path)]:
+        try:
+            file_stat = os.stat(file_path)
+            log_signature.append((file_stat.st_mtime_ns, file_stat.st_size))
+        except OSError:
+            log_signature.append(None)
+    return tuple(log_signature)
+
+
+# Get the cached data of a monthly log if it is still valid (None otherwise)
+def getCachedWeatherLog( log_path, log_signature ):
+    cached = log_cache.get(log_path)
+    if( cached is not None and cached[0] == log_signature ):
+        log_cache.move_to_end(log_path)
+        log_cache_stats['hits'] += 1
+        return cached[1]
+    log_cache_stats['misses'] += 1
+    return None
+
+
+# Put the data of a monthly log in the cache, evicting the least recently used logs to stay within the memory budget
+# the size is estimated from the size of the files if not given
+def putCachedWeatherLog( log_path, log_signature, logdata, estimated_bytes = None ):
+    if( estimated_bytes is None ): estimated_bytes = sum(file_sig[1] for file_sig in log_signature if file_sig) * a_cfg.log_cache_size_factor
+    if( log_path in log_cache ): log_cache_stats['bytes'] -= log_cache.pop(log_path)[2]
+    budget_bytes = a_cfg.log_cache_budget_mb * 1024 * 1024
+    if( estimated_bytes > budget_bytes ): return
+    while( log_cache and log_cache_stats['bytes'] + estimated_bytes > budget_bytes ):
+        log_cache_stats['bytes'] -= log_cache.popitem(last = False)[1][2]
+        log_cache_stats['evictions'] += 1
+    log_cache[log_path] = (log_signature, logdata, estimated_bytes)
+    log_cache_stats['bytes'] += estimated_bytes
+
+
+# Get the cached entries of some logs {cache_key: (signature, data, estimated_bytes)}, e.g. to give them to other processes
+def getCachedLogEntries( cache_keys ):
+    return {cache_key:log_cache[cache_key] for cache_key in cache_keys if cache_key in log_cache}
+
+
+# Put the entries taken from another process (see getCachedLogEntries) in the cache of this one
+def putCachedLogEntries( cache_entries ):
+    for cache_key, (log_signature, logdata, estimated_bytes) in cache_entries.items():
+        putCachedWeatherLog( cache_key, log_signature, logdata, estimated_bytes )
+
+
+# Get the hit/miss counters of the log cache
+def getLogCacheStats():
+    return dict(log_cache_stats, entries = len(log_cache))
+
+
+# Drop all the cached logs
+def clearLogCache():
+    log_cache.clear()
+    log_cache_stats['bytes'] = 0
+
+
+# Merge the journal of a monthly log into the log file itself and start a new journal
+def compactWeatherLog( log_path = "", debugprint = False ):
+    journal_path = getJournalPath(log_path)
+    compacting_path = getCompactingPath(log_path)
+    # move the journal out of the way first, so entries appended while compacting go to a new journal
+    if( os.path.exists(journal_path) ):
+        if( os.path.exists(compacting_path) ):
+            # a previous compaction did not finish... keep both sets of entries
+            with open(journal_path, 'r') as journal, open(compacting_path, 'a') as compacting:
+                compacting.write(journal.read())
+            os.remove(journal_path)
+        else:
+            os.replace(journal_path, compacting_path)
+    if( not os.path.exists(compacting_path) ):
+        if( debugprint == True) : print(f"Nothing to compact for {log_path}")
+        return False
+    if( os.path.exists(log_path) ):
+        try:
+            with open(log_path, 'r') as logfile:
+                json.load(logfile)
+        except ValueError as e:
+            # do not throw away a month of data, leave everything as it is so it can be checked by hand
+            print(f"Error: {e} -> log file {log_path} is not valid JSON, compaction aborted")
+            return False
+    compact_start = time.perf_counter()
+    logdata = parseWeatherLog( log_path, debugprint )
+    # write the new log to a temp file and swap it in, so the log is either the old or the new one
+    temp_path = log_path + '.tmp'
+    with open(temp_path, 'w') as tempfile:
+        json.dump(logdata, tempfile, sort_keys=True)
+        tempfile.flush()
+        os.fsync(tempfile.fileno())
+    os.replace(temp_path, log_path)
+    os.remove(compacting_path)
+    a_met.observe('compact', time.perf_counter() - compact_start)
+    if( debugprint == True) : print(f"Compacted the journal into {log_path}")
+    return True
+
+
+# Get the journal where an entry for the given area and datetime must be appended (creating the directory if required)
+def prepareJournalForEntry( area_code, entry_datetime, debugprint = False ):
     #form the path to the log where the entry must be saved
     entry_log = buildPathFromDate( target_datetime = entry_datetime, target = "l", area_code = area_code )
+    entry_journal = getJournalPath(entry_log)
     # create the directory if required
     os.makedirs( os.path.dirname(entry_log), exist_ok = True )
+    # first entry of a new month? then it is a good time to compact the previous month
+    if( not os.path.exists(entry_journal) and not os.path.exists(entry_log) ):
+        prev_month_log = buildPathFromDate( target_datetime = entry_datetime.replace(day = 1) - dt.timedelta(days = 1), target = "l", area_code = area_code )
+        compactWeatherLog( prev_month_log, debugprint )
+    return entry_journal
+
+
+# Append a line to a journal with a single write and make sure it reached the disk before returning
+def appendJournalLine( journal_path, entry_line ):
+    journal_fd = os.open(journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
     try:
-        #Get data from file
-        if( os.path.exists(entry_log) ):
-            #Open file in read only mode only
-            tempfile = open(entry_log, 'r')
-            tempdata = json.load(tempfile)
-            tempfile.close()
-            if( debugprint == True) : print(f"Reading data from file {entry_log} \n")
-        else:
-            tempdata = {}
-            if( debugprint == True) : print(f"New file will be created at {entry_log} \n")
-    except ValueError as e:
-        if( debugprint == True) : print(f"Error: {e}\n")
-        if( debugprint == True) : print(f"File {entry_log} was empty \n creating new entry...\n")
-        tempdata = {}
-    except IOError:
-        print(f"Unexpected error: {sys.exc_info()[0:2]}")
-        return False
-    
-    if( isinstance(entry_datetime, dt.datetime) ):
-        #Get the entry datetime to create a JSON key for searching
-        entry_time_key = entry_datetime.strftime('%Y-%m-%d %H:%M')
-        #Get the entry date to create a JSON key for searching
-        entry_date_key = entry_datetime.strftime('%Y-%m-%d')
-        #Add the rest of the info to the data point before adding it
-        datapoint_full = {entry_time_key : {str(area_code):datapoint}}
-        
-        #search the date key in the current data        
-        if( entry_date_key in tempdata ):
-            #if( entry_time_key in tempdata[entry_date_key] ):
-            tempdata[entry_date_key].update(datapoint_full)
-            # consider checking if value for that time is already in the list or not
-            if( debugprint == True) :print(f"'Added the datapoint {datapoint_full} to the key {entry_date_key} \n")
-        else:
-            #if not available, add new date key and add datapoint
-            tempdata.update({entry_date_key:datapoint_full})
-            # consider checking if value for that time is already in the list or not
-            if( debugprint == True) : print(f"Created the key {entry_date_key} and added the datapoint {datapoint_full} \n")
-        #finally, re-write json file
-        tempfile = open(entry_log,'w')
-        json.dump(tempdata, tempfile, sort_keys=True)
-        if( debugprint == True) : print(f"Re-wrote data to file {entry_log} \n")
-        tempfile.close()
-        return True
-    else:
+        os.write(journal_fd, entry_line.encode("utf-8"))
+        os.fsync(journal_fd)
+    finally:
+        os.close(journal_fd)
+
+
+# Create the journal line for a data point
+def createJournalLine( datapoint, area_code, entry_datetime ):
+    #Get the entry datetime to create a JSON key for searching
+    entry_time_key = entry_datetime.strftime('%Y-%m-%d %H:%M')
+    return json.dumps([entry_time_key, str(area_code), datapoint]) + '\n'
+
+
+# Keep the columnar store (see amedas_colstore, needs numpy) up to date too, if enabled
+# the journal is the reference, so a problem here is reported but does not make the entry fail
+def storeColumnEntries( weather_data, area_codes, entry_datetime, debugprint = False ):
+    if( not a_cfg.colstore_enabled ): return 0
+    try:
+        import amedas_colstore as a_col
+        with a_met.timed('colstore'):
+            return a_col.storeColumnPoints( weather_data, area_codes, entry_datetime )
+    except (ImportError, OSError, ValueError) as e:
+        print(f"Error: {e} -> columnar store not updated for {area_codes} @ ({entry_datetime})")
+        return 0
+
+
+# Keep the hourly/daily/monthly rollups (see amedas_rollup) up to date too, if enabled
+# as with the columnar store, a problem here is reported but does not make the entry fail (see amedas_rollup.repairMonthRollups)
+def storeRollupEntries( weather_data, area_codes, entry_datetime, debugprint = False ):
+    if( not a_cfg.rollup_enabled ): return 0
+    try:
+        import amedas_rollup as a_rlp
+        with a_met.timed('rollup'):
+            return a_rlp.storeRollupPoints( weather_data, area_codes, entry_datetime )
+    except (OSError, ValueError) as e:
+        print(f"Error: {e} -> rollups not updated for {area_codes} @ ({entry_datetime})")
+        return 0
+
+
+# Keep the gap index (see amedas_gaps) up to date too, if enabled: the areas stored, and the ones the response did not have
+# as with the columnar store, a problem here is reported but does not make the entry fail
+def storeGapEntries( area_codes, entry_datetime, absent_codes = (), debugprint = False ):
+    if( not a_cfg.gap_index_enabled ): return 0
+    try:
+        import amedas_gaps as a_gap
+        with a_met.timed('gaps'):
+            for area_code in area_codes: a_gap.markGapSlots( area_code, [entry_datetime] )
+            for area_code in absent_codes: a_gap.markGapSlots( area_code, [entry_datetime], 'absent' )
+        return len(area_codes)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e} -> gap index not updated for {area_codes} @ ({entry_datetime})")
+        return 0
+
+
+# Keep the full response as a snapshot of the archive too (see amedas_archive), if enabled
+# only full responses (request_mode 'f', more areas than the ones we store) are archived
+def archiveWeatherResponse( weather_data, area_codes, entry_datetime, debugprint = False ):
+    if( not a_cfg.archive_enabled or len(weather_data) <= len(area_codes) ): return None
+    try:
+        import amedas_archive as a_arc
+        with a_met.timed('archive'):
+            snapshot_path = a_arc.writeSnapshot( weather_data, entry_datetime )
+        if( debugprint == True) : print(f"Archived {len(weather_data)} areas @ ({entry_datetime}) -> {snapshot_path}")
+        return snapshot_path
+    except (OSError, ValueError) as e:
+        print(f"Error: {e} -> snapshot not archived @ ({entry_datetime})")
+        return None
+
+
+# Request mode to use for the requests that will be stored: the archive needs all the areas of the response
+def getStoreRequestMode():
+    return 'f' if a_cfg.archive_enabled else 's'
+
+
+# add the response to the journal of the monthly log having all the data we collect from AMEDAS
+def addWeatherValueEntry( datapoint, debugprint = False, area_code = 0, entry_datetime = "" ):
+    #check if datapoint is a dict type and that we have a not empty area code
+    if( type(datapoint) is not dict or not area_code ): return False
+    if( not isinstance(entry_datetime, dt.datetime) ):
         if( debugprint == True) : print(f"Error: entry_datetime format is not valid -> {entry_datetime}")
         return False
+    store_start = time.perf_counter()
+    # one line per data point, written with a single call so the cost does not depend on the size of the month
+    try:
+        with a_met.timed('journal'):
+            entry_journal = prepareJournalForEntry( area_code, entry_datetime, debugprint )
+            appendJournalLine( entry_journal, createJournalLine(datapoint, area_code, entry_datetime) )
+    except OSError:
+        print(f"Unexpected error: {sys.exc_info()[0:2]}")
+        a_met.addCount('store_errors')
+        return False
+    storeColumnEntries( {str(area_code):datapoint}, [str(area_code)], entry_datetime, debugprint )
+    storeRollupEntries( {str(area_code):datapoint}, [str(area_code)], entry_datetime, debugprint )
+    storeGapEntries( [str(area_code)], entry_datetime, debugprint = debugprint )
+    a_met.addCount('stored_points')
+    a_met.observe('store', time.perf_counter() - store_start)
+    if( debugprint == True) : print(f"'Added the datapoint {datapoint} at {entry_datetime} to the journal {entry_journal} \n")
+    return True
+
+
+# add the values of all the given areas from a full map response in one pass
+# returns a dict with the areas that were stored and the time spent on each one of them (and in total)
+# areas that are None in weather_data are 'unknown' (e.g. their point file failed): not stored and not taken as missing
+def addWeatherValueEntries( weather_data, area_codes = None, entry_datetime = "", debugprint = False ):
+    commit_info = {'stored':[], 'missing':[], 'unknown':[], 'failed':[], 'timings':{}, 'total_time':0.0}
+    if( type(weather_data) is not dict or not isinstance(entry_datetime, dt.datetime) ): return commit_info
+    if( area_codes is None ): area_codes = [areacd for areacd in a_cfg.area_info if areacd != 'common']
+    commit_start = time.perf_counter()
+    archiveWeatherResponse( weather_data, area_codes, entry_datetime, debugprint )
+    for area_code in area_codes:
+        if( area_code in weather_data and weather_data[area_code] is None ):
+            commit_info['unknown'].append(area_code)
+            continue
+        if( area_code not in weather_data or type(weather_data[area_code]) is not dict ):
+            commit_info['missing'].append(area_code)
+            continue
+        area_start = time.perf_counter()
+        try:
+            with a_met.timed('journal'):
+                entry_journal = prepareJournalForEntry( area_code, entry_datetime, debugprint )
+                appendJournalLine( entry_journal, createJournalLine(weather_data[area_code], area_code, entry_datetime) )
+            commit_info['stored'].append(area_code)
+            storeColumnEntries( weather_data, [area_code], entry_datetime, debugprint )
+            storeRollupEntries( weather_data, [area_code], entry_datetime, debugprint )
+        except OSError:
+            print(f"Unexpected error while storing area {area_code}: {sys.exc_info()[0:2]}")
+            a_met.addCount('store_errors')
+            commit_info['failed'].append(area_code)
+        commit_info['timings'][area_code] = time.perf_counter() - area_start
+    storeGapEntries( commit_info['stored'], entry_datetime, commit_info['missing'], debugprint )
+    commit_info['total_time'] = time.perf_counter() - commit_start
+    a_met.addCount('stored_points', len(commit_info['stored']))
+    a_met.observe('store', commit_info['total_time'])
+    if( debugprint == True) : print(f"Stored {len(commit_info['stored'])} areas @ ({entry_datetime}) in {commit_info['total_time']*1000:.2f} ms -> " + ", ".join(f"{areacd}:{t*1000:.2f}ms" for areacd, t in commit_info['timings'].items()))
+    return commit_info
 
 
 # to make my life easier... just put the request and add entry functions together ;)    
@@ -170,8 +510,12 @@ def requestAndStoreSingleWeatherInfo( target_datetime = "", area_code = 0, debug
     #just in case... check the params and create some values if required
     if( not isinstance(target_datetime, dt.datetime) ): target_datetime = dt.datetime.now()
     if( not area_code ): area_code = a_cfg.area_code
-    # Request the data from the server
-    weather_data = requestWeatherData( target_datetime = target_datetime, area_code = area_code, request_mode = 'a' )
+    # Request the data from the server (from the small point file of the area if enabled, see amedas_fetch)
+    if( a_cfg.point_fetch_enabled ):
+        import amedas_fetch as a_fetch
+        weather_data = a_fetch.fetchSlotsBatch( [target_datetime], [area_code], max_inflight = 1 )[target_datetime].get(area_code) or {}
+    else:
+        weather_data = requestWeatherData( target_datetime = target_datetime, area_code = area_code, request_mode = 'a' )
     if( debugprint == True) : print(f"Got data {weather_data}")
     #now check if the result is valid or not
     if( weather_data ):
@@ -189,18 +533,16 @@ def requestAndStoreWeatherInfo( target_datetime = "", debugprint = True ):
     #just in case... check the params and create some values if required
     if( not isinstance(target_datetime, dt.datetime) ): target_datetime = dt.datetime.now()
     # Request the data from the server
-    weather_data = requestWeatherData( target_datetime = target_datetime, request_mode = 'f' )
+    weather_data = requestWeatherData( target_datetime = target_datetime, request_mode = getStoreRequestMode() )
     if( debugprint == True) : print(f"Got data for {len(weather_data)} areas...")
     #now check if the result is valid or not
     if( weather_data ):
         # Storage with debug mode... will call it on a cron-job and keep a log
-        for area_code in a_cfg.area_info :
-            if( area_code != "common" and area_code in weather_data ):
-                area_weather_data = weather_data[area_code]
-                if( addWeatherValueEntry( area_weather_data, debugprint, area_code, target_datetime ) ) : success_cnt += 1
-                if( debugprint == True) : print(f"Got data for the area {area_code} at @ ({target_datetime}) = OK:{success_cnt}")
-            else:
-                if( debugprint == True) : print(f"ERROR: Cannot get data for the area {area_code} at @ ({target_datetime})")
+        commit_info = addWeatherValueEntries( weather_data, entry_datetime = target_datetime, debugprint = debugprint )
+        success_cnt = len(commit_info['stored'])
+        if( debugprint == True) : print(f"Got data for the areas {commit_info['stored']} at @ ({target_datetime}) = OK:{success_cnt}")
+        for area_code in commit_info['missing'] + commit_info['failed']:
+            if( debugprint == True) : print(f"ERROR: Cannot get data for the area {area_code} at @ ({target_datetime})")
     else:
         if( debugprint == True) : print(f"ERROR: Not able to get data for the registered areas @ ({target_datetime})")
     return success_cnt
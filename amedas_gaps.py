@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import os.path
+import datetime as dt
+import amedas_config as a_cfg
+import amedas_funcs as a_fnc
+
+## Gap index of an area and month (file next to the monthly log), 2 bitmaps of 31 days x 144 slots (18 bytes per day):
+##   'present' slots stored for the area
+##   'absent'  slots whose map response was fetched fine but did not have the area (e.g. station under maintenance),
+##             so they are not fetched again and again. Only 'present' can be built again from the log
+## slot i of a day is bit (i % 8) of byte (i // 8), the bitmap of day d starts at (d - 1) * 18
+gap_slots_per_day = 144
+gap_day_bytes = gap_slots_per_day // 8
+gap_month_days = 31
+gap_layers = {'present':0, 'absent':gap_month_days * gap_day_bytes}
+gap_index_size = 2 * gap_month_days * gap_day_bytes
+
+
+# Get the path of the gap index of an area for the month of the given datetime
+def buildGapIndexPath( area_code, month_datetime ):
+    log_dir = os.path.dirname( a_fnc.buildPathFromDate( target_datetime = month_datetime, target = "l", area_code = area_code ) )
+    return os.path.join(log_dir, a_cfg.gap_index_fname.replace(a_cfg.replace_target_year + a_cfg.replace_target_month, month_datetime.strftime('%Y%m')))
+
+
+# Get the position of a slot in the index: (byte offset, bit mask)
+def getSlotPosition( slot, layer = 'present' ):
+    slot_idx = slot.hour * 6 + slot.minute // 10
+    return gap_layers[layer] + (slot.day - 1) * gap_day_bytes + slot_idx // 8, 1 << (slot_idx % 8)
+
+
+# Check if a slot is set in an index
+def isSlotSet( index, slot, layer = 'present' ):
+    byte_pos, bit_mask = getSlotPosition( slot, layer )
+    return bool(index[byte_pos] & bit_mask)
+
+
+# Build the index of a month from the monthly log (and its journal), only the 'present' slots can be known
+def buildGapIndex( area_code, month_datetime ):
+    index = bytearray(gap_index_size)
+    logfile = a_fnc.buildPathFromDate( target_datetime = month_datetime, target = "l", area_code = area_code )
+    month_key = month_datetime.strftime('%Y-%m')
+    for date_vals in a_fnc.loadWeatherLog(logfile).values():
+        for time_key in date_vals:
+            if( not time_key.startswith(month_key) ): continue
+            byte_pos, bit_mask = getSlotPosition( dt.datetime.strptime(time_key, '%Y-%m-%d %H:%M') )
+            index[byte_pos] |= bit_mask
+    return index
+
+
+# Write an index (temp file + rename)
+def saveGapIndex( index_path, index ):
+    os.makedirs( os.path.dirname(index_path), exist_ok = True )
+    with open(index_path + '.tmp', 'wb') as index_file:
+        index_file.write(index)
+    os.replace(index_path + '.tmp', index_path)
+
+
+# Load the index of a month, it is built from the log (and saved) if it does not exist yet or if rebuild
+# months with no log at all give an empty index, that is not saved
+def loadGapIndex( area_code, month_datetime, rebuild = False ):
+    index_path = buildGapIndexPath( area_code, month_datetime )
+    if( not rebuild and os.path.exists(index_path) ):
+        with open(index_path, 'rb') as index_file:
+            index = bytearray(index_file.read())
+        if( len(index) == gap_index_size ): return index
+        print(f"Error: gap index {index_path} has {len(index)} bytes instead of {gap_index_size}, building it again")
+    index = buildGapIndex( area_code, month_datetime )
+    logfile = a_fnc.buildPathFromDate( target_datetime = month_datetime, target = "l", area_code = area_code )
+    if( any(index) or os.path.exists(logfile) or os.path.exists(a_fnc.getJournalPath(logfile)) ): saveGapIndex( index_path, index )
+    return index
+
+
+# Set the bits of some slots of an area (one read-modify-write of a byte per slot, the rest of the file is not touched)
+# a month with no index yet gets it built from its log first (which already has the new points)
+def markGapSlots( area_code, slots, layer = 'present' ):
+    for slot in slots:
+        index_path = buildGapIndexPath( area_code, slot )
+        byte_pos, bit_mask = getSlotPosition( slot, layer )
+        if( not os.path.exists(index_path) ):
+            index = loadGapIndex( area_code, slot )
+            if( not index[byte_pos] & bit_mask ):
+                index[byte_pos] |= bit_mask
+                saveGapIndex( index_path, index )
+            continue
+        with open(index_path, 'r+b') as index_file:
+            index_file.seek(byte_pos)
+            old_byte = index_file.read(1)[0]
+            if( old_byte & bit_mask ): continue
+            index_file.seek(byte_pos)
+            index_file.write(bytes([old_byte | bit_mask]))
+    return len(slots)
+
+
+# Get the time keys of the slots of a day that are done for an area (stored, or not in the JMA response)
+def getDoneTimeKeys( area_code, day_datetime ):
+    index = loadGapIndex( area_code, day_datetime )
+    day_start = day_datetime.replace(hour = 0, minute = 0, second = 0, microsecond = 0)
+    done_keys = set()
+    for slot_idx in range(gap_slots_per_day):
+        slot = day_start + dt.timedelta(minutes = 10 * slot_idx)
+        if( isSlotSet(index, slot, 'present') or isSlotSet(index, slot, 'absent') ): done_keys.add(slot.strftime('%Y-%m-%d %H:%M'))
+    return done_keys
+
+
+# Keep only the slots that are missing for at least one of the areas (same order)
+def getMissingSlots( slots, area_codes ):
+    indexes = {}
+    missing_slots = []
+    for slot in slots:
+        for area_code in area_codes:
+            month_key = (area_code, slot.strftime('%Y%m'))
+            if( month_key not in indexes ): indexes[month_key] = loadGapIndex( area_code, slot )
+            if( not isSlotSet(indexes[month_key], slot, 'present') and not isSlotSet(indexes[month_key], slot, 'absent') ):
+                missing_slots.append(slot)
+                break
+    return missing_slots
+
+
+# Build again the index of the months of some slots from their logs (the 'absent' slots are forgotten)
+def rebuildGapIndexes( slots, area_codes ):
+    months = sorted(set((area_code, slot.replace(day = 1, hour = 0, minute = 0)) for slot in slots for area_code in area_codes))
+    for area_code, month in months:
+        loadGapIndex( area_code, month, rebuild = True )
+    return len(months)
+
+#----EOF--------------------------------------------------------
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import os.path
+import json
+import hashlib
+import amedas_config as a_cfg
+
+## Manifest of rendered graphs {plot_fname: fingerprint}, loaded the first time it is needed
+render_manifest = None
+## Entries recorded since the manifest was last saved (or taken by takeRenderManifestUpdates)
+render_manifest_updates = {}
+render_stats = {'rendered':0, 'skipped':0}
+
+
+# Get the fingerprint of the inputs of a graph: the kind of plot, its file, the config entries it uses and the data arrays
+def buildRenderFingerprint( plot_kind, plot_fname, cfg_entries, data_arrays ):
+    fingerprint = hashlib.sha256()
+    fingerprint.update( json.dumps([plot_kind, plot_fname, cfg_entries], sort_keys=True, default=str).encode("utf-8") )
+    for data_array in data_arrays:
+        fingerprint.update( str(data_array.dtype).encode("utf-8") )
+        fingerprint.update( data_array.tobytes() )
+    return fingerprint.hexdigest()
+
+
+# Load the manifest from its file (an empty one if there is no file or it is not valid)
+def loadRenderManifest( manifest_path = "" ):
+    if( not manifest_path ): manifest_path = a_cfg.render_manifest
+    if( os.path.exists(manifest_path) ):
+        try:
+            with open(manifest_path, 'r') as manifest_file:
+                return json.load(manifest_file)
+        except ValueError as e:
+            print(f"Error: {e} -> render manifest {manifest_path} is not valid, all graphs will be rendered again")
+    return {}
+
+
+# Check if a graph already exists and was rendered from the same inputs (counted as skipped if so)
+def isRenderUpToDate( plot_fname, fingerprint ):
+    global render_manifest
+    if( not a_cfg.render_skip_unchanged or not os.path.exists(plot_fname) ): return False
+    if( render_manifest is None ): render_manifest = loadRenderManifest()
+    if( render_manifest.get(plot_fname) == fingerprint ):
+        render_stats['skipped'] += 1
+        return True
+    return False
+
+
+# Record the fingerprint of a graph that was just rendered
+def recordRender( plot_fname, fingerprint ):
+    global render_manifest
+    if( render_manifest is None ): render_manifest = loadRenderManifest()
+    render_manifest[plot_fname] = fingerprint
+    render_manifest_updates[plot_fname] = fingerprint
+    render_stats['rendered'] += 1
+
+
+# Take the entries recorded in this process (e.g. by a render worker, so the main process can merge and save them)
+def takeRenderManifestUpdates():
+    updates = dict(render_manifest_updates)
+    render_manifest_updates.clear()
+    return updates
+
+
+# Merge entries recorded by another process
+def mergeRenderManifestUpdates( updates ):
+    global render_manifest
+    if( render_manifest is None ): render_manifest = loadRenderManifest()
+    render_manifest.update(updates)
+    render_manifest_updates.update(updates)
+
+
+# Save the recorded entries to the manifest file (re-read first, temp file + rename)
+def saveRenderManifest( manifest_path = "" ):
+    if( not render_manifest_updates ): return False
+    if( not manifest_path ): manifest_path = a_cfg.render_manifest
+    manifest = loadRenderManifest( manifest_path )
+    manifest.update(takeRenderManifestUpdates())
+    os.makedirs( os.path.dirname(manifest_path), exist_ok = True )
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+    return True
+
+
+# Get the number of graphs rendered and skipped (up to date) in this process
+def getRenderStats():
+    return dict(render_stats)
+
+#----EOF--------------------------------------------------------
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import os
+import time
+import json
+import atexit
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from functools import wraps
+import amedas_config as a_cfg
+
+## Per-stage timers and counters, cheap enough to be always on: recording a point is a perf_counter() call, a dict update and
+## a list append under a lock, everything else (JSON, files) is done by flushMetrics() at the end of a run or of a daemon tick.
+## Stages: 'fetch' (HTTP request + body of a map), 'parse', 'point_fetch' (a point file), 'latest_time', 'store' (all the areas
+## of a slot) with 'journal', 'colstore', 'rollup', 'gaps', 'archive' and 'compact' inside it, 'rollup_build' (rollups of a month
+## built from its log: by a query of a month with no saved rollups, a repair or the first point of a month), 'plot' (each plot
+## function, label plot=<function>) with 'plot_save' (matplotlib savefig) and 'tick' (one daemon tick).
+## Counters: 'requests', 'point_requests', 'latest_time_requests', 'latest_time_not_modified', 'request_errors', 'response_bytes',
+## 'stored_points', 'store_errors', 'clamped_flags' (quality flags out of the range of amedas_record).
+## Each point is also written as a JSON line with the context of the moment (e.g. the daemon tick), so a slow tick can be traced;
+## the Prometheus text file has the totals of this process (since the start of the run, or of the daemon).
+metrics_lock = threading.Lock()
+## {(stage, labels): [count, sum, max, last]} and {(counter, labels): value}, labels are a sorted tuple of (name, value)
+metric_timers = {}
+metric_counters = {}
+## Points recorded since the last flush: (timestamp, 't' or 'c', name, labels, value, context)
+metric_events = []
+metric_context = {}
+metrics_start_time = time.time()
+
+
+# Turn the labels of a point into the key used by the tables above
+def getLabelsKey( labels ):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+# Record the time spent on a stage (in seconds)
+def observe( stage, seconds, **labels ):
+    if( not a_cfg.metrics_enabled ): return
+    labels_key = getLabelsKey(labels)
+    with metrics_lock:
+        timer = metric_timers.get((stage, labels_key))
+        if( timer is None ):
+            metric_timers[(stage, labels_key)] = [1, seconds, seconds, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+            if( seconds > timer[2] ): timer[2] = seconds
+            timer[3] = seconds
+        metric_events.append((time.time(), 't', stage, labels_key, seconds, metric_context.get('tick')))
+
+
+# Add to a counter
+def addCount( counter, value = 1, **labels ):
+    if( not a_cfg.metrics_enabled ): return
+    labels_key = getLabelsKey(labels)
+    with metrics_lock:
+        metric_counters[(counter, labels_key)] = metric_counters.get((counter, labels_key), 0) + value
+        metric_events.append((time.time(), 'c', counter, labels_key, value, metric_context.get('tick')))
+
+
+# Time the code of a with block as a stage (recorded even if the block raised)
+@contextmanager
+def timed( stage, **labels ):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe( stage, time.perf_counter() - start, **labels )
+
+
+# Decorator to time each call of a function as a stage, with the name of the function as a label (e.g. plot=plotAmedasSingleScatter)
+def timedFunction( stage, label = 'func' ):
+    def decorator( func ):
+        @wraps(func)
+        def wrapper( *args, **kwargs ):
+            start = time.perf_counter()
+            try:
+                return func( *args, **kwargs )
+            finally:
+                observe( stage, time.perf_counter() - start, **{label:func.__name__} )
+        return wrapper
+    return decorator
+
+
+# Set the context added to the JSON lines of the next points (e.g. the slot of the daemon tick), None to clear it
+def setMetricsContext( tick = None ):
+    metric_context['tick'] = tick
+
+
+# Get a mark of the points recorded so far, to take only the ones recorded after it (see takeMetricEvents)
+def getMetricsMark():
+    return len(metric_events)
+
+
+# Take the points recorded after a mark (e.g. by a render worker, so the main process can merge them with mergeMetricEvents)
+def takeMetricEvents( mark = 0 ):
+    with metrics_lock:
+        return metric_events[mark:]
+
+
+# Merge the points recorded by another process
+def mergeMetricEvents( events ):
+    for ts, kind, name, labels_key, value, tick in events:
+        with metrics_lock:
+            if( kind == 't' ):
+                timer = metric_timers.setdefault((name, tuple(map(tuple, labels_key))), [0, 0.0, 0.0, 0.0])
+                timer[0] += 1
+                timer[1] += value
+                timer[2] = max(timer[2], value)
+                timer[3] = value
+            else:
+                counter_key = (name, tuple(map(tuple, labels_key)))
+                metric_counters[counter_key] = metric_counters.get(counter_key, 0) + value
+            metric_events.append((ts, kind, name, labels_key, value, tick))
+
+
+# Get the totals of the timers {stage: {'count', 'sum', 'max', 'last'}} and counters {counter: value} (labels after a '|')
+def getMetricsSummary():
+    def getName( name, labels_key ):
+        return name + ('|' + ','.join(f"{label}={value}" for label, value in labels_key) if labels_key else '')
+    with metrics_lock:
+        timers = {getName(*key):{'count':timer[0], 'sum':timer[1], 'max':timer[2], 'last':timer[3]} for key, timer in metric_timers.items()}
+        counters = {getName(*key):value for key, value in metric_counters.items()}
+    return timers, counters
+
+
+# Format the labels of a Prometheus sample
+def formatPromLabels( labels ):
+    return '{' + ','.join('{}="{}"'.format(label, str(value).replace('\\', '\\\\').replace('"', '\\"')) for label, value in labels) + '}' if labels else ''
+
+
+# Build the Prometheus text exposition of the totals
+def buildPromText():
+    prefix = a_cfg.metrics_prom_prefix
+    with metrics_lock:
+        timers = sorted(metric_timers.items())
+        counters = sorted(metric_counters.items())
+    lines = [f"# HELP {prefix}_stage_seconds Time spent on each stage of the collector/plotter",
+             f"# TYPE {prefix}_stage_seconds summary"]
+    for (stage, labels_key), timer in timers:
+        labels = formatPromLabels((('stage', stage),) + labels_key)
+        lines.append(f"{prefix}_stage_seconds_count{labels} {timer[0]}")
+        lines.append(f"{prefix}_stage_seconds_sum{labels} {timer[1]:.6f}")
+    for suffix, idx, help_text in [('max', 2, 'Longest time of each stage'), ('last', 3, 'Time of the last run of each stage')]:
+        lines += [f"# HELP {prefix}_stage_seconds_{suffix} {help_text}", f"# TYPE {prefix}_stage_seconds_{suffix} gauge"]
+        lines += [f"{prefix}_stage_seconds_{suffix}{formatPromLabels((('stage', stage),) + labels_key)} {timer[idx]:.6f}" for (stage, labels_key), timer in timers]
+    for counter in sorted(set(name for (name, _), _ in counters)):
+        lines += [f"# HELP {prefix}_{counter}_total Number of {counter.replace('_', ' ')}", f"# TYPE {prefix}_{counter}_total counter"]
+        lines += [f"{prefix}_{counter}_total{formatPromLabels(labels_key)} {value}" for (name, labels_key), value in counters if name == counter]
+    lines += [f"# HELP {prefix}_start_time_seconds Start of the process the totals belong to",
+              f"# TYPE {prefix}_start_time_seconds gauge",
+              f"{prefix}_start_time_seconds {metrics_start_time:.3f}"]
+    return '\n'.join(lines) + '\n'
+
+
+# Append the points recorded since the last flush to the JSON lines file (renamed to .1 when it gets too big)
+# and write the Prometheus text file (temp file + rename, as the collector may read it at any time), returns the number of points
+def flushMetrics():
+    if( not a_cfg.metrics_enabled ): return 0
+    with metrics_lock:
+        events = metric_events[:]
+        metric_events.clear()
+    if( not events and not metric_timers and not metric_counters ): return 0
+    try:
+        if( events and a_cfg.metrics_events_path ):
+            os.makedirs( os.path.dirname(a_cfg.metrics_events_path), exist_ok = True )
+            if( os.path.exists(a_cfg.metrics_events_path) and os.path.getsize(a_cfg.metrics_events_path) > a_cfg.metrics_events_max_mb * 1024 * 1024 ):
+                os.replace(a_cfg.metrics_events_path, a_cfg.metrics_events_path + '.1')
+            pid = os.getpid()
+            with open(a_cfg.metrics_events_path, 'a') as events_file:
+                for ts, kind, name, labels_key, value, tick in events:
+                    event = {'ts':round(ts, 3), 'pid':pid, ('stage' if kind == 't' else 'counter'):name, ('seconds' if kind == 't' else 'value'):round(value, 6) if kind == 't' else value}
+                    if( labels_key ): event['labels'] = dict(labels_key)
+                    if( tick ): event['tick'] = tick
+                    events_file.write(json.dumps(event) + '\n')
+        if( a_cfg.metrics_prom_path ):
+            os.makedirs( os.path.dirname(a_cfg.metrics_prom_path), exist_ok = True )
+            temp_path = a_cfg.metrics_prom_path + '.tmp'
+            with open(temp_path, 'w') as prom_file:
+                prom_file.write(buildPromText())
+            os.replace(temp_path, a_cfg.metrics_prom_path)
+    except OSError as e:
+        print(f"Error: {e} -> metrics not written")
+    return len(events)
+
+
+# Clear everything (e.g. between benchmark runs)
+def resetMetrics():
+    with metrics_lock:
+        metric_timers.clear()
+        metric_counters.clear()
+        metric_events.clear()
+
+
+# Whatever was recorded is written when the process ends
+# (not by pool workers: their points are sent back to the main process, see amedas_render)
+def flushMetricsAtExit():
+    if( multiprocessing.parent_process() is None ): flushMetrics()
+
+atexit.register(flushMetricsAtExit)
+
+#----EOF--------------------------------------------------------
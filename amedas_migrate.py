@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import os
+import glob
+import json
+import math
+import time
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import amedas_config as a_cfg
+import amedas_funcs as a_fnc
+import amedas_colstore as a_col
+
+## Migration of the monthly logs (YYYYMM_amedas_vals.json + journal) to the columnar store, one job per (area, month)
+## Each month is checked point by point (value and quality flag decoded from the columns) against its log after the conversion,
+## the values of the variables the columns do not keep (not in graph_amedas_dic, e.g. gust or snow1h) are counted as 'dropped'.
+## Months whose columns already exist are only checked (so it is safe to run it again, or while the collector is running),
+## and the state file keeps the signature of the logs already checked, so an interrupted run goes on where it stopped.
+## Status of each month:
+##   'created'   columns created from the log and checked
+##   'verified'  columns were already there and match the log
+##   'repaired'  columns were there but did not match the log, created again and checked
+##   'changed'   the log changed while it was being checked (e.g. a new point was stored), it will be checked on the next run
+##   'mismatch'  the columns still do not match the log after the conversion
+##   'malformed' the log is not valid JSON, nothing was done (the journal alone would lose the compacted points)
+##   'error'     something else went wrong (see 'error')
+migrate_ok_status = ['created', 'verified', 'repaired']
+
+
+# Find every monthly log (or journal of a month not compacted yet) under the logs directory
+# returns a sorted list of (area_code, 'YYYY-MM')
+def listMonthLogs():
+    logs_root = a_cfg.amedas_log.split(a_cfg.replace_target_areacode)[0]
+    month_target = a_cfg.replace_target_year + a_cfg.replace_target_month
+    log_fname = os.path.basename(a_cfg.amedas_log)
+    month_logs = set()
+    for log_pattern in [log_fname, os.path.splitext(log_fname)[0] + a_cfg.amedas_journal_ext]:
+        for log_path in glob.glob(os.path.join(logs_root, '*', '[0-9]' * 4, '[0-9]' * 2, log_pattern.replace(month_target, '[0-9]' * 6))):
+            area_code, year, month = os.path.relpath(log_path, logs_root).split(os.sep)[:3]
+            month_logs.add((area_code, f"{year}-{month}"))
+    return sorted(month_logs)
+
+
+# Read a monthly log checking its structure, returns (logdata with the journal replayed, issues)
+# issues: {'malformed': error of the JSON file or '', 'bad_entries': entries that are not points of this area and month,
+#          'bad_journal_lines': journal lines that could not be read (e.g. a write cut by a crash)}
+def inspectMonthLog( log_path, area_code, month_key ):
+    issues = {'malformed':'', 'bad_entries':0, 'bad_journal_lines':0}
+    logdata = {}
+    if( os.path.exists(log_path) ):
+        try:
+            with open(log_path, 'r') as log_file:
+                logdata = json.load(log_file)
+            if( type(logdata) is not dict ): raise ValueError(f"a dict was expected, got {type(logdata).__name__}")
+        except ValueError as e:
+            issues['malformed'] = str(e)
+            return {}, issues
+    for journal_path in [a_fnc.getCompactingPath(log_path), a_fnc.getJournalPath(log_path)]:
+        if( not os.path.exists(journal_path) ): continue
+        with open(journal_path, 'r') as journal:
+            journal_lines = sum(1 for line in journal if line.strip())
+        issues['bad_journal_lines'] += journal_lines - a_fnc.replayJournal( journal_path, logdata )
+    # leave out (and count) anything that is not a point of this area and month
+    for date_key in list(logdata):
+        date_vals = logdata[date_key]
+        if( type(date_vals) is not dict or not date_key.startswith(month_key) ):
+            issues['bad_entries'] += len(date_vals) if type(date_vals) is dict else 1
+            del logdata[date_key]
+            continue
+        for time_key in list(date_vals):
+            try:
+                dt.datetime.strptime(time_key, '%Y-%m-%d %H:%M')
+                if( not time_key.startswith(date_key) or type(date_vals[time_key].get(area_code)) is not dict ): raise ValueError(time_key)
+            except (ValueError, AttributeError):
+                issues['bad_entries'] += 1
+                del date_vals[time_key]
+    return logdata, issues
+
+
+# Check if a value decoded from the columns is the value of the log (float32 keeps ~7 significant digits)
+def isSameValue( col_value, log_value ):
+    if( log_value is None ): return math.isnan(col_value)
+    if( isinstance(log_value, bool) or not isinstance(log_value, (int, float)) or math.isnan(col_value) ): return False
+    return math.isclose(col_value, log_value, rel_tol = 1e-6, abs_tol = 1e-6)
+
+
+# Compare the columns of a month with its log point by point: each value and quality flag is decoded from the columns
+# and compared with the one of the JSON log (not with a conversion of it), returns (points checked, mismatches, dropped)
+# slots with data in the columns but not in the log are mismatches too, dropped is {val_name: count} of the values
+# of the log the columns do not keep (variables that are not in graph_amedas_dic, or added after the month was created)
+def verifyMonthColumns( area_code, month_datetime, logdata ):
+    vals, flags = a_col.openMonthColumns( area_code, month_datetime, 'r' )
+    if( vals is None ): return 0, -1, {}
+    logged_slots = np.zeros(vals.shape[1], dtype = bool)
+    points_cnt = 0
+    mismatches = 0
+    dropped = {}
+    for date_vals in logdata.values():
+        for time_key, entry_vals in date_vals.items():
+            slot_idx = a_col.getSlotIndex(dt.datetime.strptime(time_key, '%Y-%m-%d %H:%M'))
+            logged_slots[slot_idx] = True
+            points_cnt += 1
+            datapoint = entry_vals[area_code]
+            for val_name in a_col.colstore_vars[:vals.shape[0]]:
+                var_idx = a_col.colstore_var_idx[val_name]
+                try:
+                    log_value, log_flag = datapoint[val_name][0], datapoint[val_name][1]
+                except (KeyError, TypeError, IndexError):
+                    log_value, log_flag = None, None
+                col_flag = int(flags[var_idx, slot_idx])
+                if( not isSameValue(float(vals[var_idx, slot_idx]), log_value) or col_flag != (a_col.flag_missing if log_flag is None else log_flag) ): mismatches += 1
+            for val_name in datapoint:
+                if( a_col.colstore_var_idx.get(val_name, vals.shape[0]) >= vals.shape[0] ): dropped[val_name] = dropped.get(val_name, 0) + 1
+    # data in slots the log does not have
+    mismatches += int(np.count_nonzero((flags[:, ~logged_slots] != a_col.flag_missing) | ~np.isnan(vals[:, ~logged_slots])))
+    return points_cnt, mismatches, dropped
+
+
+# Create the columns of a month from its log, for a live archive: a point stored by the collector while they are
+# being created can go to the columns that are replaced, so the points of the log are written again (in place, as the
+# collector does) until the log does not change any more. The collector appends to the journal before writing the columns,
+# so a point appended after the last check is written to the new columns by the collector itself
+# returns (logdata, log_signature, issues) of the last version of the log
+def createLiveMonthColumns( area_code, month_datetime, log_path, logdata, log_signature, issues, max_syncs = 10 ):
+    a_col.createMonthColumns( area_code, month_datetime, logdata )
+    for _ in range(max_syncs):
+        new_signature = a_fnc.getWeatherLogSignature( log_path )
+        if( new_signature == log_signature ): break
+        log_signature = new_signature
+        logdata, issues = inspectMonthLog( log_path, area_code, month_datetime.strftime('%Y-%m') )
+        if( issues['malformed'] ): break
+        vals, flags = a_col.openMonthColumns( area_code, month_datetime, 'r+' )
+        for date_vals in logdata.values():
+            for time_key, entry_vals in date_vals.items():
+                a_col.setColumnPoint( vals, flags, a_col.getSlotIndex(dt.datetime.strptime(time_key, '%Y-%m-%d %H:%M')), entry_vals[area_code] )
+        vals.flush()
+        flags.flush()
+        del vals, flags
+    return logdata, log_signature, issues
+
+
+# Migrate (or check) one month of an area, returns the result of the job (see the status list above)
+def migrateMonthLog( area_code, month_key, rebuild = False ):
+    start = time.perf_counter()
+    month_datetime = dt.datetime.strptime(month_key, '%Y-%m')
+    log_path = a_fnc.buildPathFromDate( target_datetime = month_key + '-01', target = "l", area_code = area_code )
+    col_paths = a_col.buildColumnPaths( area_code, month_datetime )
+    result = {'area':area_code, 'month':month_key, 'status':'error', 'points':0, 'mismatches':0, 'dropped':{}, 'bad_entries':0, 'bad_journal_lines':0,
+              'bytes_before':0, 'bytes_after':0, 'time':0.0, 'error':'', 'signature':None}
+    try:
+        log_signature = a_fnc.getWeatherLogSignature( log_path )
+        result['signature'] = log_signature
+        result['bytes_before'] = sum(file_sig[1] for file_sig in log_signature if file_sig)
+        logdata, issues = inspectMonthLog( log_path, area_code, month_key )
+        result['bad_entries'], result['bad_journal_lines'] = issues['bad_entries'], issues['bad_journal_lines']
+        if( issues['malformed'] ):
+            result['status'], result['error'] = 'malformed', issues['malformed']
+            return result
+        columns_exist = all(os.path.exists(col_path) for col_path in col_paths)
+        if( rebuild or not columns_exist ):
+            logdata, log_signature, issues = createLiveMonthColumns( area_code, month_datetime, log_path, logdata, log_signature, issues )
+            result['status'] = 'created'
+        else:
+            result['status'] = 'verified'
+        if( issues['malformed'] ):
+            result['status'], result['error'] = 'malformed', issues['malformed']
+            return result
+        result['points'], result['mismatches'], result['dropped'] = verifyMonthColumns( area_code, month_datetime, logdata )
+        if( result['mismatches'] ):
+            # never build the columns again from an old copy of a log that is being written
+            if( a_fnc.getWeatherLogSignature(log_path) != log_signature ):
+                result['status'] = 'changed'
+            elif( result['status'] == 'verified' ):
+                logdata, log_signature, issues = createLiveMonthColumns( area_code, month_datetime, log_path, logdata, log_signature, issues )
+                result['points'], result['mismatches'], result['dropped'] = verifyMonthColumns( area_code, month_datetime, logdata )
+                result['status'] = 'mismatch' if result['mismatches'] else 'repaired'
+            else:
+                result['status'] = 'mismatch'
+        result['signature'] = log_signature
+        result['bad_entries'], result['bad_journal_lines'] = issues['bad_entries'], issues['bad_journal_lines']
+        result['bytes_after'] = sum(os.path.getsize(col_path) for col_path in col_paths if os.path.exists(col_path))
+    except Exception as e:
+        result['status'], result['error'] = 'error', f"{type(e).__name__}: {e}"
+    finally:
+        result['time'] = time.perf_counter() - start
+    return result
+
+
+# Load the state of the migration {'YYYY-MM/area_code': log signature} of the months already checked
+def loadMigrateState( state_path ):
+    if( os.path.exists(state_path) ):
+        try:
+            with open(state_path, 'r') as state_file:
+                return json.load(state_file)
+        except ValueError as e:
+            print(f"Error: {e} -> migration state {state_path} is not valid, starting from scratch")
+    return {}
+
+
+# Write the state of the migration (temp file + rename so an interrupted write does not lose the progress)
+def saveMigrateState( state_path, migrate_state ):
+    os.makedirs( os.path.dirname(state_path), exist_ok = True )
+    with open(state_path + '.tmp', 'w') as state_file:
+        json.dump(migrate_state, state_file)
+    os.replace(state_path + '.tmp', state_path)
+
+
+# Migrate every monthly log on a pool of processes (one per CPU by default), returns the summary and the result of each month
+# months already checked with the same log signature are skipped (unless rebuild), the state is saved as the jobs finish
+def migrateMonthLogs( max_workers = None, rebuild = False, state_path = None, debugprint = False ):
+    if( state_path is None ): state_path = a_cfg.migrate_state
+    if( max_workers is None ): max_workers = os.cpu_count() or 1
+    migrate_state = {} if rebuild else loadMigrateState( state_path )
+    month_logs = listMonthLogs()
+    jobs = []
+    for area_code, month_key in month_logs:
+        log_path = a_fnc.buildPathFromDate( target_datetime = month_key + '-01', target = "l", area_code = area_code )
+        state_sig = migrate_state.get(f"{month_key}/{area_code}")
+        if( state_sig is not None and [list(file_sig) if file_sig else None for file_sig in a_fnc.getWeatherLogSignature(log_path)] == state_sig
+            and all(os.path.exists(col_path) for col_path in a_col.buildColumnPaths(area_code, dt.datetime.strptime(month_key, '%Y-%m'))) ): continue
+        jobs.append((area_code, month_key))
+    summary = {'months':len(month_logs), 'skipped':len(month_logs) - len(jobs), 'points':0, 'bytes_before':0, 'bytes_after':0, 'time':0.0, 'dropped':{}}
+    print(f"Migration: {len(jobs)} months to migrate/check ({summary['skipped']} already checked in a previous run)")
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor( max_workers = max(1, min(max_workers, len(jobs) or 1)) ) as executor:
+        futures = [executor.submit(migrateMonthLog, area_code, month_key, rebuild) for area_code, month_key in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if( result['status'] in migrate_ok_status ):
+                migrate_state[f"{result['month']}/{result['area']}"] = result['signature']
+                saveMigrateState( state_path, migrate_state )
+            if( debugprint == True or result['status'] not in migrate_ok_status or result['bad_entries'] or result['bad_journal_lines'] ): printMigrateResult( result )
+    summary['time'] = time.perf_counter() - start
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+        for sum_key in ['points', 'bytes_before', 'bytes_after']: summary[sum_key] += result[sum_key]
+        for val_name, dropped_cnt in result['dropped'].items(): summary['dropped'][val_name] = summary['dropped'].get(val_name, 0) + dropped_cnt
+    summary['points_per_s'] = summary['points'] / summary['time'] if summary['time'] else 0.0
+    summary['mb_per_s'] = summary['bytes_before'] / 1024 / 1024 / summary['time'] if summary['time'] else 0.0
+    return summary, sorted(results, key = lambda result: (result['month'], result['area']))
+
+
+# Print the result of a month
+def printMigrateResult( result ):
+    print(f"{result['month']} {result['area']}: {result['status']} {result['points']} points, {result['mismatches']} mismatches, {sum(result['dropped'].values())} values not kept, "
+          f"{result['bad_entries']} bad entries, {result['bad_journal_lines']} bad journal lines, {result['bytes_before']} -> {result['bytes_after']} bytes ({result['time']:.2f} s) {result['error']}")
+
+#----EOF--------------------------------------------------------
@@ -3,8 +3,7 @@
 
 import datetime as dt
 import os.path
-import json
-from collections import OrderedDict as ordDict
+from contextlib import contextmanager
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
@@ -12,12 +11,53 @@ import matplotlib.ticker as ticker
 import matplotlib.dates as mdates
 import amedas_config as a_cfg
 import amedas_funcs as a_fnc
+import amedas_series as a_ser
+import amedas_manifest as a_mnf
+import amedas_metrics as a_met
+
+## All the plots are drawn on the same figure, that is cleared before and after each plot, so memory does not grow with the number of plots
+plot_figure_num = 'amedas_plot'
+plot_figure_size = (10, 5)
+plot_style = 'dark_background'
+plot_style_applied = False
+
+
+# Apply the plot style (only the first time, it is the same for all the plots)
+def applyPlotStyle():
+    global plot_style_applied
+    if( not plot_style_applied ):
+        plt.style.use(plot_style)
+        plot_style_applied = True
+
+
+# Get the (cleared) plot figure with a single axis, and save it to plot_fname when leaving the with block
+# the figure is cleared after saving even if the plot failed, so no artist is kept alive between plots
+# the fingerprint of the inputs (see amedas_manifest) is recorded once the plot is saved
+@contextmanager
+def renderFigure( plot_fname, fingerprint = '', figsize = plot_figure_size ):
+    applyPlotStyle()
+    fig = plt.figure( num = plot_figure_num, clear = True )
+    fig.set_size_inches( figsize )
+    try:
+        ax = fig.subplots()
+        yield fig, ax
+        with a_met.timed('plot_save'):
+            fig.savefig(plot_fname)
+        if( fingerprint ): a_mnf.recordRender( plot_fname, fingerprint )
+    finally:
+        fig.clf()
+
+
+# Close the plot figure (e.g. at the end of a long-running process)
+def closePlotFigure():
+    plt.close(plot_figure_num)
 
 
 # Composite scatter plot of a given information (e.g. rain, temperature, wind, etc)
-def plotAmedasCompositeScatter(data_fname='', val_name_A='', val_name_B='', date_key='', plot_save_path='./', area_code = 0 ):
-    #if there is no file given or value_name not valid, then do nothing
-    if( not data_fname or val_name_A not in a_cfg.graph_amedas_dic or val_name_B not in a_cfg.graph_amedas_dic ): return False
+@a_met.timedFunction('plot', label = 'plot')
+def plotAmedasCompositeScatter( val_name_A='', val_name_B='', date_key='', plot_save_path='./', area_code = 0 ):
+    #if value_name not valid, then do nothing
+    if( val_name_A not in a_cfg.graph_amedas_dic or val_name_B not in a_cfg.graph_amedas_dic ): return False
     #if a date was not specified, then go and look for today's data
     if( not date_key ): date_key = dt.date.today().strftime('%Y-%m-%d')
     if( plot_save_path == './'): plot_save_path = a_fnc.buildPathFromDate( target_datetime = date_key, target = "g", area_code = area_code  )
@@ -27,52 +67,48 @@ def plotAmedasCompositeScatter(data_fname='', val_name_A='', val_name_B='', date
     # create the directory if required
     os.makedirs( os.path.dirname(plot_fname), exist_ok = True )
     
-    #get the data from the json file
-    allvals = json.load(open(data_fname, 'r'))
-    if date_key not in allvals.keys():
+    #get the data of the day (X axis as a float describing the hour of the day, e.g., 13.5 = 13:30)
+    series = a_ser.loadSeries( area_code, [val_name_A, val_name_B], date_key )
+    xAxis, yAxis = series[(area_code, val_name_A)]
+    xAxis2, yAxis2 = series[(area_code, val_name_B)]
+    # the graph is made if at least one of the 2 variables has points that day (each one is drawn with its own points),
+    # the JSON version gave up only when the day was not in the log, and stopped with a KeyError if a point lacked one of them
+    if( not len(xAxis) and not len(xAxis2) ):
         print(f"Date ({date_key}) does not exists in the JSON file. Graph will not be created.")
         return False
-    todayvals = allvals[date_key]
-    todayvals_sorted = ordDict(sorted(todayvals.items()))
-    
-    yAxis  = [value[area_code][val_name_A][0] for key, value in todayvals_sorted.items()]
-    yAxis2 = [value[area_code][val_name_B][0] for key, value in todayvals_sorted.items()]
-    #set the X axis as a float describing the hour of the day (e.g., 13.5 = 13:30) 
-    xAxis = [0]*len(yAxis)
-    for (index, (key, value)) in enumerate(todayvals_sorted.items()):
-        xAxis[index] = (float(key.split(' ')[1].split(':')[0])) + (float(key.split(' ')[1].split(':')[1]) / 60)
-
-    #Format the plot   (this part is still on construction....)
-    plt.style.use('dark_background')
-    fig, ax = plt.subplots(figsize=(10, 5))
-    ax.plot(xAxis,yAxis, color='limegreen', marker='v')
-    plt.grid(True)
-    plt.xlim([0,(24)])
-    plt.title(f"{a_cfg.graph_amedas_dic[val_name_A][0]} / {a_cfg.graph_amedas_dic[val_name_B][0]} @ {a_cfg.area_info[area_code]['name']} {date_key}")
-    ax.set_xlabel('Time [%H]')
-    ax.set_ylabel(a_cfg.graph_amedas_dic[val_name_A][1], color='limegreen')
-    if(val_name_A == "humidity"): ax.set_ylim([0,(100)])     ## TEMP solution, TODO: Set limit based on the category?
-    ax.xaxis.set_major_locator(ticker.MaxNLocator(nbins=24))
-    #create the second axis
-    ax2 = ax.twinx()
-    ax2.plot(xAxis,yAxis2, color='deepskyblue', marker='o')
-    #plt.grid(True)
-    plt.grid(color = 'deepskyblue', linestyle = '--', linewidth = 0.5)
-    ax2.set_ylabel(a_cfg.graph_amedas_dic[val_name_B][1], color='deepskyblue')
-    if(val_name_B == "humidity"): ax2.set_ylim([0,(100)])     ## TEMP solution, TODO: Set limit based on the category?
-    ax2.xaxis.set_major_locator(ticker.MaxNLocator(nbins=24))
-    plt.xlim([0,(24)])
-    
-    #save the plot!
-    plt.savefig(plot_fname)
+
+    # nothing to do if the graph was already rendered from the same data
+    fingerprint = a_mnf.buildRenderFingerprint( 'composite', plot_fname, [a_cfg.area_info[area_code], a_cfg.graph_amedas_dic[val_name_A], a_cfg.graph_amedas_dic[val_name_B], plot_style, plot_figure_size], [xAxis, yAxis, xAxis2, yAxis2] )
+    if( a_mnf.isRenderUpToDate( plot_fname, fingerprint ) ): return True
+
+    #Format the plot, it is saved when leaving the with block   (this part is still on construction....)
+    with renderFigure( plot_fname, fingerprint ) as (fig, ax):
+        ax.plot(xAxis,yAxis, color='limegreen', marker='v')
+        plt.grid(True)
+        plt.xlim([0,(24)])
+        plt.title(f"{a_cfg.graph_amedas_dic[val_name_A][0]} / {a_cfg.graph_amedas_dic[val_name_B][0]} @ {a_cfg.area_info[area_code]['name']} {date_key}")
+        ax.set_xlabel('Time [%H]')
+        ax.set_ylabel(a_cfg.graph_amedas_dic[val_name_A][1], color='limegreen')
+        if(val_name_A == "humidity"): ax.set_ylim([0,(100)])     ## TEMP solution, TODO: Set limit based on the category?
+        ax.xaxis.set_major_locator(ticker.MaxNLocator(nbins=24))
+        #create the second axis
+        ax2 = ax.twinx()
+        ax2.plot(xAxis2,yAxis2, color='deepskyblue', marker='o')
+        #plt.grid(True)
+        plt.grid(color = 'deepskyblue', linestyle = '--', linewidth = 0.5)
+        ax2.set_ylabel(a_cfg.graph_amedas_dic[val_name_B][1], color='deepskyblue')
+        if(val_name_B == "humidity"): ax2.set_ylim([0,(100)])     ## TEMP solution, TODO: Set limit based on the category?
+        ax2.xaxis.set_major_locator(ticker.MaxNLocator(nbins=24))
+        plt.xlim([0,(24)])
 
     return True
 
 
 # Simple scatter plot of a given information (e.g. rain, temperature, wind, etc)
-def plotAmedasSingleScatter(data_fname='', val_name='', date_key='', plot_save_path='./', area_code = 0 ):
-    #if there is no file given or value_name not valid, then do nothing
-    if( not data_fname or val_name not in a_cfg.graph_amedas_dic ): return False
+@a_met.timedFunction('plot', label = 'plot')
+def plotAmedasSingleScatter( val_name='', date_key='', plot_save_path='./', area_code = 0 ):
+    #if value_name not valid, then do nothing
+    if( val_name not in a_cfg.graph_amedas_dic ): return False
     #if a date was not specified, then go and look for today's data
     if( not date_key ): date_key = dt.date.today().strftime('%Y-%m-%d')
     if( plot_save_path == './'): plot_save_path = a_fnc.buildPathFromDate( target_datetime = date_key, target = "g", area_code = area_code )
@@ -82,37 +118,32 @@ def plotAmedasSingleScatter(data_fname='', val_name='', date_key='', plot_save_p
     # create the directory if required
     os.makedirs( os.path.dirname(plot_fname), exist_ok = True )
     
-    #get the data from the json file
-    allvals = json.load(open(data_fname, 'r'))
-    if date_key not in allvals.keys():
+    #get the data of the day (X axis as a float describing the hour of the day, e.g., 13.5 = 13:30)
+    xAxis, yAxis = a_ser.loadSeries( area_code, val_name, date_key )[(area_code, val_name)]
+    if( not len(xAxis) ):
         print(f"Date ({date_key}) does not exists in the JSON file. Graph will not be created.")
         return False
-    todayvals = allvals[date_key]
-    todayvals_sorted = ordDict(sorted(todayvals.items()))
-    yAxis  = [value[area_code][val_name][0] for key, value in todayvals_sorted.items()]
-    #set the X axis as a float describing the hour of the day (e.g., 13.5 = 13:30) 
-    xAxis = [0]*len(yAxis)
-    for (index, (key, value)) in enumerate(todayvals_sorted.items()):
-        xAxis[index] = (float(key.split(' ')[1].split(':')[0])) + (float(key.split(' ')[1].split(':')[1]) / 60)
-
-    #Format the plot   (this part is still on construction....)
-    plt.style.use('dark_background')
-    fig, ax = plt.subplots(figsize=(10, 5))
-    plt.plot(xAxis,yAxis, color='limegreen', marker='v')
-    plt.grid(True)
-    plt.xlim([0,(24)])
-    plt.title(f"{a_cfg.graph_amedas_dic[val_name][0]} @ {a_cfg.area_info[area_code]['name']} {date_key}")
-    plt.xlabel('Time [%H]')
-    plt.ylabel(a_cfg.graph_amedas_dic[val_name][1])
-    ax.xaxis.set_major_locator(ticker.MaxNLocator(nbins=24))
-    #save the plot!
-    plt.savefig(plot_fname)
+
+    # nothing to do if the graph was already rendered from the same data
+    fingerprint = a_mnf.buildRenderFingerprint( 'single', plot_fname, [a_cfg.area_info[area_code], a_cfg.graph_amedas_dic[val_name], plot_style, plot_figure_size], [xAxis, yAxis] )
+    if( a_mnf.isRenderUpToDate( plot_fname, fingerprint ) ): return True
+
+    #Format the plot, it is saved when leaving the with block   (this part is still on construction....)
+    with renderFigure( plot_fname, fingerprint ) as (fig, ax):
+        plt.plot(xAxis,yAxis, color='limegreen', marker='v')
+        plt.grid(True)
+        plt.xlim([0,(24)])
+        plt.title(f"{a_cfg.graph_amedas_dic[val_name][0]} @ {a_cfg.area_info[area_code]['name']} {date_key}")
+        plt.xlabel('Time [%H]')
+        plt.ylabel(a_cfg.graph_amedas_dic[val_name][1])
+        ax.xaxis.set_major_locator(ticker.MaxNLocator(nbins=24))
     
     return True
 
 
 # Scatter plot comparing values of a given information for 2 different dates (e.g. rain, temperature, wind, etc, for today and 1 week ago)
 # if dates are not given, the function defaults to today and yesterday data comparison
+@a_met.timedFunction('plot', label = 'plot')
 def plotAmedasCompareScatter_2dates( val_name='', date_key_prv='', date_key_lst='', plot_save_path='./', area_code = 0 ):
     #if value_name is not valid, then do nothing
     if( val_name not in a_cfg.graph_amedas_dic ): return False
@@ -128,71 +159,42 @@ def plotAmedasCompareScatter_2dates( val_name='', date_key_prv='', date_key_lst=
     if( isinstance(date_key_lst, dt.datetime) ): date_key_lst = date_key_lst.strftime('%Y-%m-%d')
     if( not area_code ): area_code = a_cfg.area_code_def
     
-    data_fname_prv = a_fnc.buildPathFromDate( target_datetime = date_key_prv, target = "l", area_code = area_code )
-    data_fname_lst = a_fnc.buildPathFromDate( target_datetime = date_key_lst, target = "l", area_code = area_code )
     #create a file name for the plot
     plot_fname = os.path.join(plot_save_path, a_cfg.graph_generic_fname + a_cfg.graph_amedas_dic[val_name][2] + a_cfg.graph_comp_fname + date_key_prv + 'vs' + date_key_lst + a_cfg.graphs_file_ext)
     # create the directory if required
     os.makedirs( os.path.dirname(plot_fname), exist_ok = True )
     
-    #get the data from the json file
-    if( data_fname_prv == data_fname_lst ):
-        data_fname = data_fname_prv
-        allvals = json.load(open(data_fname, 'r'))
-        if date_key_prv not in allvals.keys():
-            print(f"Date ({date_key_prv}) does not exists in the JSON file. Graph will not be created.")
-            return False
-        if date_key_lst not in allvals.keys():
-            print(f"Date ({date_key_lst}) does not exists in the JSON file. Graph will not be created.")
-            return False
-    
-        vals_prv = allvals[date_key_prv]
-        vals_lst = allvals[date_key_lst]
-    else:
-        allvals_prv = json.load(open(data_fname_prv, 'r'))
-        if date_key_prv not in allvals_prv.keys():
-            print(f"Date ({date_key_prv}) does not exists in the JSON file. Graph will not be created.")
-            return False
-        allvals_lst = json.load(open(data_fname_lst, 'r'))
-        if date_key_lst not in allvals_lst.keys():
-            print(f"Date ({date_key_lst}) does not exists in the JSON file. Graph will not be created.")
-            return False
-    
-        vals_prv = allvals_prv[date_key_prv]
-        vals_lst = allvals_lst[date_key_lst]
-
-    vals_prv_sorted = ordDict(sorted(vals_prv.items()))
-    vals_lst_sorted = ordDict(sorted(vals_lst.items()))
-    yAxis_prv  = [value[area_code][val_name][0] for key, value in vals_prv_sorted.items()]
-    yAxis_lst  = [value[area_code][val_name][0] for key, value in vals_lst_sorted.items()]
-    #set the X axis as a float describing the hour of the day (e.g., 13.5 = 13:30) 
-    xAxis_prv = [0]*len(yAxis_prv)
-    for (index, (key, value)) in enumerate(vals_prv_sorted.items()):
-        xAxis_prv[index] = (float(key.split(' ')[1].split(':')[0])) + (float(key.split(' ')[1].split(':')[1]) / 60)
-
-    xAxis_lst = [0]*len(yAxis_lst)
-    for (index, (key, value)) in enumerate(vals_lst_sorted.items()):
-        xAxis_lst[index] = (float(key.split(' ')[1].split(':')[0])) + (float(key.split(' ')[1].split(':')[1]) / 60)
-
-    #Format the plot   (this part is still on construction....)
-    plt.style.use('dark_background')
-    fig, ax = plt.subplots(figsize=(10, 5))
-    plt.plot(xAxis_prv, yAxis_prv, color='limegreen', marker='v',  label = date_key_prv)
-    plt.plot(xAxis_lst, yAxis_lst, color='deepskyblue', marker='v', label = date_key_lst)
-    plt.grid(True)
-    plt.xlim([0,(24)])
-    plt.title(f"{a_cfg.graph_amedas_dic[val_name][0]} @ {a_cfg.area_info[area_code]['name']} {date_key_prv} vs {date_key_lst}")
-    plt.xlabel('Time [%H]')
-    plt.legend()
-    plt.ylabel(a_cfg.graph_amedas_dic[val_name][1])
-    ax.xaxis.set_major_locator(ticker.MaxNLocator(nbins=24))
-    #save the plot!
-    plt.savefig(plot_fname)
+    #get the data of both days (X axis as a float describing the hour of the day, e.g., 13.5 = 13:30)
+    xAxis_prv, yAxis_prv = a_ser.loadSeries( area_code, val_name, date_key_prv )[(area_code, val_name)]
+    if( not len(xAxis_prv) ):
+        print(f"Date ({date_key_prv}) does not exists in the JSON file. Graph will not be created.")
+        return False
+    xAxis_lst, yAxis_lst = a_ser.loadSeries( area_code, val_name, date_key_lst )[(area_code, val_name)]
+    if( not len(xAxis_lst) ):
+        print(f"Date ({date_key_lst}) does not exists in the JSON file. Graph will not be created.")
+        return False
+
+    # nothing to do if the graph was already rendered from the same data
+    fingerprint = a_mnf.buildRenderFingerprint( 'comp_dates', plot_fname, [a_cfg.area_info[area_code], a_cfg.graph_amedas_dic[val_name], plot_style, plot_figure_size], [xAxis_prv, yAxis_prv, xAxis_lst, yAxis_lst] )
+    if( a_mnf.isRenderUpToDate( plot_fname, fingerprint ) ): return True
+
+    #Format the plot, it is saved when leaving the with block   (this part is still on construction....)
+    with renderFigure( plot_fname, fingerprint ) as (fig, ax):
+        plt.plot(xAxis_prv, yAxis_prv, color='limegreen', marker='v',  label = date_key_prv)
+        plt.plot(xAxis_lst, yAxis_lst, color='deepskyblue', marker='v', label = date_key_lst)
+        plt.grid(True)
+        plt.xlim([0,(24)])
+        plt.title(f"{a_cfg.graph_amedas_dic[val_name][0]} @ {a_cfg.area_info[area_code]['name']} {date_key_prv} vs {date_key_lst}")
+        plt.xlabel('Time [%H]')
+        plt.legend()
+        plt.ylabel(a_cfg.graph_amedas_dic[val_name][1])
+        ax.xaxis.set_major_locator(ticker.MaxNLocator(nbins=24))
     
     return True
 
 
 # Scatter plot comparing values of a given information for 2 different areas (e.g. rain, temperature, wind, etc, for Mito and Tokyo)
+@a_met.timedFunction('plot', label = 'plot')
 def plotAmedasCompareScatter_2areas( val_name='', area_code_A='', area_code_B='', date_key='', plot_save_path='./' ):
     # if value_name is not valid, then do nothing
     if( val_name not in a_cfg.graph_amedas_dic ): return False
@@ -203,68 +205,43 @@ def plotAmedasCompareScatter_2areas( val_name='', area_code_A='', area_code_B=''
         date_key = dt.date.today().strftime('%Y-%m-%d')
     if( isinstance(date_key, dt.datetime) ): date_key = date_key.strftime('%Y-%m-%d')
     
-    data_fname_areaA = a_fnc.buildPathFromDate( target_datetime = date_key, target = "l", area_code = area_code_A )
-    data_fname_areaB = a_fnc.buildPathFromDate( target_datetime = date_key, target = "l", area_code = area_code_B )
     #create a file name for the plot
     plot_fname = os.path.join(plot_save_path, a_cfg.graph_generic_fname + a_cfg.graph_amedas_dic[val_name][2] + a_cfg.area_info[area_code_A]['short_name'] + 'VS' + a_cfg.area_info[area_code_B]['short_name'] + '_' + date_key + a_cfg.graphs_file_ext)
     # create the directory if required
     os.makedirs( os.path.dirname(plot_fname), exist_ok = True )
     
-    #get the data from the json file
-    if( data_fname_areaA == data_fname_areaB ):
-        data_fname = data_fname_areaA
-        allvals = json.load(open(data_fname, 'r'))
-        if date_key not in allvals.keys():
-            print(f"Date ({date_key}) does not exists in the JSON file for area {area_code_A}. Graph will not be created.")
-            return False
-    
-        vals_areaA = allvals[date_key]
-        vals_areaB = allvals[date_key]
-    else:
-        allvals_areaA = json.load(open(data_fname_areaA, 'r'))
-        if date_key not in allvals_areaA.keys():
-            print(f"Date ({date_key}) does not exists in the JSON file for area {area_code_A}. Graph will not be created.")
-            return False
-        allvals_areaB = json.load(open(data_fname_areaB, 'r'))
-        if date_key not in allvals_areaB.keys():
-            print(f"Date ({date_key}) does not exists in the JSON file for area {area_code_B}. Graph will not be created.")
-            return False
-    
-        vals_areaA = allvals_areaA[date_key]
-        vals_areaB = allvals_areaB[date_key]
-
-    vals_areaA_sorted = ordDict(sorted(vals_areaA.items()))
-    vals_areaB_sorted = ordDict(sorted(vals_areaB.items()))
-    yAxis_areaA  = [value[area_code_A][val_name][0] for key, value in vals_areaA_sorted.items()]
-    yAxis_areaB  = [value[area_code_B][val_name][0] for key, value in vals_areaB_sorted.items()]
-    #set the X axis as a float describing the hour of the day (e.g., 13.5 = 13:30) 
-    xAxis_areaA = [0]*len(yAxis_areaA)
-    for (index, (key, value)) in enumerate(vals_areaA_sorted.items()):
-        xAxis_areaA[index] = (float(key.split(' ')[1].split(':')[0])) + (float(key.split(' ')[1].split(':')[1]) / 60)
-
-    xAxis_areaB = [0]*len(yAxis_areaB)
-    for (index, (key, value)) in enumerate(vals_areaB_sorted.items()):
-        xAxis_areaB[index] = (float(key.split(' ')[1].split(':')[0])) + (float(key.split(' ')[1].split(':')[1]) / 60)
-
-    #Format the plot   (this part is still on construction....)
-    plt.style.use('dark_background')
-    fig, ax = plt.subplots(figsize=(10, 5))
-    plt.plot(xAxis_areaA, yAxis_areaA, color='limegreen', marker='v',   label = a_cfg.area_info[area_code_A]['name'])
-    plt.plot(xAxis_areaB, yAxis_areaB, color='deepskyblue', marker='v', label = a_cfg.area_info[area_code_B]['name'])
-    plt.grid(True)
-    plt.xlim([0,(24)])
-    plt.title(f"{a_cfg.graph_amedas_dic[val_name][0]} @ {date_key} - {a_cfg.area_info[area_code_A]['name']} vs {a_cfg.area_info[area_code_B]['name']}")
-    plt.xlabel('Time [%H]')
-    plt.legend()
-    plt.ylabel(a_cfg.graph_amedas_dic[val_name][1])
-    ax.xaxis.set_major_locator(ticker.MaxNLocator(nbins=24))
-    #save the plot!
-    plt.savefig(plot_fname)
+    #get the data of the day for both areas (X axis as a float describing the hour of the day, e.g., 13.5 = 13:30)
+    series = a_ser.loadSeries( [area_code_A, area_code_B], val_name, date_key )
+    xAxis_areaA, yAxis_areaA = series[(area_code_A, val_name)]
+    if( not len(xAxis_areaA) ):
+        print(f"Date ({date_key}) does not exists in the JSON file for area {area_code_A}. Graph will not be created.")
+        return False
+    xAxis_areaB, yAxis_areaB = series[(area_code_B, val_name)]
+    if( not len(xAxis_areaB) ):
+        print(f"Date ({date_key}) does not exists in the JSON file for area {area_code_B}. Graph will not be created.")
+        return False
+
+    # nothing to do if the graph was already rendered from the same data
+    fingerprint = a_mnf.buildRenderFingerprint( 'comp_areas', plot_fname, [a_cfg.area_info[area_code_A], a_cfg.area_info[area_code_B], a_cfg.graph_amedas_dic[val_name], plot_style, plot_figure_size], [xAxis_areaA, yAxis_areaA, xAxis_areaB, yAxis_areaB] )
+    if( a_mnf.isRenderUpToDate( plot_fname, fingerprint ) ): return True
+
+    #Format the plot, it is saved when leaving the with block   (this part is still on construction....)
+    with renderFigure( plot_fname, fingerprint ) as (fig, ax):
+        plt.plot(xAxis_areaA, yAxis_areaA, color='limegreen', marker='v',   label = a_cfg.area_info[area_code_A]['name'])
+        plt.plot(xAxis_areaB, yAxis_areaB, color='deepskyblue', marker='v', label = a_cfg.area_info[area_code_B]['name'])
+        plt.grid(True)
+        plt.xlim([0,(24)])
+        plt.title(f"{a_cfg.graph_amedas_dic[val_name][0]} @ {date_key} - {a_cfg.area_info[area_code_A]['name']} vs {a_cfg.area_info[area_code_B]['name']}")
+        plt.xlabel('Time [%H]')
+        plt.legend()
+        plt.ylabel(a_cfg.graph_amedas_dic[val_name][1])
+        ax.xaxis.set_major_locator(ticker.MaxNLocator(nbins=24))
     
     return True
 
 
 # Scatter plot comparing values of a given information for all areas (e.g. rain, temperature, wind, etc.)
+@a_met.timedFunction('plot', label = 'plot')
 def plotAmedasCompareScatter_Allareas( val_name='', date_key='', plot_save_path='./' ):
     # if value_name is not valid, then do nothing
     if( val_name not in a_cfg.graph_amedas_dic ): return False
@@ -273,52 +250,42 @@ def plotAmedasCompareScatter_Allareas( val_name='', date_key='', plot_save_path=
         date_key = dt.date.today().strftime('%Y-%m-%d')
     if( isinstance(date_key, dt.datetime) ): date_key = date_key.strftime('%Y-%m-%d')
 
-    data_fname_areas = {}
-    for areacd in a_cfg.area_info :
-        if( areacd == 'common' ): continue
-        data_fname_area = a_fnc.buildPathFromDate( target_datetime = date_key, target = "l", area_code = areacd )
-        data_fname_areas[areacd] = data_fname_area
+    area_codes = [areacd for areacd in a_cfg.area_info if areacd != 'common']
 
-    if( data_fname_areas ):
+    if( area_codes ):
         # List not empty
         plot_fname = os.path.join(plot_save_path, a_cfg.graph_generic_fname + a_cfg.graph_amedas_dic[val_name][2] + a_cfg.graph_comp_fname + 'AllAreasVS' + '_' + date_key + a_cfg.graphs_file_ext)
         # create the directory if required
         os.makedirs( os.path.dirname(plot_fname), exist_ok = True )
 
-        # get the data from the json files and set the plot and format the plot
-        plt.style.use('dark_background')
-        fig, ax = plt.subplots(figsize=(10, 5))
-        for data_areacd, data_jsonpath in data_fname_areas.items() :
-            allvals_area = json.load(open(data_jsonpath, 'r'))
-            if date_key not in allvals_area.keys():
+        # get the data of all the areas (X axis as a float describing the hour of the day, e.g., 13.5 = 13:30) and set the plot and format the plot
+        series = a_ser.loadSeries( area_codes, val_name, date_key )
+        for data_areacd in area_codes :
+            if( not len(series[(data_areacd, val_name)][0]) ):
                 print(f"Date ({date_key}) does not exists in the JSON file for area {data_areacd}. Graph will not be created.")
                 return False
-            vals_area = allvals_area[date_key]
-            vals_area_sorted = ordDict(sorted(vals_area.items()))
-            # set the Y axis
-            yAxis_area = [value[data_areacd][val_name][0] for key, value in vals_area_sorted.items()]
-            # set the X axis as a float describing the hour of the day (e.g., 13.5 = 13:30) 
-            xAxis_area = [0]*len(yAxis_area)
-            for (index, (key, value)) in enumerate(vals_area_sorted.items()):
-                xAxis_area[index] = (float(key.split(' ')[1].split(':')[0])) + (float(key.split(' ')[1].split(':')[1]) / 60)
-            # plot the values for the current area
-            plt.plot(xAxis_area, yAxis_area, color=a_cfg.area_info[data_areacd]['color'], marker=a_cfg.area_info[data_areacd]['marker'], label=a_cfg.area_info[data_areacd]['name'])
+        # nothing to do if the graph was already rendered from the same data
+        fingerprint = a_mnf.buildRenderFingerprint( 'all_areas', plot_fname, [[a_cfg.area_info[areacd] for areacd in area_codes], a_cfg.graph_amedas_dic[val_name], plot_style, plot_figure_size], [data_array for areacd in area_codes for data_array in series[(areacd, val_name)]] )
+        if( a_mnf.isRenderUpToDate( plot_fname, fingerprint ) ): return True
+        with renderFigure( plot_fname, fingerprint ) as (fig, ax):
+            for data_areacd in area_codes :
+                xAxis_area, yAxis_area = series[(data_areacd, val_name)]
+                # plot the values for the current area
+                plt.plot(xAxis_area, yAxis_area, color=a_cfg.area_info[data_areacd]['color'], marker=a_cfg.area_info[data_areacd]['marker'], label=a_cfg.area_info[data_areacd]['name'])
 
-        plt.grid(True)
-        plt.xlim([0,(24)])
-        plt.title(f"{a_cfg.graph_amedas_dic[val_name][0]} @ {date_key}")
-        plt.xlabel('Time [%H]')
-        # Lets put the legend box below the grpah... so,shrink current axis's height by 10% on the bottom
-        plotbox = ax.get_position()
-        ax.set_position([plotbox.x0, plotbox.y0 + plotbox.height * 0.1, plotbox.width, plotbox.height * 0.9])
-        # Put a legend below current axis
-        ax.legend(loc='upper center', bbox_to_anchor=(0.5, -0.05), fancybox=True, shadow=True, ncol=(len(a_cfg.area_info)-1))
-        #plt.legend()
-        plt.ylabel(a_cfg.graph_amedas_dic[val_name][1])
-        if(val_name == "humidity"): plt.ylim([0,(100)])     ## TEMP solution, TODO: Set limit based on the category?
-        ax.xaxis.set_major_locator(ticker.MaxNLocator(nbins=24))
-        #save the plot!
-        plt.savefig(plot_fname)
+            plt.grid(True)
+            plt.xlim([0,(24)])
+            plt.title(f"{a_cfg.graph_amedas_dic[val_name][0]} @ {date_key}")
+            plt.xlabel('Time [%H]')
+            # Lets put the legend box below the grpah... so,shrink current axis's height by 10% on the bottom
+            plotbox = ax.get_position()
+            ax.set_position([plotbox.x0, plotbox.y0 + plotbox.height * 0.1, plotbox.width, plotbox.height * 0.9])
+            # Put a legend below current axis
+            ax.legend(loc='upper center', bbox_to_anchor=(0.5, -0.05), fancybox=True, shadow=True, ncol=(len(a_cfg.area_info)-1))
+            #plt.legend()
+            plt.ylabel(a_cfg.graph_amedas_dic[val_name][1])
+            if(val_name == "humidity"): plt.ylim([0,(100)])     ## TEMP solution, TODO: Set limit based on the category?
+            ax.xaxis.set_major_locator(ticker.MaxNLocator(nbins=24))
 
         return True
     else:
@@ -326,4 +293,152 @@ def plotAmedasCompareScatter_Allareas( val_name='', date_key='', plot_save_path=
         print("No data!")
         return False
 
+# Max number of points of each line of a range plot (about the width of the figure in pixels)
+def getRangeMaxPoints( figsize = plot_figure_size ):
+    if( a_cfg.range_max_points ): return a_cfg.range_max_points
+    return int(figsize[0] * matplotlib.rcParams['figure.dpi'])
+
+
+# Get the date keys of a range (both included), the last date defaults to today and the first one to 30 days before the last one
+def getRangeDateKeys( date_first = '', date_last = '' ):
+    if( not date_last ): date_last = dt.date.today().strftime('%Y-%m-%d')
+    if( isinstance(date_last, (dt.datetime, dt.date)) ): date_last = date_last.strftime('%Y-%m-%d')
+    if( not date_first ): date_first = (dt.datetime.strptime( date_last, '%Y-%m-%d') - dt.timedelta(days = 30)).strftime('%Y-%m-%d')
+    if( isinstance(date_first, (dt.datetime, dt.date)) ): date_first = date_first.strftime('%Y-%m-%d')
+    return date_first, date_last
+
+
+# Get the downsampled series (times as datetime64[m]) of some areas and variables for a range of dates
+# returns {(area_code, val_name): (times, values)}
+def loadRangeSeries( area_codes, val_names, date_first, date_last ):
+    series = a_ser.loadSeriesTimes( area_codes, val_names, a_ser.listDateRange(date_first, date_last) )
+    max_points = getRangeMaxPoints()
+    return {series_key:a_ser.downsampleSeries(times, values, max_points) for series_key, (times, values) in series.items()}
+
+
+# Use a date axis (the labels adapt to the length of the range: hours, days or months)
+def formatDateAxis( ax ):
+    locator = mdates.AutoDateLocator()
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+
+
+# Line plot of a given information over a range of dates (e.g. a season or a year), with a real date axis
+@a_met.timedFunction('plot', label = 'plot')
+def plotAmedasRangeSingle( val_name='', date_first='', date_last='', plot_save_path='./', area_code = 0 ):
+    #if value_name is not valid, then do nothing
+    if( val_name not in a_cfg.graph_amedas_dic ): return False
+    if( not area_code ): area_code = a_cfg.area_code_def
+    date_first, date_last = getRangeDateKeys( date_first, date_last )
+    if( plot_save_path == './'): plot_save_path = a_fnc.buildPathFromDate( target_datetime = date_last, target = "g", area_code = area_code )
+
+    #create a file name for the plot
+    plot_fname = os.path.join(plot_save_path, a_cfg.graph_generic_fname + a_cfg.graph_amedas_dic[val_name][2] + a_cfg.graph_range_fname + date_first + 'to' + date_last + a_cfg.graphs_file_ext)
+    # create the directory if required
+    os.makedirs( os.path.dirname(plot_fname), exist_ok = True )
+
+    #get the (downsampled) data of the range
+    times, yAxis = loadRangeSeries( [area_code], [val_name], date_first, date_last )[(area_code, val_name)]
+    if( not len(times) ):
+        print(f"Dates ({date_first} to {date_last}) do not exist in the JSON file. Graph will not be created.")
+        return False
+
+    # nothing to do if the graph was already rendered from the same data
+    fingerprint = a_mnf.buildRenderFingerprint( 'range_single', plot_fname, [a_cfg.area_info[area_code], a_cfg.graph_amedas_dic[val_name], plot_style, plot_figure_size, a_cfg.range_downsample], [times, yAxis] )
+    if( a_mnf.isRenderUpToDate( plot_fname, fingerprint ) ): return True
+
+    with renderFigure( plot_fname, fingerprint ) as (fig, ax):
+        ax.plot(times, yAxis, color='limegreen', linewidth=0.8)
+        plt.grid(True)
+        plt.title(f"{a_cfg.graph_amedas_dic[val_name][0]} @ {a_cfg.area_info[area_code]['name']} {date_first} to {date_last}")
+        plt.ylabel(a_cfg.graph_amedas_dic[val_name][1])
+        if(val_name == "humidity"): plt.ylim([0,(100)])
+        formatDateAxis( ax )
+
+    return True
+
+
+# Line plot of 2 informations over a range of dates, one on each Y axis
+@a_met.timedFunction('plot', label = 'plot')
+def plotAmedasRangeComposite( val_name_A='', val_name_B='', date_first='', date_last='', plot_save_path='./', area_code = 0 ):
+    #if value_name not valid, then do nothing
+    if( val_name_A not in a_cfg.graph_amedas_dic or val_name_B not in a_cfg.graph_amedas_dic ): return False
+    if( not area_code ): area_code = a_cfg.area_code_def
+    date_first, date_last = getRangeDateKeys( date_first, date_last )
+    if( plot_save_path == './'): plot_save_path = a_fnc.buildPathFromDate( target_datetime = date_last, target = "g", area_code = area_code )
+
+    #create a file name for the plot
+    plot_fname = os.path.join(plot_save_path, a_cfg.graph_generic_fname + a_cfg.graph_amedas_dic[val_name_A][2] + 'And_' + a_cfg.graph_amedas_dic[val_name_B][2] + a_cfg.graph_range_fname + date_first + 'to' + date_last + a_cfg.graphs_file_ext)
+    # create the directory if required
+    os.makedirs( os.path.dirname(plot_fname), exist_ok = True )
+
+    #get the (downsampled) data of the range
+    series = loadRangeSeries( [area_code], [val_name_A, val_name_B], date_first, date_last )
+    times, yAxis = series[(area_code, val_name_A)]
+    times2, yAxis2 = series[(area_code, val_name_B)]
+    if( not len(times) and not len(times2) ):
+        print(f"Dates ({date_first} to {date_last}) do not exist in the JSON file. Graph will not be created.")
+        return False
+
+    # nothing to do if the graph was already rendered from the same data
+    fingerprint = a_mnf.buildRenderFingerprint( 'range_composite', plot_fname, [a_cfg.area_info[area_code], a_cfg.graph_amedas_dic[val_name_A], a_cfg.graph_amedas_dic[val_name_B], plot_style, plot_figure_size, a_cfg.range_downsample], [times, yAxis, times2, yAxis2] )
+    if( a_mnf.isRenderUpToDate( plot_fname, fingerprint ) ): return True
+
+    with renderFigure( plot_fname, fingerprint ) as (fig, ax):
+        ax.plot(times, yAxis, color='limegreen', linewidth=0.8)
+        plt.grid(True)
+        plt.title(f"{a_cfg.graph_amedas_dic[val_name_A][0]} / {a_cfg.graph_amedas_dic[val_name_B][0]} @ {a_cfg.area_info[area_code]['name']} {date_first} to {date_last}")
+        ax.set_ylabel(a_cfg.graph_amedas_dic[val_name_A][1], color='limegreen')
+        if(val_name_A == "humidity"): ax.set_ylim([0,(100)])
+        #create the second axis
+        ax2 = ax.twinx()
+        ax2.plot(times2, yAxis2, color='deepskyblue', linewidth=0.8)
+        ax2.set_ylabel(a_cfg.graph_amedas_dic[val_name_B][1], color='deepskyblue')
+        if(val_name_B == "humidity"): ax2.set_ylim([0,(100)])
+        formatDateAxis( ax )
+
+    return True
+
+
+# Line plot comparing a given information of several areas (all of them by default) over a range of dates
+@a_met.timedFunction('plot', label = 'plot')
+def plotAmedasRangeAreas( val_name='', date_first='', date_last='', plot_save_path='./', area_codes = None ):
+    #if value_name is not valid, then do nothing
+    if( val_name not in a_cfg.graph_amedas_dic ): return False
+    if( not area_codes ): area_codes = [areacd for areacd in a_cfg.area_info if areacd != 'common']
+    date_first, date_last = getRangeDateKeys( date_first, date_last )
+    if( plot_save_path == './'): plot_save_path = a_fnc.buildPathFromDate( target_datetime = date_last, target = "g", area_code = 'common' )
+
+    #create a file name for the plot
+    plot_fname = os.path.join(plot_save_path, a_cfg.graph_generic_fname + a_cfg.graph_amedas_dic[val_name][2] + a_cfg.graph_comp_fname + 'AllAreasVS' + '_' + a_cfg.graph_range_fname + date_first + 'to' + date_last + a_cfg.graphs_file_ext)
+    # create the directory if required
+    os.makedirs( os.path.dirname(plot_fname), exist_ok = True )
+
+    #get the (downsampled) data of the range, areas with no data are left out of the graph
+    series = loadRangeSeries( area_codes, [val_name], date_first, date_last )
+    area_codes = [areacd for areacd in area_codes if len(series[(areacd, val_name)][0])]
+    if( not area_codes ):
+        print(f"Dates ({date_first} to {date_last}) do not exist in the JSON files. Graph will not be created.")
+        return False
+
+    # nothing to do if the graph was already rendered from the same data
+    fingerprint = a_mnf.buildRenderFingerprint( 'range_areas', plot_fname, [[a_cfg.area_info[areacd] for areacd in area_codes], a_cfg.graph_amedas_dic[val_name], plot_style, plot_figure_size, a_cfg.range_downsample], [data_array for areacd in area_codes for data_array in series[(areacd, val_name)]] )
+    if( a_mnf.isRenderUpToDate( plot_fname, fingerprint ) ): return True
+
+    with renderFigure( plot_fname, fingerprint ) as (fig, ax):
+        for data_areacd in area_codes:
+            times, yAxis = series[(data_areacd, val_name)]
+            ax.plot(times, yAxis, color=a_cfg.area_info[data_areacd]['color'], linewidth=0.8, label=a_cfg.area_info[data_areacd]['name'])
+        plt.grid(True)
+        plt.title(f"{a_cfg.graph_amedas_dic[val_name][0]} @ {date_first} to {date_last}")
+        plt.ylabel(a_cfg.graph_amedas_dic[val_name][1])
+        if(val_name == "humidity"): plt.ylim([0,(100)])
+        # legend below the graph, as in the daily all areas plot
+        plotbox = ax.get_position()
+        ax.set_position([plotbox.x0, plotbox.y0 + plotbox.height * 0.1, plotbox.width, plotbox.height * 0.9])
+        ax.legend(loc='upper center', bbox_to_anchor=(0.5, -0.05), fancybox=True, shadow=True, ncol=min(len(area_codes), 8))
+        formatDateAxis( ax )
+
+    return True
+
 #----EOF--------------------------------------------------------
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import os.path
+import re
+import json
+import datetime as dt
+import numpy as np
+import amedas_config as a_cfg
+import amedas_funcs as a_fnc
+import amedas_colstore as a_col
+import amedas_record as a_rec
+
+## Queries read the stored points one partition (area, month) at a time: only the partitions of the range are opened,
+## the filters are applied to the arrays of each partition, and the rows are given back as soon as each one is done
+query_operators = {'>':np.greater, '>=':np.greater_equal, '<':np.less, '<=':np.less_equal, '==':np.equal, '!=':np.not_equal}
+query_where_re = re.compile(r'^\s*(\w+)\s*(>=|<=|==|!=|>|<)\s*(-?[\d.]+)\s*$')
+
+
+# Parse a filter like "temp>30" or "precipitation1h >= 0.5", returns (val_name, operator, value)
+def parseWhere( where_expr ):
+    match = query_where_re.match(where_expr)
+    if( not match or match.group(1) not in a_cfg.graph_amedas_dic ):
+        raise ValueError(f"Filter {where_expr} not valid, use <variable><operator><number> with one of {list(query_operators)} (e.g. temp>30)")
+    return match.group(1), match.group(2), float(match.group(3))
+
+
+# Parse a datetime of a query (YYYY-MM-DD or YYYY-MM-DD-HH:MM), end_of_day gives the last slot of the day for a date
+def parseQueryDatetime( query_datetime, end_of_day = False ):
+    if( isinstance(query_datetime, dt.datetime) ): return query_datetime
+    try:
+        return dt.datetime.strptime(query_datetime, '%Y-%m-%d-%H:%M')
+    except ValueError:
+        query_date = dt.datetime.strptime(query_datetime, '%Y-%m-%d')
+        return query_date + dt.timedelta(hours = 23, minutes = 50) if end_of_day else query_date
+
+
+# List the partitions (area_code, first day of the month) of a range that have stored data
+def listPartitions( area_codes, from_datetime, to_datetime ):
+    partitions = []
+    for area_code in area_codes:
+        month = from_datetime.replace(day = 1, hour = 0, minute = 0, second = 0, microsecond = 0)
+        while( month <= to_datetime ):
+            log_path = a_fnc.buildPathFromDate( target_datetime = month.strftime('%Y-%m-%d'), target = "l", area_code = area_code )
+            if( os.path.exists(a_col.buildColumnPaths(area_code, month)[0]) or os.path.exists(log_path) or os.path.exists(a_fnc.getJournalPath(log_path)) ):
+                partitions.append((area_code, month))
+            month = (month + dt.timedelta(days = 32)).replace(day = 1)
+    return partitions
+
+
+# Read the points of a partition as aligned arrays: (times datetime64[m], {val_name: values}, {val_name: flags})
+# missing values are NaN (and their flag 255), the columnar store is used if the month is there (and has every stored slot)
+def readPartition( area_code, month, val_names ):
+    month_cols = a_col.readMonthColumns( area_code, month, val_names )
+    if( month_cols is not None and a_col.hasAllStoredSlots( area_code, month ) ):
+        any_flags = next(iter(month_cols.values()))[1] if month_cols else np.zeros(0, dtype = np.uint8)
+        slots = np.arange(len(any_flags))
+        times = np.datetime64(month, 'm') + slots.astype('timedelta64[m]') * 10
+        values = {val_name:np.asarray(month_cols[val_name][0], dtype = np.float64) if val_name in month_cols else np.full(len(slots), np.nan) for val_name in val_names}
+        flags = {val_name:np.asarray(month_cols[val_name][1]) if val_name in month_cols else np.full(len(slots), a_col.flag_missing, dtype = np.uint8) for val_name in val_names}
+        return times, values, flags
+    log_path = a_fnc.buildPathFromDate( target_datetime = month.strftime('%Y-%m-%d'), target = "l", area_code = area_code )
+    times, records = a_rec.recordSeriesToArrays( a_fnc.loadWeatherRecords(log_path, area_code) )
+    values, flags = {}, {}
+    for val_name in val_names:
+        if( val_name not in a_rec.record_var_idx ):
+            values[val_name] = np.full(len(times), np.nan)
+            flags[val_name] = np.full(len(times), a_col.flag_missing, dtype = np.uint8)
+            continue
+        val_flags = a_rec.getFlagsColumn(records, val_name).astype(np.uint8)
+        missing = val_flags == a_rec.record_flag_missing
+        values[val_name] = np.where(missing, np.nan, records['values'][:, a_rec.record_var_idx[val_name]].astype(np.float64))
+        flags[val_name] = np.where(missing, a_col.flag_missing, val_flags).astype(np.uint8)
+    return times, values, flags
+
+
+# Run a query partition by partition, yields (area_code, times, {val_name: values}, {val_name: flags}) for each partition
+# only the rows in the range, that pass all the filters and have a value for at least one of the variables are given
+def iterQueryChunks( area_codes, val_names, from_datetime, to_datetime, where_exprs = () ):
+    wheres = [parseWhere(where_expr) for where_expr in where_exprs]
+    scan_names = list(dict.fromkeys(list(val_names) + [val_name for val_name, _, _ in wheres]))
+    from64, to64 = np.datetime64(from_datetime, 'm'), np.datetime64(to_datetime, 'm')
+    for area_code, month in listPartitions( area_codes, from_datetime, to_datetime ):
+        times, values, flags = readPartition( area_code, month, scan_names )
+        keep = (times >= from64) & (times <= to64)
+        keep &= np.logical_or.reduce([~np.isnan(values[val_name]) for val_name in val_names]) if val_names else True
+        # comparisons with NaN are False, so points with no value never pass a filter
+        with np.errstate(invalid = 'ignore'):
+            for val_name, operator, value in wheres:
+                keep &= query_operators[operator](values[val_name], value)
+        if( not keep.any() ): continue
+        yield area_code, times[keep], {val_name:values[val_name][keep] for val_name in val_names}, {val_name:flags[val_name][keep] for val_name in val_names}
+
+
+# Run a query and get all the rows as NumPy arrays {'area': area codes, 'time': datetime64[m], val_name: values}
+def queryArrays( area_codes, val_names, from_datetime, to_datetime, where_exprs = () ):
+    columns = {'area':[], 'time':[]}
+    columns.update({val_name:[] for val_name in val_names})
+    for area_code, times, values, flags in iterQueryChunks( area_codes, val_names, from_datetime, to_datetime, where_exprs ):
+        columns['area'].append(np.full(len(times), area_code))
+        columns['time'].append(times)
+        for val_name in val_names: columns[val_name].append(values[val_name])
+    empty = {'area':np.array([], dtype = str), 'time':np.array([], dtype = 'datetime64[m]')}
+    return {col_name:np.concatenate(parts) if parts else empty.get(col_name, np.array([], dtype = np.float64)) for col_name, parts in columns.items()}
+
+
+# Run a query and yield each row as a dict {'area', 'time', val_name: [value, flag]} (JMA format, None if there is no value)
+def iterQueryRows( area_codes, val_names, from_datetime, to_datetime, where_exprs = () ):
+    for area_code, times, values, flags in iterQueryChunks( area_codes, val_names, from_datetime, to_datetime, where_exprs ):
+        time_keys = np.datetime_as_string(times, unit = 'm')
+        for row in range(len(times)):
+            query_row = {'area':area_code, 'time':time_keys[row].replace('T', ' ')}
+            for val_name in val_names:
+                value = values[val_name][row]
+                query_row[val_name] = [None, None] if np.isnan(value) else [a_rec.shortFloat(value), int(flags[val_name][row])]
+            yield query_row
+
+
+# Write the rows of a query to a file (e.g. sys.stdout) as CSV (value and flag columns) or JSON lines, returns the number of rows
+def writeQueryRows( out_file, area_codes, val_names, from_datetime, to_datetime, where_exprs = (), out_format = 'csv' ):
+    row_cnt = 0
+    if( out_format == 'csv' ):
+        out_file.write(','.join(['area', 'time'] + [col_name for val_name in val_names for col_name in (val_name, val_name + '_flag')]) + '\n')
+    for query_row in iterQueryRows( area_codes, val_names, from_datetime, to_datetime, where_exprs ):
+        if( out_format == 'csv' ):
+            out_file.write(','.join([query_row['area'], query_row['time']] + ['' if item is None else str(item) for val_name in val_names for item in query_row[val_name]]) + '\n')
+        else:
+            out_file.write(json.dumps(query_row) + '\n')
+        row_cnt += 1
+    return row_cnt
+
+#----EOF--------------------------------------------------------
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import struct
+import math
+import datetime as dt
+from array import array
+import amedas_config as a_cfg
+import amedas_metrics as a_met
+
+## Compact representation of one data point of an area (instead of the JMA dict {"temp":[12.3, 0], "humidity":[80, 0], ...})
+## Fixed layout, little endian:
+##   values   float32 x N      one per variable of graph_amedas_dic (in that order), NaN if there is no value
+##   flags    uint64           4 bits per variable: the JMA quality flag (0-14), or record_flag_missing if the variable is not there
+##                             (a flag out of 0-14 is stored as record_flag_max and counted as 'clamped_flags', the records are
+##                             only a read cache of the monthly log, which keeps the flag as it came)
+##   intmask  uint16           1 bit per variable: the value was an integer in the JSON (so it is decoded the same way)
+## Only the variables of graph_amedas_dic are kept, add new variables at the end of graph_amedas_dic only (max 16)
+record_vars = list(a_cfg.graph_amedas_dic.keys())
+record_var_idx = {val_name:idx for idx, val_name in enumerate(record_vars)}
+record_flag_missing = 0xF
+record_flag_max = 0xE
+record_struct = struct.Struct('<' + 'f' * len(record_vars) + 'QH')
+record_all_missing = sum(record_flag_missing << (4 * idx) for idx in range(len(record_vars)))
+record_epoch = dt.datetime(1970, 1, 1)
+
+
+# Get the value of a float32 as the shortest float that gives back the same float32 (e.g. 1013.2 instead of 1013.2000122)
+def shortFloat( value ):
+    return float('%.7g' % value)
+
+
+# One data point of an area, packed in record_struct.size bytes
+class AmedasRecord:
+    __slots__ = ('packed',)
+
+    def __init__( self, packed = None ):
+        if( packed is None ): packed = record_struct.pack( *([math.nan] * len(record_vars)), record_all_missing, 0 )
+        self.packed = bytes(packed)
+
+    # Create a record from a data point in the JMA format, e.g. {"temp":[12.3, 0], "humidity":[80, 0], ...}
+    @classmethod
+    def fromJma( cls, datapoint ):
+        values = [math.nan] * len(record_vars)
+        flags = record_all_missing
+        intmask = 0
+        for val_name, val_pair in datapoint.items():
+            var_idx = record_var_idx.get(val_name)
+            if( var_idx is None ): continue
+            value, flag = val_pair[0], val_pair[1]
+            if( value is not None ):
+                values[var_idx] = float(value)
+                if( isinstance(value, int) ): intmask |= 1 << var_idx
+            flag = 0 if flag is None else int(flag)
+            if( not 0 <= flag <= record_flag_max ):
+                a_met.addCount('clamped_flags')
+                flag = record_flag_max
+            flags = (flags & ~(0xF << (4 * var_idx))) | (flag << (4 * var_idx))
+        return cls( record_struct.pack(*values, flags, intmask) )
+
+    # Get the data point in the JMA format (only the variables that are in the record)
+    def toJma( self ):
+        unpacked = record_struct.unpack(self.packed)
+        flags, intmask = unpacked[-2], unpacked[-1]
+        datapoint = {}
+        for var_idx, val_name in enumerate(record_vars):
+            flag = (flags >> (4 * var_idx)) & 0xF
+            if( flag == record_flag_missing ): continue
+            value = unpacked[var_idx]
+            if( math.isnan(value) ): value = None
+            elif( intmask & (1 << var_idx) ): value = int(value)
+            else: value = shortFloat(value)
+            datapoint[val_name] = [value, flag]
+        return datapoint
+
+    # Get the value of a variable (NaN if there is no value)
+    def value( self, val_name ):
+        return record_struct.unpack(self.packed)[record_var_idx[val_name]]
+
+    # Get the quality flag of a variable (record_flag_missing if the variable is not in the record)
+    def flag( self, val_name ):
+        return (record_struct.unpack(self.packed)[-2] >> (4 * record_var_idx[val_name])) & 0xF
+
+    # Bitmask of the variables with a quality flag other than 0 (bit i for the variable i of record_vars)
+    def qualityMask( self ):
+        flags = record_struct.unpack(self.packed)[-2]
+        return sum(1 << var_idx for var_idx in range(len(record_vars)) if ((flags >> (4 * var_idx)) & 0xF) not in (0, record_flag_missing))
+
+    def __eq__( self, other ):
+        return isinstance(other, AmedasRecord) and self.packed == other.packed
+
+    def __repr__( self ):
+        return f"AmedasRecord({self.toJma()})"
+
+
+# The records of an area sorted by time, all packed in a single buffer (about record_struct.size + 8 bytes per point)
+class AmedasRecordSeries:
+    __slots__ = ('minutes', 'packed')
+
+    def __init__( self ):
+        self.minutes = array('q')
+        self.packed = bytearray()
+
+    # Build the series of an area from the data of a monthly log ({date_key: {time_key: {area_code: datapoint}}})
+    @classmethod
+    def fromLogData( cls, logdata, area_code ):
+        series = cls()
+        points = []
+        for date_vals in logdata.values():
+            for time_key, entry_vals in date_vals.items():
+                if( area_code in entry_vals ): points.append((time_key, entry_vals[area_code]))
+        for time_key, datapoint in sorted(points):
+            series.minutes.append( timeKeyToMinutes(time_key) )
+            series.packed += AmedasRecord.fromJma(datapoint).packed
+        return series
+
+    def __len__( self ):
+        return len(self.minutes)
+
+    # Get the record of a time key ('YYYY-MM-DD HH:MM'), None if it is not in the series
+    def get( self, time_key ):
+        pos = self.findMinutes( timeKeyToMinutes(time_key) )
+        if( pos is None ): return None
+        return AmedasRecord( self.packed[pos * record_struct.size:(pos + 1) * record_struct.size] )
+
+    # Binary search of a time (minutes since 1970-01-01) in the series
+    def findMinutes( self, minutes ):
+        low, high = 0, len(self.minutes)
+        while( low < high ):
+            mid = (low + high) // 2
+            if( self.minutes[mid] < minutes ): low = mid + 1
+            else: high = mid
+        return low if low < len(self.minutes) and self.minutes[low] == minutes else None
+
+    # Iterate over (time_key, record)
+    def items( self ):
+        for pos, minutes in enumerate(self.minutes):
+            yield minutesToTimeKey(minutes), AmedasRecord( self.packed[pos * record_struct.size:(pos + 1) * record_struct.size] )
+
+    # Get the data back in the format of a monthly log
+    def toLogData( self, area_code ):
+        logdata = {}
+        for time_key, record in self.items():
+            logdata.setdefault(time_key[:10], {})[time_key] = {area_code:record.toJma()}
+        return logdata
+
+    # Approximate memory used by the series
+    def nbytes( self ):
+        return len(self.packed) + self.minutes.itemsize * len(self.minutes)
+
+
+# Convert a time key ('YYYY-MM-DD HH:MM') to minutes since 1970-01-01 and back
+def timeKeyToMinutes( time_key ):
+    return int((dt.datetime.strptime(time_key, '%Y-%m-%d %H:%M') - record_epoch).total_seconds()) // 60
+
+
+def minutesToTimeKey( minutes ):
+    return (record_epoch + dt.timedelta(minutes = minutes)).strftime('%Y-%m-%d %H:%M')
+
+
+# NumPy view of the packed records of a series (no copy): fields 'values' (float32 x N), 'flags' (uint64) and 'intmask' (uint16)
+# and the times as datetime64[m]
+def recordSeriesToArrays( series ):
+    import numpy as np
+    record_dtype = np.dtype([('values', '<f4', (len(record_vars),)), ('flags', '<u8'), ('intmask', '<u2')])
+    records = np.frombuffer(series.packed, dtype = record_dtype)
+    times = np.frombuffer(series.minutes, dtype = np.int64).astype('datetime64[m]')
+    return times, records
+
+
+# Get the quality flags of a variable from the 'flags' field of recordSeriesToArrays
+def getFlagsColumn( records, val_name ):
+    return (records['flags'] >> (4 * record_var_idx[val_name])) & 0xF
+
+#----EOF--------------------------------------------------------
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import os
+import time
+import types
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import amedas_config as a_cfg
+import amedas_funcs as a_fnc
+import amedas_manifest as a_mnf
+import amedas_metrics as a_met
+import amedas_series as a_ser
+
+## Render jobs are tuples (plot kind, area code(s), category, date(s)):
+##   ('single',     [area_code],              val_name,             [date_key])
+##   ('composite',  [area_code],              (val_name_A, val_name_B), [date_key])
+##   ('comp_dates', [area_code],              val_name,             [date_key_prv, date_key_lst])
+##   ('comp_areas', [area_code_A, area_code_B], val_name,           [date_key])
+##   ('all_areas',  [],                       val_name,             [date_key])
+##   ('range_single',    [area_code],         val_name,             [date_first, date_last])
+##   ('range_composite', [area_code],         (val_name_A, val_name_B), [date_first, date_last])
+##   ('range_areas',     [] (all) or [area_codes], val_name,        [date_first, date_last])
+render_job_kinds = ['single', 'composite', 'comp_dates', 'comp_areas', 'all_areas', 'range_single', 'range_composite', 'range_areas']
+
+
+# Render the plot of one job (in this process), graphs are saved in the same paths used by the command line options
+def runRenderJob( job ):
+    import amedas_plot_funcs as a_plt_fnc
+    plot_kind, area_codes, val_name, date_keys = job
+    date_keys = [date_key.strftime('%Y-%m-%d') if isinstance(date_key, dt.datetime) else date_key for date_key in date_keys]
+    if( plot_kind == 'single' ):
+        graph_path = a_fnc.buildPathFromDate( target_datetime = date_keys[0], target = "g", area_code = area_codes[0] )
+        return a_plt_fnc.plotAmedasSingleScatter( val_name=val_name, date_key=date_keys[0], plot_save_path=graph_path, area_code = area_codes[0] )
+    elif( plot_kind == 'composite' ):
+        graph_path = a_fnc.buildPathFromDate( target_datetime = date_keys[0], target = "g", area_code = area_codes[0] )
+        return a_plt_fnc.plotAmedasCompositeScatter( val_name_A=val_name[0], val_name_B=val_name[1], date_key=date_keys[0], plot_save_path=graph_path, area_code = area_codes[0] )
+    elif( plot_kind == 'comp_dates' ):
+        graph_path = a_fnc.buildPathFromDate( target_datetime = date_keys[1], target = "g", area_code = area_codes[0] )
+        return a_plt_fnc.plotAmedasCompareScatter_2dates( val_name=val_name, date_key_prv=date_keys[0], date_key_lst=date_keys[1], plot_save_path=graph_path, area_code = area_codes[0] )
+    elif( plot_kind == 'comp_areas' ):
+        graph_path = a_fnc.buildPathFromDate( target_datetime = date_keys[0], target = "g", area_code = 'common' )
+        return a_plt_fnc.plotAmedasCompareScatter_2areas( val_name=val_name, area_code_A=area_codes[0], area_code_B=area_codes[1], date_key=date_keys[0], plot_save_path=graph_path )
+    elif( plot_kind == 'all_areas' ):
+        graph_path = a_fnc.buildPathFromDate( target_datetime = date_keys[0], target = "g", area_code = 'common' )
+        return a_plt_fnc.plotAmedasCompareScatter_Allareas( val_name=val_name, date_key=date_keys[0], plot_save_path=graph_path )
+    elif( plot_kind == 'range_single' ):
+        return a_plt_fnc.plotAmedasRangeSingle( val_name=val_name, date_first=date_keys[0], date_last=date_keys[1], area_code = area_codes[0] )
+    elif( plot_kind == 'range_composite' ):
+        return a_plt_fnc.plotAmedasRangeComposite( val_name_A=val_name[0], val_name_B=val_name[1], date_first=date_keys[0], date_last=date_keys[1], area_code = area_codes[0] )
+    elif( plot_kind == 'range_areas' ):
+        return a_plt_fnc.plotAmedasRangeAreas( val_name=val_name, date_first=date_keys[0], date_last=date_keys[1], area_codes = area_codes )
+    print(f"Plot kind {plot_kind} not supported, use one of {render_job_kinds}")
+    return False
+
+
+# Render one job and return its result and how long it took ({'job', 'ok', 'skipped', 'time', 'error', 'manifest', 'metrics', 'log_parses'})
+# 'skipped' is True if the graph was up to date, 'manifest' has the render manifest entries recorded by the job,
+# 'metrics' the points of amedas_metrics recorded by the job and 'log_parses' the monthly logs it had to parse (not in the log cache)
+def runTimedRenderJob( job ):
+    start = time.perf_counter()
+    metrics_mark = a_met.getMetricsMark()
+    skipped_before = a_mnf.getRenderStats()['skipped']
+    misses_before = a_fnc.getLogCacheStats()['misses']
+    try:
+        plot_ok = bool(runRenderJob( job ))
+        error = ''
+    except Exception as e:
+        plot_ok = False
+        error = f"{type(e).__name__}: {e}"
+    return {'job':job, 'ok':plot_ok, 'skipped':a_mnf.getRenderStats()['skipped'] > skipped_before, 'time':time.perf_counter() - start, 'error':error, 'manifest':a_mnf.takeRenderManifestUpdates(), 'metrics':a_met.takeMetricEvents(metrics_mark),
+            'log_parses':a_fnc.getLogCacheStats()['misses'] - misses_before}
+
+
+# Get the settings of amedas_config as they are in this process (including the changes made at run time, e.g. --force_render
+# or the stations added by --near/--box), for the render workers
+def getConfigSnapshot():
+    return {name:value for name, value in vars(a_cfg).items() if not name.startswith('_') and not callable(value) and not isinstance(value, types.ModuleType)}
+
+
+# Get the (area_code, datetime of the month) of the monthly logs a job reads
+# (none for a range job without its dates, its default range is only known by the plot)
+def listJobMonths( job ):
+    plot_kind, area_codes, val_name, date_keys = job
+    if( not area_codes ): area_codes = [areacd for areacd in a_cfg.area_info if areacd != 'common']
+    if( plot_kind.startswith('range_') ):
+        if( len(date_keys) < 2 or not date_keys[0] or not date_keys[1] ): return []
+        date_keys = a_ser.listDateRange( date_keys[0], date_keys[1] )
+    months = set(dt.datetime(series_date.year, series_date.month, 1) for series_date in a_ser.listSeriesDates( date_keys ))
+    return [(area_code, month_start) for area_code in area_codes for month_start in sorted(months)]
+
+
+# Initializer of the render workers: apply the settings of the main process, the workers only see them by themselves
+# with the fork start method (spawn/forkserver import amedas_config again, e.g. on macOS)
+# and put the monthly logs parsed by the main process in the log cache of the worker
+def initRenderWorker( config_snapshot, log_entries = None ):
+    for name, value in config_snapshot.items():
+        setattr(a_cfg, name, value)
+    if( log_entries ): a_fnc.putCachedLogEntries( log_entries )
+
+
+# Render a list of jobs on a pool of processes (one per CPU by default) and return the result of each job, in the same order
+# max_workers = 1 (or a single job) renders in this process. The render manifest is saved once all the jobs are done
+# The monthly logs of the months with no columns are parsed once here and given to the workers, instead of once per worker
+def runRenderJobs( jobs, max_workers = None ):
+    if( max_workers is None ): max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(jobs)))
+    if( max_workers == 1 ):
+        results = [runTimedRenderJob(job) for job in jobs]
+    else:
+        results = [None] * len(jobs)
+        log_entries = a_fnc.getCachedLogEntries( a_ser.preloadSeriesMonths( [area_month for job in jobs for area_month in listJobMonths(job)] ) )
+        with ProcessPoolExecutor( max_workers = max_workers, initializer = initRenderWorker, initargs = (getConfigSnapshot(), log_entries) ) as executor:
+            futures = {executor.submit(runTimedRenderJob, job):idx for idx, job in enumerate(jobs)}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                # the points recorded by the workers are only in the results, the ones of this process are already recorded
+                a_met.mergeMetricEvents( results[futures[future]]['metrics'] )
+    for result in results:
+        a_mnf.mergeRenderManifestUpdates( result['manifest'] )
+    a_mnf.saveRenderManifest()
+    return results
+
+
+# Jobs for the default categories of a plot kind
+def buildDefaultCategoryJobs( plot_kind, area_codes, date_keys ):
+    return [(plot_kind, area_codes, def_cat, date_keys) for def_cat in a_cfg.graph_amedas_defcats]
+
+
+# Jobs for everything the nightly cron renders: for each area the default categories of the day and the week comparison,
+# and the all-areas comparison of the default categories
+def buildNightlyRenderJobs( check_date = "" ):
+    if( not check_date ): check_date = (dt.datetime.now() - dt.timedelta(hours = 1)).strftime('%Y-%m-%d')
+    lst_date = (dt.datetime.now() - dt.timedelta(days = a_cfg.ndays_timedelta_lst)).strftime('%Y-%m-%d')  #yesterday
+    prv_date = (dt.datetime.now() - dt.timedelta(days = a_cfg.ndays_timedelta_prv)).strftime('%Y-%m-%d')  #1 week ago
+    jobs = []
+    for area_code in a_cfg.area_info:
+        if( area_code == 'common' ): continue
+        jobs += buildDefaultCategoryJobs( 'single', [area_code], [check_date] )
+        jobs += buildDefaultCategoryJobs( 'comp_dates', [area_code], [prv_date, lst_date] )
+    jobs += buildDefaultCategoryJobs( 'all_areas', [], [check_date] )
+    return jobs
+
+
+# Print the result of each job and a summary
+def printRenderResults( results ):
+    for result in results:
+        plot_kind, area_codes, val_name, date_keys = result['job']
+        print(f"Plot result for {plot_kind} {val_name} {area_codes} {date_keys} was: {result['ok']}{' (up to date)' if result['skipped'] else ''} ({result['time']:.2f} s) {result['error']}")
+    print(f"Plotted {sum(result['ok'] for result in results)}/{len(results)} graphs, {sum(result['skipped'] for result in results)} skipped because their data did not change   ({dt.datetime.now().strftime('%Y-%m-%d %H:%M')})")
+
+#----EOF--------------------------------------------------------
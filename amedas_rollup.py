@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import os.path
+import math
+import json
+import datetime as dt
+from contextlib import contextmanager
+import amedas_config as a_cfg
+import amedas_funcs as a_fnc
+import amedas_metrics as a_met
+
+try:
+    import fcntl
+except ImportError:
+    # not there on Windows: the updates of the rollups of a month are not serialized between processes
+    fcntl = None
+
+## Aggregate of a variable for a period: [count, min, max, sum] (+ [sum of sin, sum of cos] for the circular variables)
+## The hourly file of each day keeps the values of its 10min points ('points') next to the aggregates of its hours ('hours'),
+## the daily file of each month the aggregates of its days and of the month. Each point stored updates the rollups of its month
+## under a lock file of the month (so processes storing at the same time, e.g. daemon + backfill, do not lose each other's points):
+## its values replace the ones of the slot (a point stored again, corrected, is not counted twice), then its hour
+## is aggregated again from its points, the day from its hours and the month from its days, so min/max stay exact.
+## The daily file also keeps the signature of the monthly log (the reference) after the last update: repairMonthRollups builds
+## again from the log the months that do not match it (e.g. an update that failed, or points stored with rollup_enabled = False)
+rollup_vars = list(a_cfg.graph_amedas_dic.keys())
+compass_deg = 22.5       # degrees per point of the 16 points compass
+
+
+# Form the paths of the hourly file of a day and the daily/monthly file of its month
+def buildRollupPaths( area_code, entry_datetime ):
+    log_dir = os.path.dirname( a_fnc.buildPathFromDate( target_datetime = entry_datetime.strftime('%Y-%m-%d'), target = "l", area_code = area_code ) )
+    month_target = a_cfg.replace_target_year + a_cfg.replace_target_month
+    hourly_path = os.path.join(log_dir, a_cfg.rollup_hourly_fname.replace(month_target + 'DD', entry_datetime.strftime('%Y%m%d')))
+    daily_path = os.path.join(log_dir, a_cfg.rollup_daily_fname.replace(month_target, entry_datetime.strftime('%Y%m')))
+    return hourly_path, daily_path
+
+
+# Load a rollup file (empty tables if it is not there or not valid)
+def loadRollupFile( rollup_path, tables ):
+    try:
+        with open(rollup_path, 'r') as rollup_file:
+            rollup = json.load(rollup_file)
+    except FileNotFoundError:
+        rollup = {}
+    except ValueError as e:
+        print(f"Error: {e} -> rollup file {rollup_path} is not valid, it will be created again")
+        rollup = {}
+    for table in tables: rollup.setdefault(table, {})
+    return rollup
+
+
+# Save a rollup file (temp file of this process + rename, so readers never see half a file)
+def saveRollupFile( rollup_path, rollup ):
+    os.makedirs( os.path.dirname(rollup_path), exist_ok = True )
+    temp_path = f"{rollup_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as rollup_file:
+        # dumps (C encoder) and a single write, json.dump to a file encodes in python
+        rollup_file.write(json.dumps(rollup, separators=(',', ':')))
+    os.replace(temp_path, rollup_path)
+
+
+# Lock the rollups of an area for a month for the with block (lock file next to the daily file), one process updates them at a time
+@contextmanager
+def lockRollupMonth( area_code, month_datetime ):
+    daily_path = buildRollupPaths( area_code, month_datetime )[1]
+    os.makedirs( os.path.dirname(daily_path), exist_ok = True )
+    with open(daily_path + '.lock', 'a') as lock_file:
+        # released when the file is closed
+        if( fcntl is not None ): fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+# Get the numeric value of a variable of a data point (JMA format), None if there is no value
+def getPointValue( datapoint, val_name ):
+    try:
+        value = datapoint[val_name][0]
+    except (KeyError, TypeError, IndexError):
+        return None
+    if( not isinstance(value, (int, float)) or isinstance(value, bool) ): return None
+    # calm (0) has no direction
+    if( val_name in a_cfg.rollup_circular_vars and value == 0 ): return None
+    return float(value)
+
+
+# Get the values of the rollup variables of a data point {val_name: value} (the variables with no value are left out)
+def getPointValues( datapoint ):
+    point_values = {}
+    for val_name in rollup_vars:
+        value = getPointValue( datapoint, val_name )
+        if( value is not None ): point_values[val_name] = value
+    return point_values
+
+
+# Add a value to an aggregate of a table (created if needed)
+def addToAggregate( table, key, val_name, value ):
+    aggs = table.setdefault(key, {})
+    agg = aggs.get(val_name)
+    if( agg is None ):
+        agg = aggs[val_name] = [0, value, value, 0.0] + ([0.0, 0.0] if val_name in a_cfg.rollup_circular_vars else [])
+    agg[0] += 1
+    agg[1] = min(agg[1], value)
+    agg[2] = max(agg[2], value)
+    agg[3] += value
+    if( len(agg) > 4 ):
+        angle = math.radians(value * compass_deg)
+        agg[4] += math.sin(angle)
+        agg[5] += math.cos(angle)
+
+
+# Aggregate the points {time_key: {val_name: value}} of a period (in time order, so the sums do not depend on the order
+# the points were stored), returns {val_name: aggregate}
+def aggregatePoints( points ):
+    table = {}
+    for time_key in sorted(points):
+        for val_name, value in points[time_key].items(): addToAggregate( table, 'period', val_name, value )
+    return table.get('period', {})
+
+
+# Merge the aggregates of some periods (e.g. the days of a month), returns {val_name: aggregate}
+def mergeAggregates( aggs_list ):
+    merged = {}
+    for aggs in aggs_list:
+        for val_name, agg in aggs.items():
+            if( val_name not in merged ):
+                merged[val_name] = list(agg)
+                continue
+            total = merged[val_name]
+            total[0] += agg[0]
+            total[1] = min(total[1], agg[1])
+            total[2] = max(total[2], agg[2])
+            for idx in range(3, len(total)): total[idx] += agg[idx]
+    return merged
+
+
+# Aggregate again some hours of an hourly file from its points, then the day from its hours and the month from its days
+def aggregateDayRollups( hourly, daily, day_key, hour_keys ):
+    for hour_key in hour_keys:
+        hour_aggs = aggregatePoints( {time_key:point_values for time_key, point_values in hourly['points'].items() if time_key[:13] == hour_key} )
+        if( hour_aggs ): hourly['hours'][hour_key] = hour_aggs
+        else: hourly['hours'].pop(hour_key, None)
+    day_aggs = mergeAggregates( hourly['hours'][hour_key] for hour_key in sorted(hourly['hours']) )
+    if( day_aggs ): daily['days'][day_key] = day_aggs
+    else: daily['days'].pop(day_key, None)
+    month_aggs = mergeAggregates( daily['days'][date_key] for date_key in sorted(daily['days']) if date_key[:7] == day_key[:7] )
+    daily['month'] = {day_key[:7]:month_aggs} if month_aggs else {}
+
+
+# Get the signature of the files of the monthly log of an area (see amedas_funcs.getWeatherLogSignature) in its JSON form
+def getRollupSource( area_code, month_datetime ):
+    logfile = a_fnc.buildPathFromDate( target_datetime = month_datetime.strftime('%Y-%m-%d'), target = "l", area_code = area_code )
+    return [list(file_sig) if file_sig else None for file_sig in a_fnc.getWeatherLogSignature( logfile )]
+
+
+# Build all the rollups of an area for a month from its monthly log: ({day: hourly}, daily)
+# the signature of the log is taken before reading it, so a point stored meanwhile makes them not match the log
+def buildMonthRollups( area_code, month_start, debugprint = False ):
+    source = getRollupSource( area_code, month_start )
+    logdata = a_fnc.loadWeatherLog( a_fnc.buildPathFromDate( target_datetime = month_start.strftime('%Y-%m-%d'), target = "l", area_code = area_code ), debugprint )
+    daily = {'days':{}, 'month':{}, 'source':source}
+    hourlies = {}
+    # monthly log format: {date_key: {time_key: {area_code: datapoint}}}
+    for date_key in sorted(logdata):
+        for time_key in sorted(logdata[date_key]):
+            if( area_code not in logdata[date_key][time_key] ): continue
+            entry_datetime = dt.datetime.strptime(time_key, '%Y-%m-%d %H:%M')
+            if( entry_datetime.month != month_start.month ): continue
+            hourly = hourlies.setdefault(entry_datetime.day, {'points':{}, 'hours':{}})
+            hourly['points'][time_key] = getPointValues( logdata[date_key][time_key][area_code] )
+    for day in sorted(hourlies):
+        hourly = hourlies[day]
+        aggregateDayRollups( hourly, daily, month_start.replace(day = day).strftime('%Y-%m-%d'), sorted(set(time_key[:13] for time_key in hourly['points'])) )
+    return hourlies, daily
+
+
+# Build the rollups of an area for a month from its monthly log and save them (the lock of the month has to be held)
+# returns the number of points used
+def saveMonthRollups( area_code, month_start, debugprint = False ):
+    with a_met.timed('rollup_build'):
+        hourlies, daily = buildMonthRollups( area_code, month_start, debugprint )
+        for day, hourly in hourlies.items():
+            saveRollupFile( buildRollupPaths(area_code, month_start.replace(day = day))[0], hourly )
+        saveRollupFile( buildRollupPaths(area_code, month_start)[1], daily )
+    return sum(len(hourly['points']) for hourly in hourlies.values())
+
+
+# Update the rollups of an area with a point that was just stored in the monthly log, returns True if they changed
+# the values of the slot replace the ones it had. A month with no rollups yet (or not valid, or saved before the hourly files
+# kept their points) is built from the log instead, which already has the point
+def storeRollupPoint( area_code, entry_datetime, datapoint ):
+    month_start = entry_datetime.replace(day = 1, hour = 0, minute = 0, second = 0, microsecond = 0)
+    hourly_path, daily_path = buildRollupPaths( area_code, entry_datetime )
+    with lockRollupMonth( area_code, month_start ):
+        daily = loadRollupFile( daily_path, () )
+        hourly = loadRollupFile( hourly_path, () )
+        if( 'days' not in daily or (os.path.exists(hourly_path) and 'points' not in hourly) ):
+            saveMonthRollups( area_code, month_start )
+            return True
+        for table in ('points', 'hours'): hourly.setdefault(table, {})
+        time_key = entry_datetime.strftime('%Y-%m-%d %H:%M')
+        point_values = getPointValues( datapoint )
+        if( hourly['points'].get(time_key) == point_values ): return False
+        hourly['points'][time_key] = point_values
+        aggregateDayRollups( hourly, daily, time_key[:10], [time_key[:13]] )
+        daily['source'] = getRollupSource( area_code, month_start )
+        # hourly first: a point saved there but not in the daily file is in the day again with the next point of the day
+        saveRollupFile( hourly_path, hourly )
+        saveRollupFile( daily_path, daily )
+    return True
+
+
+# Update the rollups of several areas from a map response
+def storeRollupPoints( weather_data, area_codes, entry_datetime ):
+    stored_cnt = 0
+    for area_code in area_codes:
+        if( area_code in weather_data and type(weather_data[area_code]) is dict ):
+            stored_cnt += storeRollupPoint( area_code, entry_datetime, weather_data[area_code] )
+    return stored_cnt
+
+
+# Build again all the rollups of an area for a month from its monthly log, returns the number of points used
+def rebuildMonthRollups( area_code, month_datetime, debugprint = False ):
+    month_start = month_datetime.replace(day = 1, hour = 0, minute = 0, second = 0, microsecond = 0)
+    with lockRollupMonth( area_code, month_start ):
+        points_cnt = saveMonthRollups( area_code, month_start, debugprint )
+    if( debugprint == True) : print(f"Rollups of {area_code} for {month_start.strftime('%Y-%m')} rebuilt from {points_cnt} points")
+    return points_cnt
+
+
+# Build again the rollups of an area for a month only if they do not match its monthly log (the log changed after their
+# last update), returns the number of points used or None if they were up to date
+def repairMonthRollups( area_code, month_datetime, debugprint = False ):
+    month_start = month_datetime.replace(day = 1, hour = 0, minute = 0, second = 0, microsecond = 0)
+    with lockRollupMonth( area_code, month_start ):
+        daily = loadRollupFile( buildRollupPaths(area_code, month_start)[1], () )
+        if( 'days' in daily and daily.get('source') == getRollupSource( area_code, month_start ) ): return None
+        points_cnt = saveMonthRollups( area_code, month_start, debugprint )
+    if( debugprint == True) : print(f"Rollups of {area_code} for {month_start.strftime('%Y-%m')} rebuilt from {points_cnt} points")
+    return points_cnt
+
+
+# Get the rollups of an area for a month: ({day: hourly} or None to read the hourly files, daily), nothing is written here
+# the saved ones if there are (kept up to date as the points are stored), built from the monthly log otherwise
+# (rollup_enabled = False, or a month stored before the rollups were enabled), months with no log give empty rollups
+def getMonthRollups( area_code, month_datetime, debugprint = False ):
+    month_start = month_datetime.replace(day = 1, hour = 0, minute = 0, second = 0, microsecond = 0)
+    if( a_cfg.rollup_enabled ):
+        daily = loadRollupFile( buildRollupPaths(area_code, month_start)[1], () )
+        if( 'days' in daily ):
+            daily.setdefault('month', {})
+            return None, daily
+    if( not any(getRollupSource( area_code, month_start )) ): return {}, {'days':{}, 'month':{}}
+    with a_met.timed('rollup_build'):
+        return buildMonthRollups( area_code, month_start, debugprint )
+
+
+# Turn an aggregate into its values: count, min, max, mean (+ sum for the summed variables, + direction for the circular ones)
+def getAggregateValues( val_name, agg ):
+    agg_values = {'count':agg[0], 'min':agg[1], 'max':agg[2], 'mean':agg[3] / agg[0]}
+    if( val_name.startswith(a_cfg.rollup_sum_prefixes) ): agg_values['sum'] = agg[3]
+    if( len(agg) > 4 ):
+        # mean direction back in compass points (1-16), None if the directions cancel each other
+        if( math.hypot(agg[4], agg[5]) < 1e-9 * agg[0] ):
+            agg_values['mean'] = None
+        else:
+            direction = (math.degrees(math.atan2(agg[4], agg[5])) / compass_deg) % 16
+            agg_values['mean'] = direction if direction >= 0.5 else direction + 16
+    return agg_values
+
+
+# List the months between 2 datetimes (first day of each one)
+def listMonths( start_datetime, end_datetime ):
+    months = []
+    month = start_datetime.replace(day = 1, hour = 0, minute = 0, second = 0, microsecond = 0)
+    while( month <= end_datetime ):
+        months.append(month)
+        month = (month + dt.timedelta(days = 32)).replace(day = 1)
+    return months
+
+
+# Get the rollups of an area between 2 datetimes, level is 'hour', 'day' or 'month'
+# returns a list of (period key, {val_name: {'count', 'min', 'max', 'mean'(, 'sum')}}) sorted by period
+def queryRollups( area_code, val_names, start_datetime, end_datetime, level = 'day' ):
+    rows = []
+    for month in listMonths( start_datetime, end_datetime ):
+        hourlies, daily = getMonthRollups( area_code, month )
+        if( level == 'hour' ):
+            day = max(month, start_datetime.replace(hour = 0, minute = 0, second = 0, microsecond = 0))
+            while( day <= end_datetime and day.month == month.month ):
+                if( hourlies is not None ):
+                    hours = hourlies.get(day.day, {'hours':{}})['hours']
+                else:
+                    hourly_path = buildRollupPaths( area_code, day )[0]
+                    hours = loadRollupFile( hourly_path, ('hours',) )['hours'] if os.path.exists(hourly_path) else {}
+                rows += [(hour_key, hours[hour_key]) for hour_key in sorted(hours)
+                         if start_datetime.strftime('%Y-%m-%d %H') <= hour_key <= end_datetime.strftime('%Y-%m-%d %H')]
+                day += dt.timedelta(days = 1)
+        elif( level == 'month' ):
+            rows += sorted(daily['month'].items())
+        else:
+            rows += [(day_key, daily['days'][day_key]) for day_key in sorted(daily['days'])
+                     if start_datetime.strftime('%Y-%m-%d') <= day_key <= end_datetime.strftime('%Y-%m-%d')]
+    return [(period_key, {val_name:getAggregateValues(val_name, aggs[val_name]) for val_name in val_names if val_name in aggs}) for period_key, aggs in rows]
+
+#----EOF--------------------------------------------------------
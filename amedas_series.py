@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import datetime as dt
+import numpy as np
+import amedas_config as a_cfg
+import amedas_funcs as a_fnc
+import amedas_colstore as a_col
+import amedas_record as a_rec
+
+
+# Get a list of dates (datetime at 00:00) from a date, a list of dates or a (first, last) range
+def listSeriesDates( date_keys ):
+    if( isinstance(date_keys, (str, dt.datetime, dt.date)) ): date_keys = [date_keys]
+    series_dates = []
+    for date_key in date_keys:
+        if( isinstance(date_key, str) ): date_key = dt.datetime.strptime( date_key, '%Y-%m-%d' )
+        series_dates.append( dt.datetime(date_key.year, date_key.month, date_key.day) )
+    return series_dates
+
+
+# Get the list of dates between 2 dates (both included)
+def listDateRange( first_date, last_date ):
+    first_date, last_date = listSeriesDates([first_date, last_date])
+    return [first_date + dt.timedelta(days = day) for day in range((last_date - first_date).days + 1)]
+
+
+# Get the times (datetime64[m]) and values of the stored points of an area for some variables and dates
+# from the columnar store if the month is there (and has every stored slot), from the compact records of the monthly log otherwise
+# returns {val_name: (times, values)} with the points sorted by time, slots with no value for a variable are left out
+def loadAreaSeries( area_code, val_names, date_keys ):
+    series_dates = listSeriesDates( date_keys )
+    times_parts = {val_name:[] for val_name in val_names}
+    vals_parts = {val_name:[] for val_name in val_names}
+    # group the dates by month, so each month is opened once
+    month_dates = {}
+    for series_date in series_dates: month_dates.setdefault((series_date.year, series_date.month), []).append(series_date)
+    for (year, month), dates in sorted(month_dates.items()):
+        month_start = dt.datetime(year, month, 1)
+        month_cols = a_col.readMonthColumns( area_code, month_start, val_names )
+        if( month_cols is not None and a_col.hasAllStoredSlots( area_code, month_start ) ):
+            month_start64 = np.datetime64(month_start, 'm')
+            # slots of the requested days of the month, so long ranges take one pass per month and variable
+            day_slots = np.zeros(a_col.max_days * a_col.slots_per_day, dtype = bool)
+            for series_date in dates:
+                day_start = (series_date.day - 1) * a_col.slots_per_day
+                day_slots[day_start:day_start + a_col.slots_per_day] = True
+            for val_name in val_names:
+                if( val_name not in month_cols ): continue
+                vals, flags = month_cols[val_name]
+                present_slots = np.flatnonzero(day_slots[:len(flags)] & (flags != a_col.flag_missing))
+                times_parts[val_name].append( month_start64 + present_slots.astype('timedelta64[m]') * 10 )
+                vals_parts[val_name].append( vals[present_slots] )
+        else:
+            log_path = a_fnc.buildPathFromDate( target_datetime = month_start, target = "l", area_code = area_code )
+            times, records = a_rec.recordSeriesToArrays( a_fnc.loadWeatherRecords(log_path, area_code) )
+            for series_date in dates:
+                day_start64 = np.datetime64(series_date, 'm')
+                day_points = (times >= day_start64) & (times < day_start64 + np.timedelta64(1, 'D'))
+                for val_name in val_names:
+                    if( val_name not in a_rec.record_var_idx ): continue
+                    present = day_points & (a_rec.getFlagsColumn(records, val_name) != a_rec.record_flag_missing)
+                    times_parts[val_name].append( times[present] )
+                    vals_parts[val_name].append( records['values'][present, a_rec.record_var_idx[val_name]] )
+    area_series = {}
+    for val_name in val_names:
+        if( times_parts[val_name] ):
+            area_series[val_name] = ( np.concatenate(times_parts[val_name]), np.concatenate(vals_parts[val_name]).astype(np.float64) )
+        else:
+            area_series[val_name] = ( np.array([], dtype = 'datetime64[m]'), np.array([], dtype = np.float64) )
+    return area_series
+
+
+# Load the records of the months that loadAreaSeries reads from the monthly log (no columns, or columns that miss a stored slot),
+# so they are in the log cache of this process. area_months: (area_code, datetime of the month), returns the cache keys of the logs
+def preloadSeriesMonths( area_months ):
+    cache_keys = []
+    for area_code, month_start in sorted(set(area_months)):
+        if( a_col.readMonthColumns( area_code, month_start ) is not None and a_col.hasAllStoredSlots( area_code, month_start ) ): continue
+        log_path = a_fnc.buildPathFromDate( target_datetime = month_start.strftime('%Y-%m-%d'), target = "l", area_code = area_code )
+        a_fnc.loadWeatherRecords( log_path, area_code )
+        cache_keys.append( (log_path, str(area_code)) )
+    return cache_keys
+
+
+# Get aligned X/Y arrays for some areas, variables and dates (a date, a list of dates or a listDateRange)
+# X is the time in hours since 00:00 of the first date (e.g. 13.5 = 13:30 of the first day, 37.5 = 13:30 of the next one)
+# returns {(area_code, val_name): (xAxis, yAxis)}
+def loadSeries( area_codes, val_names, date_keys ):
+    if( isinstance(area_codes, str) ): area_codes = [area_codes]
+    if( isinstance(val_names, str) ): val_names = [val_names]
+    series_dates = listSeriesDates( date_keys )
+    first_day64 = np.datetime64(min(series_dates), 'm')
+    series = {}
+    for area_code in area_codes:
+        for val_name, (times, yAxis) in loadAreaSeries( area_code, val_names, series_dates ).items():
+            xAxis = (times - first_day64) / np.timedelta64(1, 'h')
+            series[(area_code, val_name)] = (xAxis, yAxis)
+    return series
+
+
+# Same as loadSeries, but with the times (datetime64[m]) as X, for plots over several days
+def loadSeriesTimes( area_codes, val_names, date_keys ):
+    if( isinstance(area_codes, str) ): area_codes = [area_codes]
+    if( isinstance(val_names, str) ): val_names = [val_names]
+    series = {}
+    for area_code in area_codes:
+        for val_name, (times, yAxis) in loadAreaSeries( area_code, val_names, date_keys ).items():
+            series[(area_code, val_name)] = (times, yAxis)
+    return series
+
+# Drop the points with no value (NaN) of a series
+def dropMissingPoints( times, values ):
+    present = ~np.isnan(values)
+    return times[present], values[present]
+
+
+# Min/max decimation: split the time span in n_buckets of the same length and keep the min and max point of each one
+# (in time order), so peaks are never lost whatever the number of points
+def downsampleMinMax( times, values, n_buckets ):
+    if( len(values) <= 2 * n_buckets ): return times, values
+    minutes = (times - times[0]) / np.timedelta64(1, 'm')
+    buckets = np.minimum((minutes * n_buckets / max(minutes[-1], 1.0)).astype(np.int64), n_buckets - 1)
+    # sorted by bucket and then value: the first and last point of each bucket are its min and max
+    order = np.lexsort((values, buckets))
+    bucket_starts = np.flatnonzero(np.r_[True, buckets[order][1:] != buckets[order][:-1]])
+    bucket_ends = np.r_[bucket_starts[1:], len(order)] - 1
+    keep = np.unique(np.concatenate((order[bucket_starts], order[bucket_ends])))
+    return times[keep], values[keep]
+
+
+# Largest-Triangle-Three-Buckets: keep n_out points (first and last included) that preserve the visual shape of the series
+def downsampleLTTB( times, values, n_out ):
+    n_points = len(values)
+    if( n_out >= n_points or n_out < 3 ): return times, values
+    minutes = (times - times[0]) / np.timedelta64(1, 'm')
+    edges = np.linspace(1, n_points - 1, n_out - 1).astype(np.int64)
+    keep = np.empty(n_out, dtype = np.int64)
+    keep[0], keep[-1] = 0, n_points - 1
+    prev = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n_points
+        avg_x, avg_y = minutes[end:next_end].mean(), values[end:next_end].mean()
+        areas = np.abs((minutes[prev] - avg_x) * (values[start:end] - values[prev]) - (minutes[prev] - minutes[start:end]) * (avg_y - values[prev]))
+        prev = start + int(np.argmax(areas)) if end > start else start
+        keep[bucket + 1] = prev
+    return times[keep], values[keep]
+
+
+# Put a NaN point in each gap of a series longer than max_step (timedelta64), so the line is broken there instead of
+# joining both sides with a straight line (e.g. an outage of some days). The gaps are looked for in the points before
+# downsampling (gap_times), as the kept points of a downsampled series are further apart anyway
+def insertGapBreaks( times, values, gap_times, max_step ):
+    if( len(times) < 2 ): return times, values
+    gap_starts = np.flatnonzero(np.diff(gap_times) > max_step)
+    if( not len(gap_starts) ): return times, values
+    # the kept points are some of gap_times, so the NaN goes before the first kept point after each gap
+    break_pos = np.searchsorted(times, gap_times[gap_starts + 1])
+    break_pos, first_gap = np.unique(break_pos, return_index = True)
+    inner = (break_pos > 0) & (break_pos < len(times))
+    break_pos, first_gap = break_pos[inner], first_gap[inner]
+    break_times = gap_times[gap_starts[first_gap]] + np.timedelta64(10, 'm')
+    return np.insert(times, break_pos, break_times), np.insert(values, break_pos, np.nan)
+
+
+# Downsample a series to about max_points with a_cfg.range_downsample ('minmax', 'lttb' or 'none')
+# the gaps longer than a slot (or than the width of a point when it is downsampled) are kept as NaN breaks
+def downsampleSeries( times, values, max_points, method = None ):
+    if( method is None ): method = a_cfg.range_downsample
+    times, values = dropMissingPoints( times, values )
+    if( not len(times) ): return times, values
+    max_step = max(np.timedelta64(10, 'm'), (times[-1] - times[0]) // max(1, max_points))
+    if( method == 'minmax' ):
+        return insertGapBreaks( *downsampleMinMax( times, values, max(1, max_points // 2) ), times, max_step )
+    if( method == 'lttb' ):
+        return insertGapBreaks( *downsampleLTTB( times, values, max_points ), times, max_step )
+    return insertGapBreaks( times, values, times, max_step )
+
+#----EOF--------------------------------------------------------
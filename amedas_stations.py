@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import os.path
+import math
+import json
+from urllib.request import urlopen
+from urllib.error import URLError, HTTPError
+import amedas_config as a_cfg
+
+## Note: the station table of AMEDAS is a JSON dict like
+##   {"11001": {"type":"C", "elems":"11112010", "lat":[45,31.2], "lon":[141,56.1], "alt":26, "kjName":"宗谷岬", "knName":"ソウヤミサキ", "enName":"Cape Soya"}, ...}
+##   lat/lon are [degrees, minutes]
+earth_radius_km = 6371.0
+km_per_deg = math.pi * earth_radius_km / 180.0
+## elems of the station table has one digit per element (0 = not observed), in this order
+station_elems = ['temp', 'precipitation', 'wind', 'sun', 'snow', 'humidity', 'pressure']
+
+
+# Download the station table of AMEDAS and keep a local copy, returns True if it was updated
+def downloadStationTable( table_path = None ):
+    if( table_path is None ): table_path = a_cfg.station_table_path
+    try:
+        table_text = urlopen(a_cfg.station_table_url).read()
+        json.loads(table_text)
+    except HTTPError as e:
+        print(f"HTTP ERROR... code: {e.code} \n url: {a_cfg.station_table_url}")
+        return False
+    except URLError as e:
+        print(f"URL ERROR... reason: {e.reason} \n url: {a_cfg.station_table_url}")
+        return False
+    except ValueError as e:
+        print(f"Error: {e} -> the station table is not valid JSON")
+        return False
+    os.makedirs( os.path.dirname(os.path.abspath(table_path)), exist_ok = True )
+    with open(table_path + '.tmp', 'wb') as table_file:
+        table_file.write(table_text)
+    os.replace(table_path + '.tmp', table_path)
+    return True
+
+
+# Convert a [degrees, minutes] pair of the station table to decimal degrees
+def toDecimalDegrees( deg_min ):
+    if( isinstance(deg_min, (int, float)) ): return float(deg_min)
+    return float(deg_min[0]) + float(deg_min[1]) / 60.0
+
+
+# Load the local copy of the station table, returns {area_code: station} with lat/lon in decimal degrees
+# (stations without a valid position are left out)
+def loadStationTable( table_path = None ):
+    if( table_path is None ): table_path = a_cfg.station_table_path
+    try:
+        with open(table_path, encoding="utf-8") as table_file:
+            table = json.load(table_file)
+    except FileNotFoundError:
+        print(f"Error: there is no station table in {table_path} (get it with downloadStationTable)")
+        return {}
+    except ValueError as e:
+        print(f"Error: {e} -> the station table {table_path} is not valid JSON")
+        return {}
+    stations = {}
+    for area_code, info in table.items():
+        try:
+            stations[area_code] = {'code':area_code, 'type':info.get('type', ''), 'elems':info.get('elems', ''),
+                                   'lat':toDecimalDegrees(info['lat']), 'lon':toDecimalDegrees(info['lon']), 'alt':info.get('alt'),
+                                   'kjName':info.get('kjName', ''), 'knName':info.get('knName', ''), 'enName':info.get('enName', '')}
+        except (KeyError, TypeError, ValueError, IndexError):
+            continue
+    return stations
+
+
+# Distance (km) between 2 points (great circle)
+def getDistanceKm( lat_a, lon_a, lat_b, lon_b ):
+    phi_a, phi_b = math.radians(lat_a), math.radians(lat_b)
+    hav = math.sin((phi_b - phi_a) / 2) ** 2 + math.cos(phi_a) * math.cos(phi_b) * math.sin(math.radians(lon_b - lon_a) / 2) ** 2
+    return 2 * earth_radius_km * math.asin(min(1.0, math.sqrt(hav)))
+
+
+# Grid spatial index of the stations: each cell of cell_deg x cell_deg degrees keeps the codes of its stations
+class StationGrid:
+    __slots__ = ('stations', 'cell_deg', 'cells', 'max_lat')
+
+    def __init__( self, stations, cell_deg = None ):
+        self.stations = stations
+        self.cell_deg = cell_deg if cell_deg is not None else a_cfg.station_grid_deg
+        self.cells = {}
+        self.max_lat = max((abs(station['lat']) for station in stations.values()), default = 0.0)
+        for area_code, station in stations.items():
+            self.cells.setdefault(self.getCell(station['lat'], station['lon']), []).append(area_code)
+
+    def getCell( self, lat, lon ):
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    # Codes of the stations of the cells in the ring at distance ring (in cells) of a given cell
+    def getRingCodes( self, cell, ring ):
+        ring_codes = []
+        for ilat in range(cell[0] - ring, cell[0] + ring + 1):
+            for ilon in range(cell[1] - ring, cell[1] + ring + 1):
+                if( max(abs(ilat - cell[0]), abs(ilon - cell[1])) == ring ): ring_codes.extend(self.cells.get((ilat, ilon), ()))
+        return ring_codes
+
+    # Nearest n stations to a point, returns a list of (distance km, area_code) sorted by distance
+    # with val_name, only the stations that observe that variable are used
+    def nearest( self, lat, lon, n = 1, val_name = None ):
+        cell = self.getCell(lat, lon)
+        max_ring = max(max(abs(ilat - cell[0]), abs(ilon - cell[1])) for ilat, ilon in self.cells) if self.cells else -1
+        found = []
+        for ring in range(max_ring + 1):
+            for area_code in self.getRingCodes(cell, ring):
+                station = self.stations[area_code]
+                if( val_name and not hasStationElement(station, val_name) ): continue
+                found.append((getDistanceKm(lat, lon, station['lat'], station['lon']), area_code))
+            found.sort()
+            # any station out of this ring is at least this far (the cells are narrower in km to the north)
+            ring_km = ring * self.cell_deg * km_per_deg * math.cos(math.radians(min(89.0, max(abs(lat), self.max_lat))))
+            if( len(found) >= n and found[n - 1][0] <= ring_km ): break
+        return found[:n]
+
+    # Stations inside a box (degrees), returns a list of area codes sorted by code
+    def inBox( self, lat_min, lon_min, lat_max, lon_max, val_name = None ):
+        cell_min, cell_max = self.getCell(lat_min, lon_min), self.getCell(lat_max, lon_max)
+        box_codes = []
+        for ilat in range(cell_min[0], cell_max[0] + 1):
+            for ilon in range(cell_min[1], cell_max[1] + 1):
+                for area_code in self.cells.get((ilat, ilon), ()):
+                    station = self.stations[area_code]
+                    if( val_name and not hasStationElement(station, val_name) ): continue
+                    if( lat_min <= station['lat'] <= lat_max and lon_min <= station['lon'] <= lon_max ): box_codes.append(area_code)
+        return sorted(box_codes)
+
+
+# Check if a station observes a variable (see station_elems)
+def hasStationElement( station, val_name ):
+    for elem_pos, elem_name in enumerate(station_elems):
+        if( val_name.startswith(elem_name) ):
+            return len(station['elems']) > elem_pos and station['elems'][elem_pos] != '0'
+    return True
+
+
+# Create the area_info style entries of some stations (colors and markers are given in turns)
+# short names are the english names in lower case, with the code added if 2 stations have the same one
+def createAreaInfoEntries( stations, area_codes ):
+    entries = {}
+    short_names = set(area['short_name'] for area in a_cfg.area_info.values())
+    for pos, area_code in enumerate(area_codes):
+        station = stations[area_code]
+        short_name = ''.join(ch for ch in station['enName'].lower() if ch.isalnum()) or area_code
+        if( short_name in short_names ): short_name = f"{short_name}{area_code}"
+        short_names.add(short_name)
+        entries[area_code] = {'name':station['enName'] or area_code, 'short_name':short_name,
+                              'japanese_name':f"{station['kjName']}（{station['knName']}）",
+                              'color':a_cfg.station_colors[pos % len(a_cfg.station_colors)], 'marker':a_cfg.station_markers[pos % len(a_cfg.station_markers)]}
+    return entries
+
+
+# Add some stations to the areas of this run (area_info), keeping 'common' as the last entry
+# areas already in area_info keep their entries
+def addStationAreas( stations, area_codes ):
+    new_codes = [area_code for area_code in area_codes if area_code not in a_cfg.area_info]
+    common_info = a_cfg.area_info.pop('common', None)
+    a_cfg.area_info.update(createAreaInfoEntries(stations, new_codes))
+    if( common_info is not None ): a_cfg.area_info['common'] = common_info
+    return new_codes
+
+
+# Print area_info style entries, ready to be pasted in amedas_config
+def printAreaInfoEntries( entries ):
+    for area_code, entry in entries.items():
+        print(f"             '{area_code}': " + "{" + ", ".join(f"'{key}':'{value}'" for key, value in entry.items()) + "},")
+
+#----EOF--------------------------------------------------------
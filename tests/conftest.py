@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import os.path
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import amedas_config as a_cfg
+import amedas_bench as a_bch
+
+## The tests run on synthetic data in a temp directory (see amedas_bench.useBenchPaths) and the fetch tests against the
+## stand-in server of amedas_bench, so they never touch the real logs nor JMA
+# the metrics are recorded but never written, not even by the flush at the exit of the test run
+a_cfg.metrics_events_path = ''
+a_cfg.metrics_prom_path = ''
+
+
+# Point the logs, graphs and state files to a temp directory for one test, the config is restored after it
+@pytest.fixture
+def bench_paths( tmp_path ):
+    config_snapshot = a_bch.snapshotConfig()
+    a_bch.useBenchPaths( str(tmp_path) )
+    yield str(tmp_path)
+    a_bch.restoreConfig( config_snapshot )
+
+#----EOF--------------------------------------------------------
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import json
+import math
+import struct
+import zlib
+import datetime as dt
+import pytest
+import amedas_archive as a_arc
+import amedas_bench as a_bch
+
+
+# A snapshot gives back the values and flags of every area of the map response
+def testSnapshotRoundTrip( bench_paths ):
+    weather_data = json.loads(a_bch.createSyntheticMapPayload(n_areas = 50))
+    snapshot_path = a_arc.writeSnapshot( weather_data, dt.datetime(2024, 1, 1, 10, 0) )
+    area_index, snapshot_cols = a_arc.readSnapshot( snapshot_path, ['temp', 'humidity'] )
+    assert sorted(area_index) == sorted(weather_data)
+    for area_code, pos in area_index.items():
+        value, flag = weather_data[area_code].get('temp', [None, None])
+        if( value is None ):
+            assert math.isnan(snapshot_cols['temp'][0][pos])
+        else:
+            assert snapshot_cols['temp'][0][pos] == pytest.approx(value, abs = 1e-4) and snapshot_cols['temp'][1][pos] == flag
+    time_keys, history = a_arc.extractAreaHistory( next(iter(area_index)), ['temp'], dt.datetime(2024, 1, 1, 9, 50), dt.datetime(2024, 1, 1, 10, 10) )
+    assert time_keys == ['2024-01-01 10:00']
+
+
+# A column whose data does not match the crc32 of the header is not read
+def testSnapshotDamagedColumn( bench_paths ):
+    weather_data = json.loads(a_bch.createSyntheticMapPayload(n_areas = 50))
+    snapshot_path = a_arc.writeSnapshot( weather_data, dt.datetime(2024, 1, 1, 10, 0) )
+    with open(snapshot_path, 'rb') as snapshot_file:
+        header, data_start = a_arc.readSnapshotHeader( snapshot_file )
+        snapshot_file.seek(0)
+        raw_snapshot = snapshot_file.read()
+    # a valid zlib stream with other data in place of the temp column
+    offset, length, crc = header['columns']['temp']
+    other_blob = zlib.compress(bytes(4 * header['areas']))
+    header['columns']['temp'] = [offset, len(other_blob), crc]
+    header_bytes = json.dumps(header, separators=(',', ':')).encode("utf-8")
+    data = raw_snapshot[data_start:]
+    with open(snapshot_path, 'wb') as snapshot_file:
+        snapshot_file.write(a_arc.snapshot_magic + struct.pack('<I', len(header_bytes)) + header_bytes)
+        snapshot_file.write(data[:offset] + other_blob + data[offset + length:])
+    with pytest.raises(ValueError):
+        a_arc.readSnapshot( snapshot_path, ['temp'] )
+
+#----EOF--------------------------------------------------------
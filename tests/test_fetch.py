@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import json
+import http.client
+import datetime as dt
+import pytest
+import amedas_config as a_cfg
+import amedas_funcs as a_fnc
+import amedas_fetch as a_fch
+import amedas_bench as a_bch
+
+
+@pytest.fixture
+def stand_in_server():
+    server = a_bch.startStandInServer( a_bch.createSyntheticMapPayload(n_areas = 50) )
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+# The selective parse gives the same areas as the full parse, and fails like it on a bad response
+def testExtractAreas():
+    payload = a_bch.createSyntheticMapPayload().decode("utf-8")
+    full_data = json.loads(payload)
+    area_codes = list(full_data)[:10] + ['99999']
+    assert a_fnc.extractAreasFromResponse( payload, area_codes ) == {area_code:full_data[area_code] for area_code in area_codes if area_code in full_data}
+    nested = '{"1":{"a":{"2":[1,0]}},"2":{"x":"a\\"}"},"3" : {"v":[1, 0]}, "3":{"v":[2, 0]} }'
+    assert a_fnc.extractAreasFromResponse( nested, ['1', '2', '3'] ) == json.loads(nested)
+    assert a_fnc.extractAreasFromResponse( '{"1":{"a":{"2":[1,0]}}}', ['2'] ) == {}
+    for bad_payload in [payload[:-1], payload[:len(payload) // 2], payload + 'x', '[1]', '']:
+        with pytest.raises(ValueError):
+            a_fnc.extractAreasFromResponse( bad_payload, area_codes )
+
+
+# Requests reuse the keep-alive connections, and a stale idle connection is retried on a new one
+def testConnectionPool( stand_in_server ):
+    netloc = f"127.0.0.1:{stand_in_server.server_port}"
+    with a_fch.AmedasConnectionPool( max_inflight = 2 ) as pool:
+        for _ in range(5):
+            status, headers, body = pool.get(f"http://{netloc}/bosai/amedas/data/map/20240101000000.json")
+            assert status == 200 and json.loads(body)
+        assert pool.conn_count == 1
+        class StaleConnection( http.client.HTTPConnection ):
+            def request( self, *args, **kwargs ):
+                raise ConnectionResetError("closed by the server")
+        pool.idle_conns[('http', netloc)] = [StaleConnection(netloc), StaleConnection(netloc)]
+        status, headers, body = pool.get(f"http://{netloc}/bosai/amedas/data/map/20240101000000.json")
+        assert status == 200 and pool.conn_count == 2
+    assert stand_in_server.map_requests == 6
+
+
+# The slots of a batch are all stored, each one with a single request
+def testBatch( bench_paths ):
+    results = a_bch.benchBatch( delay = 0.01, repeat = 1 )
+    assert results['requests'] == 6
+
+
+# With the latest time check, the map is downloaded once per new slot only
+def testLatestTime( bench_paths ):
+    results = a_bch.benchLatestTime( n_runs = 6, slot_runs = 2 )
+    assert results['map_requests'] == results['new_slots'] == 3
+
+
+# Each area of a point file slot is decided on its own: its point, left out if the file does not have the slot,
+# or None (unknown) if its file failed or does not reach the slot yet
+def testPointFetch( bench_paths, stand_in_server ):
+    a_cfg.point_url_format = f"http://127.0.0.1:{stand_in_server.server_port}/bosai/amedas/data/point/{a_cfg.replace_target_areacode}/{a_cfg.point_replace_target}.json"
+    stand_in_server.point_until = dt.datetime(2024, 1, 1, 1, 0)
+    stand_in_server.point_missing_areas = {'44132'}
+    slots = [dt.datetime(2024, 1, 1, 0, 50), dt.datetime(2024, 1, 1, 1, 10)]
+    weather_batch = a_fch.fetchPointDataBatch( slots, ['40201', '44132'] )
+    assert stand_in_server.point_requests == 2
+    assert type(weather_batch[slots[0]]['40201']) is dict and 'temp' in weather_batch[slots[0]]['40201']
+    assert weather_batch[slots[0]]['44132'] is None
+    # no area has the slot yet
+    assert weather_batch[slots[1]] == {}
+    commit_info = a_fnc.addWeatherValueEntries( weather_batch[slots[0]], ['40201', '44132'], slots[0] )
+    assert commit_info['stored'] == ['40201'] and commit_info['unknown'] == ['44132'] and not commit_info['missing']
+
+#----EOF--------------------------------------------------------
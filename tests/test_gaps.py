@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import os.path
+import datetime as dt
+import amedas_gaps as a_gap
+import amedas_bench as a_bch
+import amedas_funcs as a_fnc
+
+
+# Each slot of a month has its own bit, in the layer given
+def testSlotPositions():
+    index = bytearray(a_gap.gap_index_size)
+    slots = [dt.datetime(2024, 1, 1, 0, 0), dt.datetime(2024, 1, 1, 0, 10), dt.datetime(2024, 1, 15, 13, 40), dt.datetime(2024, 1, 31, 23, 50)]
+    positions = set()
+    for slot in slots:
+        byte_pos, bit_mask = a_gap.getSlotPosition( slot )
+        positions.add((byte_pos, bit_mask))
+        index[byte_pos] |= bit_mask
+    assert len(positions) == len(slots)
+    assert a_gap.getSlotPosition( slots[-1], 'absent' )[0] == a_gap.gap_index_size - 1
+    for slot in slots:
+        assert a_gap.isSlotSet( index, slot )
+        assert not a_gap.isSlotSet( index, slot, 'absent' )
+    assert not a_gap.isSlotSet( index, dt.datetime(2024, 1, 1, 0, 20) )
+
+
+# The index built from a log has the stored slots only, and marking a slot changes just that bit
+def testGapIndexFromLog( bench_paths ):
+    month_start = dt.datetime(2024, 1, 1)
+    log_path = a_bch.writeSyntheticMonthLogs( ['40201'], month_start, n_days = 2, missing_ratio = 0.1 )[0]
+    stored_keys = set(time_key for date_vals in a_fnc.loadWeatherLog(log_path).values() for time_key in date_vals)
+    index = a_gap.loadGapIndex( '40201', month_start )
+    assert os.path.exists(a_gap.buildGapIndexPath( '40201', month_start ))
+    day_slots = [month_start + dt.timedelta(minutes = 10 * slot_idx) for slot_idx in range(2 * 144)]
+    for slot in day_slots:
+        assert a_gap.isSlotSet( index, slot ) == (slot.strftime('%Y-%m-%d %H:%M') in stored_keys)
+    missing_slots = a_gap.getMissingSlots( day_slots, ['40201'] )
+    assert missing_slots and len(missing_slots) == len(day_slots) - len(stored_keys)
+    a_gap.markGapSlots( '40201', missing_slots[:1], 'absent' )
+    assert a_gap.getMissingSlots( day_slots, ['40201'] ) == missing_slots[1:]
+    assert missing_slots[0].strftime('%Y-%m-%d %H:%M') in a_gap.getDoneTimeKeys( '40201', missing_slots[0] )
+    # a rebuild forgets the 'absent' slots
+    a_gap.rebuildGapIndexes( missing_slots[:1], ['40201'] )
+    assert a_gap.getMissingSlots( day_slots, ['40201'] ) == missing_slots
+
+#----EOF--------------------------------------------------------
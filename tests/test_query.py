@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import io
+import json
+import datetime as dt
+import numpy as np
+import pytest
+import amedas_query as a_qry
+import amedas_colstore as a_col
+import amedas_bench as a_bch
+import amedas_funcs as a_fnc
+
+
+def testParseWhere():
+    assert a_qry.parseWhere( "temp>30" ) == ('temp', '>', 30.0)
+    assert a_qry.parseWhere( " precipitation1h >= 0.5 " ) == ('precipitation1h', '>=', 0.5)
+    assert a_qry.parseWhere( "temp!=-1.5" ) == ('temp', '!=', -1.5)
+    for where_expr in ["temp>", "visibility>3", "temp=>3", "temp>3; humidity<2"]:
+        with pytest.raises(ValueError):
+            a_qry.parseWhere( where_expr )
+
+
+# The rows of a query are the points of the log in the range that pass every filter, from the log or from the columns
+@pytest.mark.parametrize("use_columns", [False, True])
+def testQueryFilters( bench_paths, use_columns ):
+    month_start = dt.datetime(2024, 1, 1)
+    log_path = a_bch.writeSyntheticMonthLogs( ['40201'], month_start, n_days = 3 )[0]
+    logdata = a_fnc.loadWeatherLog( log_path )
+    if( use_columns ): a_col.createMonthColumns( '40201', month_start )
+    from_datetime, to_datetime = a_qry.parseQueryDatetime( '2024-01-02' ), a_qry.parseQueryDatetime( '2024-01-03', end_of_day = True )
+    expected = []
+    for date_vals in logdata.values():
+        for time_key, entry_vals in sorted(date_vals.items()):
+            datapoint = entry_vals['40201']
+            time_value = dt.datetime.strptime(time_key, '%Y-%m-%d %H:%M')
+            if( not from_datetime <= time_value <= to_datetime ): continue
+            temp, humidity = datapoint['temp'][0], datapoint['humidity'][0]
+            if( temp is not None and temp > 12 and humidity is not None and humidity <= 60 ): expected.append((time_key, temp, humidity))
+    columns = a_qry.queryArrays( ['40201'], ['temp', 'humidity'], from_datetime, to_datetime, ["temp>12", "humidity<=60"] )
+    assert list(np.datetime_as_string(columns['time'], unit = 'm')) == [time_key.replace(' ', 'T') for time_key, _, _ in sorted(expected)]
+    assert np.allclose(columns['temp'], [temp for _, temp, _ in sorted(expected)])
+    assert set(columns['area']) == {'40201'}
+    # the same rows as JSON lines, in the JMA format
+    out_file = io.StringIO()
+    row_cnt = a_qry.writeQueryRows( out_file, ['40201'], ['temp', 'humidity'], from_datetime, to_datetime, ["temp>12", "humidity<=60"], out_format = 'json' )
+    rows = [json.loads(line) for line in out_file.getvalue().splitlines()]
+    assert row_cnt == len(rows) == len(expected)
+    assert all(row['humidity'][0] <= 60 for row in rows)
+
+
+# Months with no data are not read, and a range with no data gives no rows
+def testQueryEmpty( bench_paths ):
+    a_bch.writeSyntheticMonthLogs( ['40201'], dt.datetime(2024, 1, 1), n_days = 1 )
+    assert a_qry.listPartitions( ['40201'], dt.datetime(2023, 12, 1), dt.datetime(2024, 2, 10) ) == [('40201', dt.datetime(2024, 1, 1))]
+    columns = a_qry.queryArrays( ['40201'], ['temp'], dt.datetime(2024, 1, 5), dt.datetime(2024, 1, 6) )
+    assert len(columns['time']) == len(columns['temp']) == 0
+
+#----EOF--------------------------------------------------------
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import math
+import datetime as dt
+import numpy as np
+import amedas_record as a_rec
+import amedas_metrics as a_met
+import amedas_bench as a_bch
+import amedas_funcs as a_fnc
+
+
+# A point in the JMA format packs and unpacks to the same point (integers stay integers, floats keep their short form)
+def testRecordRoundTrip():
+    datapoint = {"temp":[12.3, 0], "humidity":[80, 0], "pressure":[1013.2, 1], "precipitation1h":[None, 6], "wind":[0.0, 14]}
+    record = a_rec.AmedasRecord.fromJma(datapoint)
+    assert len(record.packed) == a_rec.record_struct.size
+    assert record.toJma() == datapoint
+    assert isinstance(record.toJma()["humidity"][0], int)
+    assert a_rec.AmedasRecord(record.packed) == record
+
+
+# Variables that are not in the point are missing, variables that are not in graph_amedas_dic are left out
+def testRecordMissingVariables():
+    record = a_rec.AmedasRecord.fromJma({"temp":[1.5, 0], "visibility":[3000, 0]})
+    assert record.toJma() == {"temp":[1.5, 0]}
+    assert record.flag("humidity") == a_rec.record_flag_missing
+    assert math.isnan(record.value("humidity"))
+    assert a_rec.AmedasRecord().toJma() == {}
+
+
+# Flags that do not fit in 4 bits are stored as record_flag_max and counted
+def testRecordClampedFlags():
+    counters_before = a_met.getMetricsSummary()[1].get('clamped_flags', 0)
+    record = a_rec.AmedasRecord.fromJma({"temp":[1.5, 15], "humidity":[80, 3]})
+    assert record.toJma() == {"temp":[1.5, a_rec.record_flag_max], "humidity":[80, 3]}
+    assert a_met.getMetricsSummary()[1]['clamped_flags'] == counters_before + 1
+    assert record.qualityMask() == (1 << a_rec.record_var_idx["temp"]) | (1 << a_rec.record_var_idx["humidity"])
+
+
+# A series built from a monthly log gives back the same log, and its NumPy view has the same points
+def testRecordSeriesRoundTrip( bench_paths ):
+    month_start = dt.datetime(2024, 1, 1)
+    log_path = a_bch.writeSyntheticMonthLogs( ['40201'], month_start, n_days = 2 )[0]
+    logdata = a_fnc.loadWeatherLog( log_path )
+    series = a_rec.AmedasRecordSeries.fromLogData( logdata, '40201' )
+    assert series.toLogData('40201') == logdata
+    times, records = a_rec.recordSeriesToArrays( series )
+    assert len(times) == len(series) == sum(len(date_vals) for date_vals in logdata.values())
+    assert np.all(np.diff(times) > np.timedelta64(0, 'm'))
+    time_key = sorted(logdata['2024-01-02'])[5]
+    assert series.get(time_key).toJma() == logdata['2024-01-02'][time_key]['40201']
+    assert series.get('2024-01-05 00:00') is None
+
+#----EOF--------------------------------------------------------
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import os.path
+import datetime as dt
+import pytest
+import amedas_config as a_cfg
+import amedas_funcs as a_fnc
+import amedas_manifest as a_mnf
+import amedas_bench as a_bch
+import amedas_render as a_rnd
+
+pytest.importorskip("matplotlib")
+import amedas_plot_funcs as a_plt_fnc
+
+
+# All the plots are drawn on the same figure, that is saved and left with no artist after each plot (even a failed one)
+def testPooledFigure( bench_paths ):
+    plot_fname = os.path.join(bench_paths, "pooled.png")
+    with a_plt_fnc.renderFigure( plot_fname ) as (fig, ax):
+        ax.plot([0, 1], [0, 1])
+    assert os.path.exists(plot_fname)
+    assert not fig.axes
+    with pytest.raises(RuntimeError):
+        with a_plt_fnc.renderFigure( os.path.join(bench_paths, "failed.png") ) as (failed_fig, ax):
+            ax.plot([0, 1], [1, 0])
+            raise RuntimeError("plot failed")
+    assert failed_fig is fig and not fig.axes
+    assert not os.path.exists(os.path.join(bench_paths, "failed.png"))
+    a_plt_fnc.closePlotFigure()
+
+
+# The memory of the process stays bounded while rendering plots one after the other
+def testRenderMemoryBounded( bench_paths ):
+    results = a_bch.benchRenderMemory( n_plots = 100, warmup = 20, max_growth_mb = 30 )
+    assert results['bounded'], f"RSS grew {results['rss_growth_mb']:.1f} MiB over {results['plots']} plots"
+
+
+# The benchmarks keep the render manifest in their own directory and give back the config they changed
+def testBenchManifestRestored():
+    render_manifest, skip_unchanged = a_cfg.render_manifest, a_cfg.render_skip_unchanged
+    with a_bch.benchDirectory() as base_dir:
+        assert a_cfg.render_manifest.startswith(base_dir)
+        a_cfg.render_skip_unchanged = not skip_unchanged
+        a_mnf.recordRender( "bench.png", "fingerprint" )
+        assert a_mnf.saveRenderManifest() and os.path.exists(a_cfg.render_manifest)
+    assert a_cfg.render_manifest == render_manifest and a_cfg.render_skip_unchanged == skip_unchanged
+    assert a_mnf.render_manifest is None and "bench.png" not in a_mnf.loadRenderManifest()
+
+
+# On the process pool each monthly log with no columns is parsed once (by the main process), not once per worker
+def testRenderPoolParsesOnce( bench_paths ):
+    area_codes = ['40201', '44132']
+    a_bch.writeSyntheticMonthLogs( area_codes, dt.datetime(2024, 1, 1), n_days = 2 )
+    jobs = [('single', [area_code], val_name, ['2024-01-02']) for area_code in area_codes for val_name in ['temp', 'humidity']]
+    jobs.append( ('comp_areas', area_codes, 'temp', ['2024-01-01']) )
+    misses_before = a_fnc.getLogCacheStats()['misses']
+    results = a_rnd.runRenderJobs( jobs, max_workers = 2 )
+    assert all(result['ok'] for result in results)
+    assert a_fnc.getLogCacheStats()['misses'] - misses_before + sum(result['log_parses'] for result in results) == len(area_codes)
+
+#----EOF--------------------------------------------------------
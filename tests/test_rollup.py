@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import os
+import random
+import multiprocessing
+import datetime as dt
+import pytest
+import amedas_rollup as a_rlp
+import amedas_bench as a_bch
+import amedas_funcs as a_fnc
+
+
+# Load the saved rollups of a month: ({day: hours}, daily without the log signature)
+def loadSavedRollups( area_code, month_start ):
+    daily = a_rlp.loadRollupFile( a_rlp.buildRollupPaths(area_code, month_start)[1], () )
+    daily.pop('source', None)
+    hours = {day:a_rlp.loadRollupFile( a_rlp.buildRollupPaths(area_code, month_start.replace(day = day))[0], ('hours',) )['hours'] for day in range(1, 4)}
+    return hours, daily
+
+
+# Rollups updated point by point (in any order) are the same as the ones built from the log
+def testStoreMatchesRebuild( bench_paths ):
+    rnd = random.Random(0)
+    month_start = dt.datetime(2024, 1, 1)
+    slots = [month_start + dt.timedelta(minutes = 10 * slot) for slot in range(2 * 144)]
+    rnd.shuffle(slots)
+    for slot in slots[:100]:
+        assert a_fnc.addWeatherValueEntry( a_bch.createSyntheticAreaValues(rnd), area_code = '40201', entry_datetime = slot )
+    stored_rollups = loadSavedRollups( '40201', month_start )
+    assert sum(agg['temp'][0] for agg in stored_rollups[1]['days'].values() if 'temp' in agg) > 0
+    assert a_rlp.rebuildMonthRollups( '40201', month_start ) == 100
+    assert stored_rollups == loadSavedRollups( '40201', month_start )
+    assert a_rlp.repairMonthRollups( '40201', month_start ) is None
+
+
+# A point stored again replaces the values of its slot, it is not counted twice nor skipped
+def testCorrectedPoint( bench_paths ):
+    entry_datetime = dt.datetime(2024, 1, 1, 10, 0)
+    a_fnc.addWeatherValueEntry( {"temp":[5.0, 0]}, area_code = '40201', entry_datetime = entry_datetime - dt.timedelta(minutes = 10) )
+    a_fnc.addWeatherValueEntry( {"temp":[30.0, 0]}, area_code = '40201', entry_datetime = entry_datetime )
+    a_fnc.addWeatherValueEntry( {"temp":[10.0, 0]}, area_code = '40201', entry_datetime = entry_datetime )
+    day_values = a_rlp.queryRollups( '40201', ['temp'], entry_datetime, entry_datetime )[0][1]['temp']
+    assert day_values == {'count':2, 'min':5.0, 'max':10.0, 'mean':7.5}
+    hour_values = a_rlp.queryRollups( '40201', ['temp'], entry_datetime, entry_datetime, 'hour' )[0][1]['temp']
+    assert hour_values == {'count':1, 'min':10.0, 'max':10.0, 'mean':10.0}
+    assert not a_rlp.storeRollupPoint( '40201', entry_datetime, {"temp":[10.0, 0]} )
+
+
+# Store the points of some slots in the rollups (a process of testConcurrentStores)
+def storeSlots( slots ):
+    for slot in slots: a_rlp.storeRollupPoint( '40201', slot, {"temp":[float(slot.minute), 0]} )
+
+
+# 2 processes storing points of the same month at the same time do not lose each other's points
+@pytest.mark.skipif(a_rlp.fcntl is None or 'fork' not in multiprocessing.get_all_start_methods(), reason = "needs flock and fork")
+def testConcurrentStores( bench_paths ):
+    month_start = dt.datetime(2024, 1, 1)
+    a_rlp.rebuildMonthRollups( '40201', month_start )
+    slots = [month_start + dt.timedelta(minutes = 10 * slot) for slot in range(60)]
+    writers = [multiprocessing.get_context('fork').Process( target = storeSlots, args = (slots[first::2],) ) for first in range(2)]
+    for writer in writers: writer.start()
+    for writer in writers: writer.join()
+    assert [writer.exitcode for writer in writers] == [0, 0]
+    assert a_rlp.queryRollups( '40201', ['temp'], month_start, month_start, 'month' )[0][1]['temp']['count'] == len(slots)
+
+
+# A query never writes rollups: the saved ones are read as they are, a month with none is built from the log in memory
+def testQueryWritesNothing( bench_paths ):
+    month_start = dt.datetime(2024, 1, 1)
+    log_dir = os.path.dirname( a_bch.writeSyntheticMonthLogs( ['40201'], month_start, n_days = 2 )[0] )
+    files_before = sorted(os.listdir(log_dir))
+    last_minute = month_start + dt.timedelta(days = 2, minutes = -1)
+    from_log = a_rlp.queryRollups( '40201', ['temp', 'windDirection'], month_start, last_minute, 'hour' )
+    assert len(from_log) == 48 and sorted(os.listdir(log_dir)) == files_before
+    a_rlp.repairMonthRollups( '40201', month_start )
+    files_saved = sorted(os.listdir(log_dir))
+    assert a_rlp.queryRollups( '40201', ['temp', 'windDirection'], month_start, last_minute, 'hour' ) == from_log
+    a_fnc.addWeatherValueEntry( {"temp":[1.0, 0]}, area_code = '40201', entry_datetime = month_start + dt.timedelta(days = 2) )
+    mtimes = {fname:os.stat(os.path.join(log_dir, fname)).st_mtime_ns for fname in os.listdir(log_dir)}
+    a_rlp.queryRollups( '40201', ['temp'], month_start, month_start + dt.timedelta(days = 2), 'day' )
+    assert {fname:os.stat(os.path.join(log_dir, fname)).st_mtime_ns for fname in os.listdir(log_dir)} == mtimes
+    assert len(files_saved) > len(files_before)
+
+#----EOF--------------------------------------------------------
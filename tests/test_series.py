@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import datetime as dt
+import numpy as np
+import amedas_series as a_ser
+import amedas_colstore as a_col
+import amedas_bench as a_bch
+import amedas_funcs as a_fnc
+
+
+# A series of n_days with one point every 10min (a daily cycle plus noise) and a peak in the middle
+def createSeries( n_days = 30, seed = 0 ):
+    rnd = np.random.default_rng(seed)
+    slots = np.arange(n_days * 144)
+    times = np.datetime64('2024-01-01T00:00') + slots.astype('timedelta64[m]') * 10
+    values = 10 + 8 * np.sin(slots / 144 * 2 * np.pi) + rnd.normal(0, 1, len(slots))
+    values[len(slots) // 2] = 40.0
+    return times, values
+
+
+# Min/max decimation keeps the extremes of the series, in time order
+def testDownsampleMinMax():
+    times, values = createSeries()
+    out_times, out_values = a_ser.downsampleMinMax( times, values, 100 )
+    assert len(out_values) <= 200
+    assert out_values.max() == values.max() and out_values.min() == values.min()
+    assert np.all(np.diff(out_times) > np.timedelta64(0, 'm'))
+    assert np.all(np.isin(out_times, times))
+    # nothing to do for short series
+    assert len(a_ser.downsampleMinMax( times[:50], values[:50], 100 )[0]) == 50
+
+
+# LTTB keeps n_out points, the first and last ones included, and the peak
+def testDownsampleLTTB():
+    times, values = createSeries()
+    out_times, out_values = a_ser.downsampleLTTB( times, values, 500 )
+    assert len(out_values) == 500
+    assert out_times[0] == times[0] and out_times[-1] == times[-1]
+    assert values.max() in out_values
+    assert np.all(np.diff(out_times) > np.timedelta64(0, 'm'))
+    assert len(a_ser.downsampleLTTB( times, values, len(times) + 1 )[0]) == len(times)
+
+
+# The gaps of a series are kept as NaN breaks after downsampling (outages of days, and single slots at full resolution)
+def testDownsampleKeepsGaps():
+    times, values = createSeries()
+    values[144 * 10:144 * 13] = np.nan
+    values[5] = np.nan
+    for method in ['minmax', 'lttb', 'none']:
+        out_times, out_values = a_ser.downsampleSeries( times, values, 1000, method )
+        breaks = out_times[np.isnan(out_values)]
+        assert list(breaks) == [np.datetime64('2024-01-11T00:00')]
+        assert np.all(np.diff(out_times) > np.timedelta64(0, 'm'))
+    out_times, out_values = a_ser.downsampleSeries( times[:144], values[:144], 1000 )
+    assert list(out_times[np.isnan(out_values)]) == [np.datetime64('2024-01-01T00:50')]
+    assert len(a_ser.downsampleSeries( times[:0], values[:0], 10 )[0]) == 0
+
+
+# The series of a range of days has the stored points of those days only
+def testLoadSeries( bench_paths ):
+    month_start = dt.datetime(2024, 1, 1)
+    a_bch.writeSyntheticMonthLogs( ['40201'], month_start, n_days = 3, missing_ratio = 0.0 )
+    series = a_ser.loadSeriesTimes( ['40201'], ['temp', 'humidity'], a_ser.listDateRange('2024-01-02', '2024-01-03') )
+    times, values = series[('40201', 'temp')]
+    assert len(times) == 2 * 144
+    assert times[0] == np.datetime64('2024-01-02T00:00') and times[-1] == np.datetime64('2024-01-03T23:50')
+    assert not np.isnan(values).any()
+    xAxis, yAxis = a_ser.loadSeries( '40201', 'humidity', ['2024-01-03'] )[('40201', 'humidity')]
+    assert xAxis[0] == 0.0 and xAxis[-1] == 23 + 50 / 60
+
+
+# The columns of a month are used only if they have every slot of the log, the log is read otherwise
+def testLoadSeriesStaleColumns( bench_paths ):
+    month_start = dt.datetime(2024, 1, 1)
+    log_path = a_bch.writeSyntheticMonthLogs( ['40201'], month_start, n_days = 1 )[0]
+    logdata = a_fnc.loadWeatherLog( log_path )
+    log_times, log_values = a_ser.loadAreaSeries( '40201', ['temp'], ['2024-01-01'] )['temp']
+    a_col.createMonthColumns( '40201', month_start, logdata )
+    assert a_col.hasAllStoredSlots( '40201', month_start )
+    col_times, col_values = a_ser.loadAreaSeries( '40201', ['temp'], ['2024-01-01'] )['temp']
+    assert np.array_equal(col_times, log_times) and np.allclose(col_values, log_values)
+    # columns written before the first slot of the log was stored
+    partial = {date_key:dict(sorted(date_vals.items())[1:]) for date_key, date_vals in logdata.items()}
+    a_col.createMonthColumns( '40201', month_start, partial )
+    assert not a_col.hasAllStoredSlots( '40201', month_start )
+    stale_times, stale_values = a_ser.loadAreaSeries( '40201', ['temp'], ['2024-01-01'] )['temp']
+    assert np.array_equal(stale_times, log_times)
+
+#----EOF--------------------------------------------------------
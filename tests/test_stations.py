@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import random
+import amedas_stations as a_sta
+
+
+# Random stations over Japan, every other one without a thermometer (first element of elems)
+def createStations( n_stations = 500, seed = 0 ):
+    rnd = random.Random(seed)
+    stations = {}
+    for idx in range(n_stations):
+        area_code = str(10000 + idx)
+        stations[area_code] = {'code':area_code, 'lat':rnd.uniform(24.0, 45.5), 'lon':rnd.uniform(123.0, 146.0), 'elems':'0' if idx % 2 else '1'}
+    return stations
+
+
+# Nearest stations of the grid index, checked against the distance to every station
+def testNearest():
+    stations = createStations()
+    grid = a_sta.StationGrid( stations )
+    rnd = random.Random(1)
+    for _ in range(50):
+        lat, lon = rnd.uniform(24.0, 45.5), rnd.uniform(123.0, 146.0)
+        all_dists = sorted((a_sta.getDistanceKm(lat, lon, station['lat'], station['lon']), area_code) for area_code, station in stations.items())
+        assert grid.nearest( lat, lon, n = 5 ) == all_dists[:5]
+        temp_dists = [(dist, area_code) for dist, area_code in all_dists if a_sta.hasStationElement(stations[area_code], 'temp')]
+        assert grid.nearest( lat, lon, n = 3, val_name = 'temp' ) == temp_dists[:3]
+    # out of the area of the stations, and more stations than there are
+    assert grid.nearest( 30.0, 150.0, n = 2 ) == sorted((a_sta.getDistanceKm(30.0, 150.0, station['lat'], station['lon']), area_code) for area_code, station in stations.items())[:2]
+    assert len(grid.nearest( 35.0, 139.0, n = 1000 )) == len(stations)
+    assert a_sta.StationGrid( {} ).nearest( 35.0, 139.0 ) == []
+
+
+# Stations of a box, checked against all the stations
+def testInBox():
+    stations = createStations()
+    grid = a_sta.StationGrid( stations )
+    box = (34.0, 135.0, 37.2, 140.3)
+    expected = sorted(area_code for area_code, station in stations.items() if box[0] <= station['lat'] <= box[2] and box[1] <= station['lon'] <= box[3])
+    assert expected and grid.inBox( *box ) == expected
+
+#----EOF--------------------------------------------------------
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+import os.path
+import datetime as dt
+import amedas_config as a_cfg
+import amedas_funcs as a_fnc
+
+
+# A stored point is in the monthly log right away (through its journal)
+def testStoreEntry( bench_paths ):
+    entry_datetime = dt.datetime(2024, 1, 1, 10, 0)
+    assert a_fnc.addWeatherValueEntry( {"temp":[1.5, 0]}, area_code = '40201', entry_datetime = entry_datetime )
+    log_path = a_fnc.buildPathFromDate( target_datetime = entry_datetime, target = "l", area_code = '40201' )
+    assert a_fnc.loadWeatherLog( log_path ) == {'2024-01-01':{'2024-01-01 10:00':{'40201':{"temp":[1.5, 0]}}}}
+    commit_info = a_fnc.addWeatherValueEntries( {'40201':{"temp":[2.5, 0]}, '44132':{"temp":[3.5, 0]}}, ['40201', '44132', '14163'], entry_datetime + dt.timedelta(minutes = 10) )
+    assert commit_info['stored'] == ['40201', '44132'] and commit_info['missing'] == ['14163']
+    assert len(a_fnc.loadWeatherLog( log_path )['2024-01-01']) == 2
+
+
+# A journal that cannot be written is a failed store, not an exception
+def testStoreEntryError( bench_paths ):
+    blocker_path = os.path.join(bench_paths, 'blocker')
+    open(blocker_path, 'w').close()
+    a_cfg.amedas_log = os.path.join(blocker_path, "ACODE/YYYY/MM", a_cfg.amedas_fname)
+    entry_datetime = dt.datetime(2024, 1, 1, 10, 0)
+    assert not a_fnc.addWeatherValueEntry( {"temp":[1.5, 0]}, area_code = '40201', entry_datetime = entry_datetime )
+    commit_info = a_fnc.addWeatherValueEntries( {'40201':{"temp":[1.5, 0]}}, ['40201'], entry_datetime )
+    assert commit_info['failed'] == ['40201'] and not commit_info['stored']
+
+#----EOF--------------------------------------------------------